@@ -3,21 +3,26 @@
 # Author:	Vincent Diener - diener@teco.edu
 
 import pyglet
-import math
-import bluetooth
+import numpy
 import os
+import time
 
 from pyglet.gl import *
 from pyglet.window import *
 from pyglet.window import key as key
-from random import randint
 from threading import Thread
 from ctypes import *
 
-from modules.shader.shader import Shader
-from modules.shader_loader.shader_loader import ShaderLoader
-from modules.gl_helper.gl_helper import GLHelper
 from modules.bt_helper.bt_helper import BTHelper
+from modules.export.export import Exporter, ledImage
+from modules.frame_timer.frame_timer import FrameTimer
+from modules.offscreen.offscreen import PixelReader
+from modules.profiler.profiler import Profiler, ProfilerHud
+from modules.quality_governor.quality_governor import QualityGovernor, QUALITY_STEPS
+from modules.render_loop.render_loop import OnDemandEventLoop
+from modules.scene.scene import Scene, ANIMATION_RATE
+from modules.scheduler.scheduler import Scheduler
+from modules.transport.transport import createTransport
 
 # ----------------------------------------------- #
 # Constants                                       #
@@ -32,9 +37,48 @@ OPENGL_SIZE_Y = 900
 WIN_LOC_X = 50
 WIN_LOC_Y = 50
 
-# Frames per second. If you experience lag, lower this value.
+# Frames per second at most. If you experience lag, lower this value.
+# Animations and camera movement run at the same speed with any value,
+# only fewer frames are drawn. None draws as often as VSYNC allows.
 OPENGL_FPS = 60
 
+# Wait for the display refresh when showing a frame (no tearing).
+VSYNC = True
+
+# Animations, camera movement and key input are advanced in fixed steps,
+# this many per second, on the wall clock.
+SIMULATION_RATE = 60
+
+# Anti-aliasing: samples per pixel (e.g. 4), 0 disables it. With post
+# processing, the scene is rendered into a framebuffer with as many samples.
+MULTISAMPLING = 0
+
+# Draw with an OpenGL 3.3 core profile context: vertex array objects, the
+# shaders in shaders/core and matrices computed in NumPy, no fixed function
+# pipeline. Faster on many drivers. The profiler HUD (PROFILING) needs the
+# default compatibility profile and is not shown.
+CORE_PROFILE = False
+
+# Hold QUALITY_TARGET_FPS on slow machines: frame times (CPU and GPU) are
+# measured, and while frames take too long, post processing, the detailed
+# floor, anti-aliasing and lighting are turned off, in this order. They are
+# turned back on (in reverse order) when frames are fast enough again.
+# Changes are written to the log.
+ADAPTIVE_QUALITY = False
+QUALITY_TARGET_FPS = 60
+
+# Measure how long every render pass, LED update and received frame takes,
+# on the CPU and (render passes and LED updates) on the GPU. H shows the
+# averages over the picture. On exit, everything measured is written to
+# PROFILE_TRACE_PATH as Chrome trace (open it in chrome://tracing or ui.perfetto.dev).
+PROFILING = False
+PROFILE_TRACE_PATH = "logs/trace.json"
+
+# Only redraw when something changed: a new LED frame, key input, a resize
+# or a running animation (fade in, instruction fade, floor ring, post processing).
+# Otherwise the emulator idles. Set to False to always redraw at OPENGL_FPS.
+ON_DEMAND_RENDERING = True
+
 # FPS for the LED matrix.
 # The actual hardware in the real Connection Machine supports about 10 FPS, 
 # so make sure your app still looks good with that.
@@ -44,22 +88,94 @@ BLUETOOTH_FPS = 30
 BG_COLOR = (201, 198, 198)
 
 # Use post processing shader.
-# Since this naive implementation reads the color buffer on every frame,
-# it may cause heavy lag. Try to lower OPENGL_FPS in that case.
-# The current shader ("shaders/post_processing.fs") just takes the
-# color buffer of the final rendered image and inverts the colors.
+# The scene is rendered into an offscreen framebuffer, which the shader
+# ("shaders/post_processing.fs") then draws to the window in one extra pass.
+# The current shader distorts the rendered image with a wave effect.
 # Feel free to add some cool effects.
 USE_POST_PROCESSING = False
 
+# Pace incoming frames through a jitter buffer.
+# Frames are timestamped on arrival and shown JITTER_DELAY seconds later at the
+# measured cadence of the device, which hides bursty delivery at the cost of latency.
+# JITTER_POLICY "coalesce" shows the newest due frame and drops older ones,
+# "queue" shows every frame in order. Late, dropped and duplicated frames
+# are counted per device and written to the log.
+USE_JITTER_BUFFER = False
+JITTER_DELAY = 0.1
+JITTER_CAPACITY = 16
+JITTER_POLICY = "coalesce"
+
+# Transport the emulator listens on: "rfcomm" (Bluetooth, the original),
+# "tcp", "udp" or "unix". All speak the same handshake and frame protocol.
+# The network transports do not need any Bluetooth hardware.
+# "replay" replays the recording at TRANSPORT_PATH instead.
+TRANSPORT = "rfcomm"
+
+# Host and port for "tcp" and "udp". None uses the default port of the transport.
+TRANSPORT_HOST = "0.0.0.0"
+TRANSPORT_PORT = None
+
+# Socket path for "unix", recording for "replay".
+TRANSPORT_PATH = "/tmp/cm-emulator.sock"
+
+# Replay speed for "replay". 1.0 is the original timing, 0 as fast as possible.
+REPLAY_SPEED = 1.0
+
+# Session events are logged as JSON lines to logs/events.jsonl by a background thread.
+# Set to a value between 0.0 and 1.0 to also log that fraction of all received frames.
+TRACE_FRAME_RATE = 0.0
+
+# Record every session (handshake and timestamped frames) to RECORD_DIRECTORY.
+RECORD_SESSIONS = False
+RECORD_DIRECTORY = "recordings"
+
+# Linked shader programs are cached here, so later starts skip compiling them.
+# Only used if the graphics driver supports program binaries. None disables the cache.
+SHADER_CACHE_DIRECTORY = "shaders/cache"
+
+# Decoded textures are cached here, so later starts do not decode the images again.
+# None disables the cache.
+TEXTURE_CACHE_DIRECTORY = "textures/cache"
+
+# Export the LEDs ("leds") or everything drawn in the window ("window") to
+# EXPORT_PATH while the emulator runs. The file extension sets the format:
+# ".apng" (lossless), ".gif" or ".rgb" (raw video, described in EXPORT_PATH + ".json").
+# Frames are encoded by a separate process. Frames it can not keep up with are
+# dropped, the numbers are printed and logged on exit. LEDs are scaled to
+# EXPORT_SCALE pixels. None disables the export.
+EXPORT_PATH = None
+EXPORT_SOURCE = "leds"
+EXPORT_SCALE = 8
+
 #-------------------------------------------------#
 # Window and helper setup                         #
 #-------------------------------------------------#
 
-# Create window. Uncomment config for 4x Anti-Aliasing.
-# config = pyglet.gl.Config(sample_buffers=1, samples=4)
-# window = pyglet.window.Window(OPENGL_SIZE_X, OPENGL_SIZE_Y, resizable=True, visible=True, caption="Connection Machine Emulator", config=config)
+# Start the encoder process first, before the window and any threads exist.
+exporter = None
+if (EXPORT_PATH is not None):
+    if (EXPORT_SOURCE == "window"):
+        exporter = Exporter(EXPORT_PATH, OPENGL_FPS)
+    else:
+        exporter = Exporter(EXPORT_PATH, BLUETOOTH_FPS, EXPORT_SCALE)
+
+# Reads the window back for the export, see updateWindowReader().
+window_reader = None
 
-window = pyglet.window.Window(OPENGL_SIZE_X, OPENGL_SIZE_Y, resizable=True, visible=True, caption="Connection Machine Emulator")
+# Create window, with MULTISAMPLING samples for anti-aliasing.
+config = None
+if (MULTISAMPLING > 0 or CORE_PROFILE):
+    config = pyglet.gl.Config(double_buffer=True, depth_size=24)
+    if (MULTISAMPLING > 0):
+        config.sample_buffers = 1
+        config.samples = MULTISAMPLING
+    if (CORE_PROFILE):
+        config.major_version = 3
+        config.minor_version = 3
+        config.forward_compatible = True
+
+window = pyglet.window.Window(OPENGL_SIZE_X, OPENGL_SIZE_Y, resizable=True, visible=True, caption="Connection Machine Emulator",
+                              vsync=VSYNC, config=config)
 
 
 # Set window position.
@@ -68,13 +184,41 @@ window.set_location(WIN_LOC_X, WIN_LOC_Y)
 # Set minimum size.
 window.set_minimum_size(50, 50)
 
-# Create GL helper.
-gl = GLHelper(OPENGL_SIZE_X, OPENGL_SIZE_Y)
+# Create the scene: textures, shaders, geometry and everything else that is drawn.
+# See modules/scene/scene.py. Errors in a shader stop the emulator with the driver log.
+scene = Scene(OPENGL_SIZE_X, OPENGL_SIZE_Y, SHADER_CACHE_DIRECTORY, TEXTURE_CACHE_DIRECTORY, BG_COLOR,
+              core=CORE_PROFILE, samples=MULTISAMPLING)
+scene.post_processing = USE_POST_PROCESSING
+
+# Measure frames and turn features off if they take too long.
+# Anti-aliasing is only turned off if there is any.
+frame_timer = None
+governor = None
+if (ADAPTIVE_QUALITY):
+    frame_timer = FrameTimer()
+    steps = [name for name in QUALITY_STEPS if name != "multisample" or MULTISAMPLING > 0]
+    governor = QualityGovernor(scene, QUALITY_TARGET_FPS, steps)
 
 # Create BT helper to take care of the Bluetooth connection.
-# This is also used to store the matrix of red-values and do logging.
-# Red values are stored as array of size 576 (24x24 red values), ranging from 0.0 to 1.0.
-bt = BTHelper([0.0 for x in range(576)], BLUETOOTH_FPS, window)
+# This is also used to store the matrix of LED values and do logging.
+# Without devices, red values are stored as NumPy array of size 576 (24x24 red values), ranging from 0 to 255.
+# Devices may ask for other sizes, grayscale or RGB (see modules/frame_format/frame_format.py).
+bt = BTHelper(numpy.zeros(576, dtype=numpy.uint8), BLUETOOTH_FPS, window)
+
+if (USE_JITTER_BUFFER):
+    bt.useJitterBuffer(JITTER_DELAY, JITTER_CAPACITY, JITTER_POLICY)
+
+if (RECORD_SESSIONS):
+    bt.recordSessions(RECORD_DIRECTORY)
+
+bt.events.traceFrames(TRACE_FRAME_RATE)
+
+# Measure render passes, LED updates and received frames.
+profiler = None
+if (PROFILING):
+    profiler = Profiler()
+    scene.useProfiler(profiler, None if CORE_PROFILE else ProfilerHud(profiler))
+    bt.profiler = profiler
 
 #-------------------------------------------------#
 # Draw loop and user input                        #
@@ -82,32 +226,40 @@ bt = BTHelper([0.0 for x in range(576)], BLUETOOTH_FPS, window)
 
 # ESCAPE keypress needs seperate treatment:
 # For some reason the event doesn't register in draw loop.
-# Also check for I, 1 and 2 key press because we don't want to poll those.
+# Also check for I, 1, 2, P, TAB, T and H key press because we don't want to poll those.
 @window.event
 def on_key_press(symbol, modifiers):
-    global show_instructions
-    global instruction_timer
-    global lighting
-    global floor
-    global USE_POST_PROCESSING
+    # Any key may change the picture.
+    window.invalid = True
 
     # Quit on ESC press.
     if symbol == pyglet.window.key.ESCAPE:
-        os._exit(0)
+        shutdown()
 
     # I, 1 and 2 keypresses toggle the respective booleans.
     if symbol == pyglet.window.key.I:
-        show_instructions = not show_instructions
+        scene.show_instructions = not scene.show_instructions
 
     if symbol == pyglet.window.key._1:
-        lighting = not lighting
+        scene.lighting = not scene.lighting
 
     if symbol == pyglet.window.key._2:
-        floor = not floor
+        scene.floor = not scene.floor
 
     # Toggle PP.
     if symbol == pyglet.window.key.P:
-        USE_POST_PROCESSING = not USE_POST_PROCESSING
+        scene.post_processing = not scene.post_processing
+
+    # TAB shows the next connected device, T tiles all connected devices.
+    if symbol == pyglet.window.key.TAB:
+        bt.selectNext()
+
+    if symbol == pyglet.window.key.T:
+        bt.toggleTile()
+
+    # H shows the profiler averages.
+    if symbol == pyglet.window.key.H:
+        scene.show_hud = not scene.show_hud
 
     pass
 
@@ -115,46 +267,90 @@ def on_key_press(symbol, modifiers):
 # Exit if the window is closed.
 @window.event
 def on_close():
+    shutdown()
+
+
+# Finish the export and the log, then exit.
+def shutdown():
+    if (exporter is not None):
+        if (window_reader is not None):
+            for frame in window_reader.flush():
+                exportFrame(frame)
+
+        stats = exporter.close()
+        bt.events.emit("export", **stats)
+        print("Export: " + str(stats["written"]) + " frames written to " + stats["path"] + ", " +
+              str(stats["dropped"]) + " dropped (encoder busy), " + str(stats["mismatched"]) +
+              " dropped (size changed)")
+
+    if (profiler is not None):
+        events = profiler.save(PROFILE_TRACE_PATH)
+        print("Profile: " + str(events) + " sections written to " + PROFILE_TRACE_PATH)
+
+    bt.events.close()
     os._exit(0)
 
 
-# Poll keys (W, A, S, D)
-# This gets called from the draw loop.
-def handleUserInput():
+# Create the pixel buffers the window is read back with for the export,
+# again when the size of the window changed.
+def updateWindowReader():
+    global window_reader
+
+    if (exporter is None or EXPORT_SOURCE != "window"):
+        return
+
+    # A minimized window has a size of 0x0, nothing can be read back.
+    size = tuple(max(n, 1) for n in window.get_size())
+    if (window_reader is not None):
+        if ((window_reader.width, window_reader.height) == size):
+            return
+        for frame in window_reader.flush():
+            exportFrame(frame)
+        window_reader.delete()
+
+    window_reader = PixelReader(*size)
+
+
+# Hand a frame read back from the window to the exporter.
+def exportFrame(frame):
+    if (frame is not None):
+        frame_time, pixels = frame
+        exporter.submit(pixels, frame_time)
+
+
+# Poll keys (W, A, S, D) and move the camera by dt seconds.
+# This gets called every simulation tick.
+def handleUserInput(dt):
     global keys
     global yPos
     global zPos
 
-    # Move the camera.
-    glMatrixMode(GL_PROJECTION)
+    # The steps below were made for ANIMATION_RATE ticks per second.
+    steps = dt * ANIMATION_RATE
+
+    # Move the camera, see modules/camera/camera.py.
+    camera = scene.camera
 
     # Camers is at distance 20 from center.
     toCenter = zPos - 20
 
     # Move to center, rotate, move back out.
     if keys[key.D]:
-        glTranslatef(0.0, 0.0, toCenter)
-        glRotatef(4, 0, -1, 0)
-        glTranslatef(0.0, 0.0, -toCenter)
+        camera.orbit(-4 * steps, toCenter)
 
     if keys[key.A]:
-        glTranslatef(0.0, 0.0, toCenter)
-        glRotatef(4, 0, 1, 0)
-        glTranslatef(0.0, 0.0, -toCenter)
+        camera.orbit(4 * steps, toCenter)
 
     # Move up and down.
     if keys[key.W]:
         if (yPos < 40):
-            glTranslatef(0.0, -0.2, 0.0)
-            yPos += 1
+            camera.move(-0.2 * steps)
+            yPos += steps
 
     if keys[key.S]:
         if (yPos > 0):
-            glTranslatef(0.0, 0.2, 0.0)
-            yPos -= 1
-
-    # Done with camera movement.
-    glMatrixMode(GL_MODELVIEW)
+            camera.move(0.2 * steps)
+            yPos -= steps
 
     # If space is pressed, reset the view.
     if keys[key.SPACE]:
@@ -167,199 +363,90 @@ def handleUserInput():
 def on_resize(w, h):
     global yPos
     global zPos
-    global gl
 
     # Get actual size of the GL viewport.
-    (gl.gl_x, gl.gl_y) = window.get_size()
+    # Sets up viewport, lighting and perspective, and resets the camera.
+    scene.resize(*window.get_size())
+    updateWindowReader()
 
-    # Set lighting parameters.
-    glEnable(GL_LIGHTING)
-    glEnable(GL_LIGHT0)
-    glLightfv(GL_LIGHT0, GL_POSITION, gl.vec(-12, -0, -4, 0))
-    glLightfv(GL_LIGHT0, GL_DIFFUSE, gl.vec(5.0, 0.8, 0.8))
-    glLightfv(GL_LIGHT0, GL_AMBIENT, gl.vec(0.23, 0.23, 0.23))
+    # Redraw with the new size.
+    window.invalid = True
 
     # Set perspective/position parameters.
     yPos = 8
     zPos = 6
-    zNear = 0.01
-    zFar = 1000.0
-    fieldOfView = 45.0
-    size = zNear * math.tan(math.radians(fieldOfView) / 2.0)
 
-    # Create viewport.
-    glViewport(0, 0, gl.gl_x, gl.gl_y)
+    return pyglet.event.EVENT_HANDLED
 
-    # Set up perspective (projection matrix).
-    glMatrixMode(GL_PROJECTION)
-    glLoadIdentity()
 
-    # Prevent division by zero.
-    w_divided_h = gl.gl_x / float(gl.gl_y)
-    glFrustum(-size, size, -size / w_divided_h, size / w_divided_h, zNear, zFar)
+# Advance animations and camera by one simulation tick (dt seconds).
+def tick(dt):
+    # Progress time.
+    scene.advance(dt)
 
-    # Put model in correct position.
-    glMatrixMode(GL_MODELVIEW)
-    glLoadIdentity()
-    glTranslatef(0.0, 0.2, -14.0)
+    # Check if any keys are pressed.
+    handleUserInput(dt)
 
-    return pyglet.event.EVENT_HANDLED
+    # Every tick changes the picture.
+    window.invalid = True
 
 
-# Gets called for every frame.
+# Gets called for every frame. Only draws, everything that moves
+# is advanced by tick().
 @window.event
 def on_draw():
-    global bt
-    global gl
-    global window
-    global time
-    global lighting
-    global floor
-    global instruction_timer
-    global show_instructions
+    if (frame_timer is not None):
+        frame_timer.begin()
 
-    # Progress time.
-    time += 1
+    if (profiler is not None):
+        profiler.frame()
+        section = profiler.begin("frame", "frame", gpu=True)
+
+    # Draw the scene, overlays and post processing, see modules/scene/scene.py.
+    scene.draw()
+
+    # Read the frame back for the export, without waiting for it.
+    if (window_reader is not None):
+        exportFrame(window_reader.read(0, time.perf_counter()))
+
+    if (profiler is not None):
+        profiler.end(section)
 
-    # This creates the fade effect for the instructions.
-    if (show_instructions and instruction_timer > 0):
-        instruction_timer -= 3
+    if (frame_timer is not None):
+        frame_timer.end()
+        adaptQuality()
 
-    if (not show_instructions and instruction_timer < 50):
-        instruction_timer += 3
+    # The next tick or LED frame asks for the next frame.
+    window.invalid = not ON_DEMAND_RENDERING
 
-    # Clear buffer.
+
+# Pass the measured frames to the governor and log what it changes.
+def adaptQuality():
+    for cpu, gpu in frame_timer.results():
+        governor.addFrame(cpu, gpu)
+
+    change = governor.update()
+    if (change is not None):
+        feature, on = change
+        bt.events.emit("quality", feature=feature, on=on, frame_time=governor.frame_time,
+                       budget=governor.budget)
+        window.invalid = True
+
+
+# Redraw if the window was covered and is visible again.
+@window.event
+def on_expose():
     window.invalid = True
-    glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
 
-    # Check if any keys are pressed.
-    handleUserInput()
-
-    # Draw detailed floor?
-    if (floor):
-        # If so, draw flashing red ring effect at the bottom.
-        # Time is passed in to create the effect.
-        shader_ground.shader.bind()
-        shader_ground.shader.uniformi(b'time', time)
-        glBindTexture(texture_effect_red.target, texture_effect_red.id)
-        batch_effect_red.draw()
-        shader_ground.shader.unbind()
-
-    # Draw Connection Machine and floor with or without lighting.
-    # Time is 0, so drawing is fully opaque.
-    shader_body.shader.bind()
-    shader_body.shader.uniformi(b'do_light', lighting)
-    shader_body.shader.uniformi(b'time', 0)
-
-    # Connection Machine center cube and stand.
-    glBindTexture(texture_metal_0.target, texture_metal_0.id)
-    batch_metal_0.draw()
-
-    # Connection Machine, 8 main cubes.
-    glBindTexture(texture_metal_1.target, texture_metal_1.id)
-    batch_metal_1.draw()
-
-    # Draw detailed floor?
-    if (floor):
-        # If so, draw detailed texture (multiple times).
-        glBindTexture(texture_detailed_ground.target, texture_detailed_ground.id)
-        batch_detailed_ground.draw()
-    else:
-        # If not, draw simple texture once.
-        glBindTexture(texture_simple_ground.target, texture_simple_ground.id)
-        batch_simple_ground.draw()
-
-    shader_body.shader.unbind()
-
-    # Draw front LEDs.
-    shader_leds.shader.bind()
-
-    # For each frame, pass in the red values for the 576 LEDs.
-    loc = glGetUniformLocation(shader_leds.shader.handle, b"pixel")
-    glUniform1fv(loc, 576, (c_float * 576)(*bt.matrix))
-    glBindTexture(texture_led.target, texture_led.id)
-
-    batch_led.draw()
-    shader_leds.shader.unbind()
-
-    # Draw the overlays (logo, instructions, fade in).
-    shader_body.shader.bind()
-
-    # Disable lighting for these draw calls.
-    shader_body.shader.uniformi(b'do_light', False)
-
-    # Set up correct perspective (orthogonal projection).
-    glMatrixMode(GL_MODELVIEW)
-    glPushMatrix()
-    glLoadIdentity()
-    glMatrixMode(GL_PROJECTION)
-    glPushMatrix()
-    glLoadIdentity()
-    glOrtho(0, OPENGL_SIZE_X, 0, OPENGL_SIZE_Y, -1, 1)
-
-    # Draw instructions.
-    # Time is set to the instruction_timer to create the fade effect.
-    shader_body.shader.uniformi(b'time', instruction_timer)
-    glBindTexture(texture_instructions.target, texture_instructions.id)
-    batch_instructions.draw()
-
-    # Draw logo. Time is 0, so it is drawn fully opaque.
-    shader_body.shader.uniformi(b'time', 0)
-    glBindTexture(texture_logo.target, texture_logo.id)
-    batch_logo.draw()
-
-    # Draw fade-in-from-black overlay.
-    # Normal time is passed in, so it becomes transparent in 50 frames.
-    shader_body.shader.uniformi(b'time', time)
-    glBindTexture(texture_fade.target, texture_fade.id)
-    batch_fade.draw()
-
-    shader_body.shader.unbind()
-
-    # Post processing shader
-    if (USE_POST_PROCESSING):
-        global texture_pp
-        global color_buffer
-
-        shader_pp.shader.bind()
-
-        # Create texture in the size of the OpenGL viewport.
-        # The size might be rounded up to the nearest power of two. This means that if we blit the
-        # color buffer into the texture in the next step, it might have a "frame".
-        texture_pp = pyglet.image.Texture.create_for_size(GL_TEXTURE_2D, gl.gl_x, gl.gl_y, GL_RGBA)
-        color_buffer = pyglet.image.get_buffer_manager().get_color_buffer()
-
-        # To get rid of that frame in the shader, we calculate the ratio between the actual buffer
-        # and our texture. By passing this ratio to the shader, it can sample the texture at the
-        # correct coordinates.
-        pixel_ratio_x = color_buffer.width / float(texture_pp.width)
-        pixel_ratio_y = color_buffer.height / float(texture_pp.height)
-
-        # Write color buffer to texture.
-        texture_pp.blit_into(color_buffer, 0, 0, 0)
-
-        glBindTexture(texture_pp.target, texture_pp.id)
-
-        # Pass uniforms to post processing shader.
-        shader_pp.shader.uniformf(b'ratio_x', pixel_ratio_x)
-        shader_pp.shader.uniformf(b'ratio_y', pixel_ratio_y)
-        shader_pp.shader.uniformi(b'tex_width', gl.gl_x)
-        shader_pp.shader.uniformi(b'tex_height', gl.gl_y)
-        shader_pp.shader.uniformi(b'time', time)
-
-        # Draw and unbind.
-        batch_fullscreen.draw()
-        shader_pp.shader.unbind()
-
-    # Load old perspective.
-    glPopMatrix()
-    glMatrixMode(GL_MODELVIEW)
-    glPopMatrix()
-
-
-# Triggers the draw loop.
-def schedule_update(t):
-    pass
+
+# Returns True while the picture changes from frame to frame.
+def isAnimating():
+    # Fade in, instructions, floor ring, post processing.
+    if (scene.isAnimating()):
+        return True
+
+    # Camera moves while a key is held down.
+    return keys[key.W] or keys[key.A] or keys[key.S] or keys[key.D] or keys[key.SPACE]
 
 
 # Randomize matrix of red values.
@@ -368,16 +455,32 @@ def schedule_randomize(t):
     global bt
 
     if (bt.running == False):
-        for x in range(0, 576):
-            rnd = randint(0, 1)
-            bt.matrix[x] = rnd
+        bt.showPattern(numpy.random.randint(0, 2, 576) * 255)
 
 
-# LEDs are updated at 15 FPS.
-def schedule_leds(t, d):
-    global batch_led
+# LEDs are updated at BLUETOOTH_FPS.
+def schedule_leds(t):
     global bt
-    gl.drawAllLeds(batch_led, bt.matrix, d)
+
+    global leds_seq
+
+    if (profiler is not None):
+        section = profiler.begin("schedule_leds", "leds")
+
+    # Show the selected device, or all devices tiled.
+    bt.updateDisplay()
+
+    # Only update the LEDs (and redraw) if the matrix changed since the last update.
+    if (bt.display_seq != leds_seq):
+        scene.setLeds(bt.matrix, bt.format)
+        leds_seq = bt.display_seq
+        window.invalid = True
+
+        if (exporter is not None and EXPORT_SOURCE == "leds"):
+            exporter.submit(ledImage(bt.matrix, bt.format), time.perf_counter())
+
+    if (profiler is not None):
+        profiler.end(section)
 
 #-------------------------------------------------#
 # Application and OpenGL setup                    #
@@ -387,20 +490,11 @@ def schedule_leds(t, d):
 keys = key.KeyStateHandler()
 window.push_handlers(keys)
 
-# Time (passed frames)
-time = 0
-
-# Show instructions or hide them?
-show_instructions = True
-
-# Enable lighting?
-lighting = True
-
-# Render detailed floor?
-floor = False
+# Display sequence number of the matrix the LEDs show.
+leds_seq = -1
 
-# Timer for instruction fade.
-instruction_timer = 0
+# Read the window back for the export.
+updateWindowReader()
 
 # Height of camera.
 # Locked within a certain interval.
@@ -410,125 +504,27 @@ yPos = 0
 # Locked within a certain interval.
 zPos = 0
 
-# Load textures. Enable transparency for some.
-texture_led = gl.prepareTex("textures/led.png", True)
-texture_metal_0 = gl.prepareTex("textures/metal_0.jpg", False)
-texture_metal_1 = gl.prepareTex("textures/metal_1.jpeg", False)
-texture_simple_ground = gl.prepareTex("textures/ground_0.png", True)
-texture_detailed_ground = gl.prepareTex("textures/ground_1.png", True)
-texture_effect_red = gl.prepareTex("textures/effect_red.png", True)
-texture_fade = gl.prepareTex("textures/fade.png", True)
-texture_logo = gl.prepareTex("textures/logo.png", True)
-texture_instructions = gl.prepareTex("textures/instructions.png", True)
-
-# Create texture for post processing shader.
-texture_pp = pyglet.image.Texture.create_for_size(GL_TEXTURE_2D, OPENGL_SIZE_X, OPENGL_SIZE_Y, GL_RGBA)
-color_buffer = pyglet.image.get_buffer_manager().get_color_buffer()
-
-# Create draw batches.
-batch_led = pyglet.graphics.Batch()
-batch_metal_0 = pyglet.graphics.Batch()
-batch_metal_1 = pyglet.graphics.Batch()
-batch_simple_ground = pyglet.graphics.Batch()
-batch_detailed_ground = pyglet.graphics.Batch()
-batch_effect_red = pyglet.graphics.Batch()
-batch_fade = pyglet.graphics.Batch()
-batch_logo = pyglet.graphics.Batch()
-batch_instructions = pyglet.graphics.Batch()
-batch_fullscreen = pyglet.graphics.Batch()
-
-# Create shaders.
-shader_body = ShaderLoader('shaders/cm_body.vs', 'shaders/cm_body.fs')
-shader_leds = ShaderLoader('shaders/led.vs', 'shaders/led.fs')
-shader_ground = ShaderLoader('shaders/ground.vs', 'shaders/ground.fs')
-shader_pp = ShaderLoader('shaders/post_processing.vs', 'shaders/post_processing.fs')
-
-# Set texture units for shaders.
-shader_body.shader.bind()
-shader_body.shader.uniformi(b'tex0', 0)
-shader_body.shader.unbind()
-
-shader_leds.shader.bind()
-shader_leds.shader.uniformi(b'tex0', 0)
-shader_leds.shader.unbind()
-
-shader_ground.shader.bind()
-shader_ground.shader.uniformi(b'tex0', 0)
-shader_ground.shader.unbind()
-
-shader_pp.shader.bind()
-shader_pp.shader.uniformi(b'tex0', 0)
-shader_pp.shader.unbind()
-
-
-# Set buffer clear color.
-glClearColor(BG_COLOR[0] / 255.0, BG_COLOR[1] / 255.0, BG_COLOR[2] / 255.0, 1.0)
-
-# Enable alpha blending.
-glEnable(GL_BLEND)
-glBlendEquation(GL_FUNC_ADD)
-glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
-
-# Enable depth testing.
-glEnable(GL_DEPTH_TEST)
-
-# This d parameter determines the size of the Connection Machine.
-# It is only evaluated once when creating the geometry.
-d = 1.5
-
-# Draw center cube
-gl.drawAllFaces(batch_metal_0, gl.getDeformedCube(3.33 * d, 3.33 * d, 3.33 * d), 0, 0, 0)
-
-# Draw stand
-gl.drawAllFaces(batch_metal_0, gl.getDeformedCube(2.833 * d, 0.5 * d, 2.833 * d), 0, -1.9 * d, 0)
-
-# Facing front (4)
-normalCube = gl.getDeformedCube(1.666 * d, 1.666 * d, 1.666 * d)
-gl.drawAllFaces(batch_metal_1, normalCube, d, d, d)
-gl.drawAllFaces(batch_metal_1, normalCube, -d, d, d)
-gl.drawAllFaces(batch_metal_1, normalCube, d, -d, d)
-gl.drawAllFaces(batch_metal_1, normalCube, -d, -d, d)
-
-# Facing back (4)
-gl.drawAllFaces(batch_metal_1, normalCube, d, d, -d)
-gl.drawAllFaces(batch_metal_1, normalCube, -d, d, -d)
-gl.drawAllFaces(batch_metal_1, normalCube, d, -d, -d)
-gl.drawAllFaces(batch_metal_1, normalCube, -d, -d, -d)
-
-# Draw ground with shadow.
-for x in range(0, 12):
-    gl.drawGround(batch_detailed_ground, 0, -2.2 * d + x * 0.004, 0, d)
-
-gl.drawGround(batch_effect_red, 0, -2.2 * d - 0.004, 0, d)
-
-# Simple ground
-gl.drawGround(batch_simple_ground, 0, -2.2 * d + 11.0 * 0.004, 0, d)
-
-# Draw flat overlays					
-gl.drawOverlay(batch_fullscreen, 0, 0, 0, OPENGL_SIZE_X, OPENGL_SIZE_Y)
-gl.drawOverlay(batch_fade, 0, 0, -0.001, OPENGL_SIZE_X, OPENGL_SIZE_Y)
-gl.drawOverlay(batch_logo, 10, 5, -0.002, OPENGL_SIZE_X / 4.5, OPENGL_SIZE_Y / 13.5)
-gl.drawOverlay(batch_instructions, 0, 0, -0.003, OPENGL_SIZE_X, OPENGL_SIZE_Y)
-
-# Draw at 40 FPS, update random pattern at 1 Hz.
-pyglet.clock.schedule_interval(schedule_update, 1.0 / OPENGL_FPS)
-pyglet.clock.schedule_interval(schedule_leds, 1.0 / BLUETOOTH_FPS, d)
-pyglet.clock.schedule_interval(schedule_randomize, 1 / 1.0)
+# Everything runs on the wall clock, see modules/scheduler/scheduler.py:
+# ticks at SIMULATION_RATE while something moves, new LED frames are checked
+# for at BLUETOOTH_FPS, the random pattern is updated at 1 Hz.
+scheduler = Scheduler(SIMULATION_RATE, isAnimating)
+scheduler.onTick(tick)
+scheduler.every(1.0 / BLUETOOTH_FPS, schedule_leds)
+scheduler.every(1 / 1.0, schedule_randomize)
+
+# Redraw at most at OPENGL_FPS and only when needed, see OnDemandEventLoop.
+pyglet.app.event_loop = OnDemandEventLoop(OPENGL_FPS, scheduler)
 
 # Randomize once so a random pattern is shown from the start.
 schedule_randomize(0)
 
-# Start bluetooth reader thread.
-thread_bluetooth = Thread(target=bt.btreader, args=(10, ))
-thread_bluetooth.start()
-
-# Uncomment to start TCP reader thread.
-# Not currently included/supported.
-# thread_tcp_net = Thread(target = tcpreader, args = (10, ))
-# thread_tcp_net.start()
+# Start reader thread for the configured transport.
+transport = createTransport(TRANSPORT, bt, TRANSPORT_HOST, TRANSPORT_PORT, TRANSPORT_PATH, REPLAY_SPEED)
+thread_reader = Thread(target=bt.serve, args=(transport, ), name="reader")
+thread_reader.start()
 
 # Run application and exit if a keyboard interrupt is raised.
 try:
     pyglet.app.run()
 except KeyboardInterrupt:
-    os._exit(0)
+    shutdown()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# Version:	1.0
+# Author:	Vincent Diener - diener@teco.edu
+
+# Headless protocol server: runs the transports, the matrix store, the
+# recorder and metrics without a window or OpenGL (no pyglet needed).
+# New matrix content goes to frame sinks instead of the renderer.
+# Example: python3 cm_headless.py --transport tcp --port 5016 --sink stdout
+
+import argparse
+import sys
+import time as t
+import numpy
+
+from threading import Thread
+
+from modules.bt_helper.bt_helper import BTHelper
+from modules.event_log.event_log import EventLog
+from modules.jitter_buffer.jitter_buffer import JitterBuffer
+from modules.sinks.sinks import createSink
+from modules.transport.transport import createTransport
+
+
+# Devices get the max. FPS as one byte in the handshake response.
+def maxFps(value):
+    fps = int(value)
+    if (fps < 1 or fps > 255):
+        raise argparse.ArgumentTypeError("must be between 1 and 255")
+    return fps
+
+
+# Parse the command line.
+def parseArguments():
+    parser = argparse.ArgumentParser(description="Headless Connection Machine protocol server.")
+    parser.add_argument("--transport", default="tcp", choices=["rfcomm", "tcp", "udp", "unix", "replay"],
+                        help="Transport to listen on (default: tcp).")
+    parser.add_argument("--host", default="0.0.0.0", help="Host for tcp and udp.")
+    parser.add_argument("--port", type=int, default=None, help="Port for rfcomm, tcp and udp.")
+    parser.add_argument("--path", default="/tmp/cm-emulator.sock", help="Socket path for unix, recording for replay.")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed, 0 replays as fast as possible.")
+    parser.add_argument("--fps", type=maxFps, default=30,
+                        help="Matrix updates per second (1 to 255), sent to devices as max. FPS.")
+    parser.add_argument("--record", metavar="DIRECTORY", help="Record all sessions to this directory.")
+    parser.add_argument("--jitter", type=float, metavar="DELAY",
+                        help="Pace frames through a jitter buffer with this delay in seconds.")
+    parser.add_argument("--jitter-policy", default="coalesce", choices=["coalesce", "queue"])
+    parser.add_argument("--log", default="logs/events.jsonl", help="Event log file (JSON lines).")
+    parser.add_argument("--trace-rate", type=float, default=0.0, metavar="RATE",
+                        help="Also log this fraction (0.0 to 1.0) of all received frames.")
+    parser.add_argument("--sink", action="append", default=[], metavar="SINK",
+                        help="Send matrix updates to \"stdout\" or append them to a file. Files ending in .apng, "
+                             ".gif or .rgb get an animation or video of the LEDs. Can be repeated.")
+    parser.add_argument("--stats", type=float, default=5.0, metavar="SECONDS",
+                        help="Print metrics to stderr every SECONDS, 0 disables them.")
+    parser.add_argument("--duration", type=float, default=0.0, metavar="SECONDS",
+                        help="Stop after SECONDS. By default runs until interrupted (or the replay ends).")
+    return parser.parse_args()
+
+
+# Print metrics of all sessions to stderr.
+def printStats(bt, frames_before, interval):
+    sessions = bt.sessions.sessions
+    frames = sum(session.frames_received for session in sessions)
+
+    line = "sessions: " + str(len(sessions)) + ", frames/s: " + str(round(max(frames - frames_before, 0) / interval, 1))
+    for session in sessions:
+        line += " | " + session.describe() + ": " + str(session.frames_received) + " frames"
+        if (isinstance(session.frames, JitterBuffer)):
+            stats = session.frames.stats()
+            line += " (" + str(stats["late"]) + " late, " + str(stats["dropped"]) + " dropped, " + str(
+                stats["duplicated"]) + " duplicated)"
+
+    sys.stderr.write(line + "\n")
+    return frames
+
+
+def main():
+    args = parseArguments()
+
+    # The matrix store, fed by the transport. There is no window.
+    bt = BTHelper(numpy.zeros(576, dtype=numpy.uint8), args.fps, None)
+
+    bt.events = EventLog(args.log)
+    bt.events.traceFrames(args.trace_rate)
+
+    if (args.jitter is not None):
+        bt.useJitterBuffer(args.jitter, 16, args.jitter_policy)
+
+    if (args.record):
+        bt.recordSessions(args.record)
+
+    # A replay as fast as possible may end before the loop below ran once,
+    # so its sinks get every frame from the reader thread instead, and
+    # exports wait for the encoder rather than dropping frames.
+    per_frame = args.transport == "replay" and args.speed == 0
+
+    sinks = [createSink(name, args.fps, block=per_frame) for name in args.sink]
+    shown_seq = 0
+
+    # Same as schedule_leds in the emulator, but the sinks get the matrix.
+    def updateSinks():
+        nonlocal shown_seq
+        bt.updateDisplay()
+        if (bt.display_seq != shown_seq):
+            shown_seq = bt.display_seq
+            for sink in sinks:
+                sink.onFrame(bt.display_seq, bt.matrix, bt.format)
+
+    if (per_frame):
+        bt.on_frame = updateSinks
+
+    # Start reader thread. It only ends after a replay.
+    transport = createTransport(args.transport, bt, args.host, args.port, args.path, args.speed)
+    thread_reader = Thread(target=bt.serve, args=(transport, ), daemon=True)
+    thread_reader.start()
+
+    time_start = t.perf_counter()
+    time_stats = time_start
+    frames_stats = 0
+
+    try:
+        while (thread_reader.is_alive() or bt.running):
+            now = t.perf_counter()
+            if (args.duration > 0 and now - time_start >= args.duration):
+                break
+
+            if (not per_frame):
+                updateSinks()
+
+            if (args.stats > 0 and now - time_stats >= args.stats):
+                frames_stats = printStats(bt, frames_stats, now - time_stats)
+                time_stats = now
+
+            t.sleep(max(1.0 / args.fps - (t.perf_counter() - now), 0.0))
+    except KeyboardInterrupt:
+        pass
+
+    if (args.stats > 0):
+        printStats(bt, frames_stats, max(t.perf_counter() - time_stats, 1e-6))
+
+    for sink in sinks:
+        sink.close()
+
+    bt.events.close()
+
+
+if __name__ == "__main__":
+    main()
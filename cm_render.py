@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# Version:	1.0
+# Author:	Vincent Diener - diener@teco.edu
+
+# Offscreen renderer: draws the full emulator scene (Connection Machine, LEDs,
+# floor, overlays, post processing) without a display, e.g. on a server or for
+# reference images in tests. Needs an OpenGL context without a window, which
+# pyglet gets through EGL (e.g. Mesa with llvmpipe as software renderer).
+# Example: python3 cm_render.py --frames 30 --pattern scroll --output renders
+# With --export, the frames are encoded to an animation or video instead,
+# e.g. of a recorded session: python3 cm_render.py --recording session.cmrec --export session.apng
+
+import argparse
+import os
+import numpy
+import pyglet
+
+# Use EGL instead of a window on the display. Must be set before pyglet.gl is used.
+pyglet.options["headless"] = True
+
+from modules.export.export import Exporter, EXPORT_FORMATS
+from modules.frame_format.frame_format import frameFormat, formatFromHandshake, COLOR_NAMES
+from modules.offscreen.offscreen import OffscreenRenderer, savePNG, READBACK_RING
+from modules.recorder.recorder import SessionRecording
+from modules.scene.scene import Scene
+from modules.simulator.simulator import createPattern, PATTERNS
+from modules.transport.transport import Handshake
+
+
+# Same caches as cm_2015.py.
+SHADER_CACHE_DIRECTORY = "shaders/cache"
+TEXTURE_CACHE_DIRECTORY = "textures/cache"
+
+
+# Parse the command line.
+def parseArguments():
+    parser = argparse.ArgumentParser(description="Render the Connection Machine emulator without a display.")
+    parser.add_argument("--width", type=int, default=900)
+    parser.add_argument("--height", type=int, default=900)
+    parser.add_argument("--frames", type=int, default=None,
+                        help="Number of frames to render. Defaults to 1, or the length of the recording.")
+    parser.add_argument("--fps", type=float, default=30.0, help="Frames per second of recordings and exports.")
+    parser.add_argument("--output", default="renders", help="Directory the frames are written to.")
+    parser.add_argument("--format", default="png", choices=["png", "npy"],
+                        help="PNG images, or NumPy arrays (height, width, 4).")
+    parser.add_argument("--pattern", default="random", choices=PATTERNS, help="Pattern shown on the LEDs.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random patterns.")
+    parser.add_argument("--recording", help="Show the frames of a recorded session instead of a pattern.")
+    parser.add_argument("--export", metavar="PATH",
+                        help="Encode the frames to an animation or video (" + ", ".join(EXPORT_FORMATS) +
+                             ") instead of single files.")
+    parser.add_argument("--size", default="24x24", help="LED matrix size, e.g. 64x64.")
+    parser.add_argument("--color", default="red", choices=list(COLOR_NAMES.values()))
+    parser.add_argument("--time", type=float, default=50,
+                        help="Animation time of the first frame, in frames at 60 frames per second. "
+                             "From 50 on the fade in is over.")
+    parser.add_argument("--floor", action="store_true", help="Draw the detailed floor.")
+    parser.add_argument("--no-lighting", action="store_true")
+    parser.add_argument("--post-processing", action="store_true")
+    parser.add_argument("--hide-instructions", action="store_true")
+    parser.add_argument("--ring", type=int, default=READBACK_RING, help="Frames read back at the same time.")
+    parser.add_argument("--core", action="store_true",
+                        help="Render with an OpenGL 3.3 core profile context (shaders/core).")
+    parser.add_argument("--check", action="store_true",
+                        help="Render the first frame twice and fail if the two differ, e.g. because of "
+                             "state changed while textures are uploaded on first use.")
+    return parser.parse_args()
+
+
+# Returns a function that returns the LEDs of frame n and their FrameFormat.
+# Frames of a recording are shown at their original timing.
+def createFrames(args):
+    if (args.recording):
+        recording = SessionRecording(args.recording)
+        frame_format = formatFromHandshake(Handshake.fromBytes(recording.handshake_bytes))
+        times = recording.frames["time"]
+        data = recording.frames["data"]
+
+        if (args.frames is None):
+            args.frames = int(recording.duration() * args.fps) + 1
+
+        # The last frame received before frame n is shown.
+        def frame(n):
+            i = max(int(numpy.searchsorted(times, n / args.fps, side="right")) - 1, 0)
+            return data[i]
+
+        return frame, frame_format
+
+    x_size, y_size = [int(n) for n in args.size.lower().split("x")]
+    color_mode = [mode for mode, name in COLOR_NAMES.items() if name == args.color][0]
+    frame_format = frameFormat(x_size, y_size, color_mode)
+    pattern = createPattern(args.pattern, args.seed, frame_format.frame_size)
+
+    if (args.frames is None):
+        args.frames = 1
+
+    return lambda n: numpy.frombuffer(pattern(n), dtype=numpy.uint8), frame_format
+
+
+# Render the first frame twice. Both must be the same: the first frame is
+# the only one drawn before all textures are uploaded.
+def checkFirstFrame(scene, renderer, leds, frame_format):
+    scene.setLeds(leds, frame_format)
+    frames = [renderer.render(), renderer.render()] + renderer.flush()
+    first, second = [pixels for tag, pixels in [frame for frame in frames if frame is not None]]
+
+    differing = int(numpy.count_nonzero(numpy.any(first != second, axis=-1)))
+    if (differing):
+        raise SystemExit("Check failed: the first frame differs from the second in " + str(differing) + " pixels.")
+    print("Check passed: the first frame equals the second.")
+
+
+def main():
+    args = parseArguments()
+
+    frame, frame_format = createFrames(args)
+
+    # Created before the OpenGL context, the encoder process does not need one.
+    exporter = Exporter(args.export, args.fps) if args.export else None
+
+    # The window only provides the OpenGL context, nothing is drawn to it.
+    config = None
+    if (args.core):
+        config = pyglet.gl.Config(major_version=3, minor_version=3, forward_compatible=True, double_buffer=True,
+                                  depth_size=24)
+    window = pyglet.window.Window(args.width, args.height, visible=False, config=config)
+
+    scene = Scene(args.width, args.height, SHADER_CACHE_DIRECTORY, TEXTURE_CACHE_DIRECTORY, core=args.core)
+    scene.time = args.time
+    scene.floor = args.floor
+    scene.lighting = not args.no_lighting
+    scene.post_processing = args.post_processing
+    if (args.hide_instructions):
+        scene.show_instructions = False
+        scene.instruction_timer = 50
+
+    renderer = OffscreenRenderer(scene, args.width, args.height, args.ring)
+    if (exporter is None):
+        os.makedirs(args.output, exist_ok=True)
+
+    def write(frame):
+        n, pixels = frame
+        if (exporter is not None):
+            # Nothing is drawn live, so wait for the encoder instead of dropping frames.
+            exporter.submit(pixels, n / args.fps, block=True)
+            return
+
+        path = os.path.join(args.output, "frame_" + str(n).zfill(6) + "." + args.format)
+        if (args.format == "png"):
+            savePNG(path, pixels)
+        else:
+            numpy.save(path, pixels)
+
+    if (args.check):
+        checkFirstFrame(scene, renderer, frame(0), frame_format)
+
+    for n in range(args.frames):
+        scene.setLeds(frame(n), frame_format)
+
+        rendered = renderer.render(n)
+        if (rendered is not None):
+            write(rendered)
+
+        # Animations run at --fps, like in the emulator at any frame rate.
+        scene.advance(1.0 / args.fps)
+
+    for rendered in renderer.flush():
+        write(rendered)
+
+    renderer.delete()
+    window.close()
+
+    if (exporter is not None):
+        stats = exporter.close()
+        print(str(stats["written"]) + " frames written to " + stats["path"] + " (" + str(stats["unchanged"]) +
+              " unchanged frames merged)")
+
+
+if __name__ == "__main__":
+    main()
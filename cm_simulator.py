@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# Version:	1.0
+# Author:	Vincent Diener - diener@teco.edu
+
+# Synthetic device simulator and load generator.
+# Opens any number of parallel connections that do the real handshake and
+# stream frames at a fixed rate, then reports throughput, dropped frames and
+# handshake latency percentiles.
+# Example: python3 cm_simulator.py --local --connections 50 --fps 60 --duration 10
+# --local starts an emulator protocol server (as in cm_headless.py) in this
+# process, so no Bluetooth hardware, window or second process is needed.
+# Devices get no acknowledgement for their frames, so how many frames the
+# emulator accepted (and how many got lost) is only known with --local.
+
+import argparse
+import os
+import time as t
+import numpy
+
+from threading import Thread
+
+from modules.bt_helper.bt_helper import BTHelper
+from modules.event_log.event_log import EventLog
+from modules.frame_format.frame_format import COLOR_NAMES
+from modules.simulator.simulator import LoadGenerator, PATTERNS
+from modules.transport.transport import createTransport
+
+
+# LED matrix size as WIDTHxHEIGHT, each 1 to 255 (one byte in the handshake).
+def matrixSize(value):
+    parts = value.lower().split("x")
+    if (len(parts) != 2 or not all(part.isdigit() for part in parts)):
+        raise argparse.ArgumentTypeError("must be WIDTHxHEIGHT, e.g. 64x64")
+
+    x_size, y_size = [int(part) for part in parts]
+    if (not (1 <= x_size <= 255 and 1 <= y_size <= 255)):
+        raise argparse.ArgumentTypeError("width and height must be between 1 and 255")
+    return x_size, y_size
+
+
+# Parse the command line.
+def parseArguments():
+    parser = argparse.ArgumentParser(description="Connection Machine device simulator and load generator.")
+    parser.add_argument("--transport", default="tcp", choices=["tcp", "udp", "unix"])
+    parser.add_argument("--host", default="127.0.0.1", help="Emulator host for tcp and udp.")
+    parser.add_argument("--port", type=int, default=5016, help="Emulator port for tcp and udp.")
+    parser.add_argument("--path", default="/tmp/cm-emulator.sock", help="Emulator socket path for unix.")
+    parser.add_argument("--connections", type=int, default=1, help="Number of parallel devices.")
+    parser.add_argument("--fps", type=float, default=30.0, help="Frames per second of every device.")
+    parser.add_argument("--pattern", default="random", choices=PATTERNS)
+    parser.add_argument("--protocol", type=int, default=1, choices=[1, 2],
+                        help="Protocol version, 2 sends encoded frames.")
+    parser.add_argument("--size", type=matrixSize, default=(24, 24), metavar="WIDTHxHEIGHT",
+                        help="LED matrix size sent in the handshake, e.g. 64x64 (1 to 255 each).")
+    parser.add_argument("--color", default="red", choices=list(COLOR_NAMES.values()),
+                        help="Color mode sent in the handshake.")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds to stream.")
+    parser.add_argument("--local", action="store_true",
+                        help="Start an emulator protocol server in this process. Needed to report accepted and "
+                             "lost frames, a remote emulator does not acknowledge frames.")
+    return parser.parse_args()
+
+
+# Start a headless protocol server in a background thread.
+def startLocalServer(args):
+    bt = BTHelper(numpy.zeros(576, dtype=numpy.uint8), 255, None)
+    bt.events = EventLog(os.devnull)
+
+    transport = createTransport(args.transport, bt, args.host, args.port, args.path)
+    Thread(target=bt.serve, args=(transport, ), daemon=True).start()
+
+    # Give the server time to start listening.
+    t.sleep(0.5)
+    return bt
+
+
+def main():
+    args = parseArguments()
+
+    x_size, y_size = args.size
+    color_mode = [mode for mode, name in COLOR_NAMES.items() if name == args.color][0]
+
+    try:
+        load = LoadGenerator(args.transport, args.host, args.port, args.path, args.connections, args.fps,
+                             args.pattern, args.protocol, x_size, y_size, color_mode)
+    except ValueError as e:
+        raise SystemExit(str(e))
+
+    bt = startLocalServer(args) if args.local else None
+    load.run(args.duration)
+    results = load.results()
+
+    print("Connections:       " + str(results["connected"]) + "/" + str(results["connections"]) +
+          " (" + str(results["errors"]) + " errors)")
+    print("Frames sent:       " + str(results["sent"]) + " (" + str(round(results["frames_per_second"], 1)) +
+          " frames/s, " + str(round(results["megabytes_per_second"], 2)) + " MB/s)")
+    print("Frames dropped:    " + str(results["dropped"]) + " (send buffer full)")
+    if (args.transport == "udp"):
+        print("Frames failed:     " + str(results["failed"]) + " (send errors, not counted as sent)")
+
+    # Only the local server knows how many frames it accepted.
+    if (bt is not None):
+        t.sleep(0.5)
+        print("Frames accepted:   " + str(bt.frames_total) + " (" + str(results["sent"] - bt.frames_total) +
+              " lost)")
+    else:
+        print("Frames accepted:   unknown, the emulator does not acknowledge frames (use --local)")
+
+    print("Handshake latency: p50 " + str(round(results["handshake_p50_ms"], 2)) + " ms, p90 " +
+          str(round(results["handshake_p90_ms"], 2)) + " ms, p99 " + str(round(results["handshake_p99_ms"], 2)) +
+          " ms, max " + str(round(results["handshake_max_ms"], 2)) + " ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,133 +1,251 @@
 # Version:	1.0
 # Author:	Vincent Diener - diener@teco.edu
 
-import logging as log
+import os
 import time as t
-import bluetooth
+
+from modules.frame_codec.frame_codec import protocolVersion
+from modules.event_log.event_log import EventLog
+from modules.frame_format.frame_format import formatFromHandshake, DEFAULT_FORMAT
+from modules.jitter_buffer.jitter_buffer import JitterBuffer
+from modules.recorder.recorder import SessionRecorder
+from modules.session.session import SessionManager
+from modules.transport.transport import RFCOMMTransport
+
+# Response codes sent back to a device after its handshake.
+RESPONSE_OK = 0
+RESPONSE_REJECTED = 1
 
 # Helper class for Bluetooth.
-# Also does logging.
+# Also does logging (structured events, see EventLog).
+# Despite the name, any transport from modules.transport can feed it.
 class BTHelper:
-    # Initialize with matrix and window.
-    # Matrix represents the 576 LEDs on the Connection Machine.
+    # Initialize with matrix and window (None in headless mode).
+    # Matrix represents the 576 LEDs on the Connection Machine
+    # (NumPy uint8 array of red values) and is used for showPattern().
+    # While devices are connected, self.matrix shows the selected session,
+    # or all sessions tiled, in the format given by self.format (see
+    # FrameFormat and updateDisplay()). Only the render thread touches them,
+    # the reader thread hands frames over through FrameStores.
     def __init__(self, matrix, max_fps, window):
+        self.pattern = matrix
         self.matrix = matrix
+        self.format = DEFAULT_FORMAT
         self.window = window
         self.max_fps = max_fps
+
+        # Increases every time the content of the matrix changes.
+        self.display_seq = 0
+
+        # True while at least one device is connected.
         self.running = False
 
+        # Frames received from all devices since the start.
+        self.frames_total = 0
+
+        # All connected devices.
+        self.sessions = SessionManager()
+
+        # Description of the transport, shown in the window title.
+        self.listening = ""
+
+        # Directory to record sessions to. None disables recording.
+        self.record_directory = None
+
+        # Session events, written to the log file by a background thread.
+        self.events = EventLog('logs/events.jsonl')
+
+        # Profiler measuring how long received frames take, None to not measure.
+        self.profiler = None
+
+        # Called in the reader thread after every received frame, None for
+        # nothing. Used when no render thread polls updateDisplay(), which
+        # then must only be called from this callback.
+        self.on_frame = None
+
     # This gets started as a thread.
+    # Serves the original RFCOMM transport.
     def btreader(self, arg):
+        self.serve(RFCOMMTransport(self))
+
+    # This gets started as a thread.
+    # Serves the given transport forever.
+    def serve(self, transport):
         # Start logging.
-        log.basicConfig(filename='logs/events.log',
-                        format='%(asctime)s %(message)s',
-                        datefmt='%d/%m/%Y %H:%M:%S',
-                        level=log.INFO)
-
-        log.info("- Starting the server.\n")
-
-        # Bluetooth reading loop.
-        while (True):
-
-            # No connection yet.
-            self.running = False
-
-            # Set up server socket and start listening.
-            server_sock = bluetooth.BluetoothSocket(bluetooth.RFCOMM)
-
-            port = 16
-            server_sock.bind(("", port))
-            server_sock.listen(1)
-
-            # Print Bluetooth address and RFCOMM port to window title.
-            addr = str(server_sock.getsockname()[0])
-            port = str(server_sock.getsockname()[1])
-            self.window.set_caption("Connection Machine Emulator (" + addr + " Port: " + port + ")")
-
-            # Connection established.
-            client_sock, address = server_sock.accept()
-            self.running = True
-
-            # Log time of connection.
-            time_connect = t.time()
-            log.info("- Accepted connection from device " + str(address) + ".")
-
-            # Start counting received frames.
-            frames_received = 0
-
-            # Receive handshake packet. More info: see http://www.teco.kit.edu/cm/dev/
-            try:
-                version = ""
-                xSize = ""
-                ySize = ""
-                colorMode = ""
-                nameLength = ""
-                name = ""
-
-                version = client_sock.recv(1)
-                xSize = client_sock.recv(1)
-                ySize = client_sock.recv(1)
-                colorMode = client_sock.recv(1)
-                nameLength = client_sock.recv(1)
-                name = client_sock.recv(ord(nameLength))
-            except:
-                # Malformed handshake packet.
-                # Close connection and go back to listening.
-                self.running = False
-
-            # Log received handshake info.
-            log.info("- Received handshake. Version: \"" + str(ord(version)) + "\", Name: \"" + str(
-                name) + "\", X-Size: \"" + str(ord(xSize)) + "\", Y-Size: \"" + str(
-                ord(ySize)) + "\", ColorMode: \"" + str(ord(colorMode)) + "\".")
-
-            # Send back response code 0 ("No error, connection OK.").
-            rsp_code = 0
-            client_sock.send(chr(rsp_code))
-
-            # Set FPS supported by emulator.
-            client_sock.send(chr(self.max_fps))
-
-            # Log sent response.
-            log.info("- Sent response. Code: " + str(rsp_code) + ", Max. FPS: " + str(self.max_fps) + ".")
-
-            # Loop while connection is open.
-            while (self.running == True):
-                # Receive 576 bytes.
-                # If no data is received, close connection.
-                try:
-                    data = ""
-                    data = client_sock.recv(576)
-                except:
-                    self.running = False
-
-                # Broken connection might result in empty buffer getting read over and over again.
-                # To counter this infinite loop, we have to check if received data is empty and stop if it is.
-                if (not data):
-                    self.running = False
-
-                # Make sure the data was received and the connection is still open.
-                if (self.running == True and len(data) >= 576):
-                    # Debugging: Print out data.
-                    # print "Received [%s]" % data
-
-                    # Increase frame counter.
-                    frames_received += 1
-
-                    # Put received integers in the float array of red values that is used by the shaders.
-                    count = 0
-                    for x in range(0, 24):
-                        for y in range(0, 24):
-                            # Directly indexing the data byte array is possible because in Python 3,
-                            # indexing byte arrays returns an integer.
-                            self.matrix[24 * (23 - y) + x] = data[576 - 1 - count] / 255.0
-                            count += 1
-
-            # Close connection.
-            client_sock.close()
-            server_sock.close()
-
-            # Log disconnect time.
-            time_disconnect = t.time()
-            log.info("- Connection to " + str(address) + " closed. Connection lasted " +
-                     str((int(time_disconnect - time_connect) + 1)) + " seconds. Received " +
-                     str(frames_received) + " frames.\n")
+        self.events.start()
+        self.events.emit("server_start", transport=type(transport).__name__)
+
+        transport.serve()
+
+    # Pace the frames of all devices through a jitter buffer.
+    # Only affects devices that connect after this call.
+    def useJitterBuffer(self, delay, capacity, policy):
+        self.sessions.frame_factory = lambda size: JitterBuffer(delay, capacity, policy, size)
+
+    # Record every session to a file in the given directory.
+    def recordSessions(self, directory):
+        if (not os.path.isdir(directory)):
+            os.makedirs(directory)
+        self.record_directory = directory
+
+    # Update the matrix with what the panel should show.
+    # Its size and format change with the shown sessions.
+    # Gets called from the draw loop.
+    def updateDisplay(self):
+        self.sessions.tick(t.perf_counter())
+
+        if (self.running and self.sessions.compose()):
+            self.format = self.sessions.format
+            self.matrix = self.sessions.matrix
+            self.display_seq += 1
+
+    # Show the given red values (24x24, 0 to 255) while no device is connected.
+    def showPattern(self, values):
+        self.format = DEFAULT_FORMAT
+        self.matrix = self.pattern
+        self.matrix[:] = values
+        self.display_seq += 1
+
+    # Show the next session on the panel.
+    def selectNext(self):
+        self.sessions.selectNext()
+        self.updateCaption()
+
+    # Toggle between the selected session and all sessions tiled.
+    def toggleTile(self):
+        self.sessions.toggleTile()
+        self.updateCaption()
+
+    # Print address, port and shown session(s) to window title.
+    def updateCaption(self):
+        caption = "Connection Machine Emulator (" + self.listening + ")"
+
+        sessions = self.sessions.sessions
+        if (self.sessions.tile and len(sessions) > 1):
+            caption += " - " + str(len(sessions)) + " sessions tiled"
+        elif (sessions):
+            selected = self.sessions.selectedSession()
+            caption += " - " + selected.describe() + " (" + str(sessions.index(selected) + 1) + "/" + str(
+                len(sessions)) + ")"
+
+        # There is no window in headless mode.
+        if (self.window is not None):
+            self.window.set_caption(caption)
+
+    # Called by the transport once it is listening.
+    def onListen(self, description):
+        self.listening = description
+        self.events.emit("listen", description=description)
+        self.updateCaption()
+
+    # Called by the transport when a device connects.
+    # Returns the session that is passed to all further calls for this device.
+    def onConnect(self, address):
+        session = self.sessions.add(address)
+        self.running = True
+
+        # Log time of connection.
+        self.events.emit("connect", session=session.session_id, address=address)
+
+        self.updateCaption()
+        return session
+
+    # Called by the transport with the received handshake packet.
+    # Returns the response that is sent back to the device.
+    def onHandshake(self, session, handshake):
+        session.handshake = handshake
+
+        # Size the frames of the session as the device asked for.
+        self.sessions.setFormat(session, formatFromHandshake(handshake))
+
+        # Log received handshake info.
+        self.events.emit("handshake", session=session.session_id, version=handshake.version,
+                         name=handshake.name.decode("UTF-8", "replace"), x_size=handshake.xSize,
+                         y_size=handshake.ySize, color_mode=handshake.colorMode,
+                         format=session.format.describe())
+
+        # Send back response code 0 ("No error, connection OK.")
+        # and the FPS supported by emulator.
+        rsp_code = RESPONSE_OK
+        response = bytes([rsp_code, self.max_fps])
+
+        # Devices asking for encoded frames also get the accepted protocol version.
+        version = protocolVersion(handshake)
+        if (handshake.version >= 2):
+            response += bytes([version])
+
+        # Log sent response.
+        self.events.emit("response", session=session.session_id, code=rsp_code, max_fps=self.max_fps,
+                         protocol=version)
+
+        # Start recording.
+        if (self.record_directory is not None):
+            path = os.path.join(self.record_directory, t.strftime("%Y%m%d-%H%M%S") + "-" + str(
+                session.session_id) + ".cmrec")
+            session.recorder = SessionRecorder(path, handshake.toBytes(), session.format.frame_size)
+            self.events.emit("recording", session=session.session_id, path=path)
+
+        self.updateCaption()
+        return response
+
+    # Called by the transport instead of onConnect if it can not carry the
+    # frames the device asks for (see Transport). Returns the response that
+    # is sent back to the device.
+    def onReject(self, address, handshake, reason):
+        self.events.emit("reject", address=address, name=handshake.name.decode("UTF-8", "replace"),
+                         x_size=handshake.xSize, y_size=handshake.ySize, color_mode=handshake.colorMode,
+                         reason=reason)
+
+        response = bytes([RESPONSE_REJECTED, self.max_fps])
+        if (handshake.version >= 2):
+            response += bytes([protocolVersion(handshake)])
+        return response
+
+    # Called by the transport for every complete frame (frame_size bytes of the session format).
+    # data may be a view on the receive ring, so it is only valid during this call.
+    def onFrame(self, session, data):
+        if (self.profiler is not None):
+            section = self.profiler.begin("frame received", "ingest")
+
+        # Increase frame counters.
+        session.frames_received += 1
+        self.frames_total += 1
+        session.time_last_frame = t.time()
+
+        # Trace some of the frames.
+        if (self.events.tracing(session.frames_received)):
+            self.events.emit("frame", session=session.session_id, n=session.frames_received, size=len(data))
+
+        # Record the raw frame (version 2 packets are decoded by now).
+        if (session.recorder is not None):
+            session.recorder.writeFrame(data)
+
+        # Copy the received bytes into the LED values of the session
+        # and hand the complete frame over to the render thread.
+        session.format.decode(data, session.frames.writeBuffer())
+        session.frames.publish()
+
+        if (self.on_frame is not None):
+            self.on_frame()
+
+        if (self.profiler is not None):
+            self.profiler.end(section)
+
+    # Called by the transport when the device disconnects.
+    def onDisconnect(self, session):
+        self.sessions.remove(session)
+        self.running = len(self.sessions.sessions) > 0
+
+        # Stop recording.
+        if (session.recorder is not None):
+            session.recorder.close()
+
+        # Log disconnect time and statistics.
+        stats = {}
+        if (isinstance(session.frames, JitterBuffer)):
+            stats = session.frames.stats()
+
+        self.events.emit("disconnect", session=session.session_id, address=session.address,
+                         duration=t.time() - session.time_connect, frames=session.frames_received, **stats)
+
+        self.updateCaption()
@@ -0,0 +1,20 @@
+# Version:	1.0
+# Author:	Vincent Diener - diener@teco.edu
+
+import os
+
+
+# Write a file of a cache (e.g. shader binaries or decoded textures).
+# write(f) writes the content to the open binary file f. The content goes to
+# a temporary file first, so an interrupted write never leaves a broken file
+# behind. A cache that cannot be written only costs start time, so errors
+# are ignored. Returns True if the file was written.
+def writeCacheFile(path, write):
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "wb") as cache_f:
+            write(cache_f)
+        os.replace(path + ".tmp", path)
+        return True
+    except OSError:
+        return False
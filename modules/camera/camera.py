@@ -0,0 +1,96 @@
+# Version:	1.0
+# Author:	Vincent Diener - diener@teco.edu
+
+import math
+import numpy
+
+# Near and far plane and vertical field of view (degrees) of the camera.
+Z_NEAR = 0.01
+Z_FAR = 1000.0
+FIELD_OF_VIEW = 45.0
+
+# Position of the Connection Machine in front of the camera.
+MODEL_POSITION = (0.0, 0.2, -14.0)
+
+# Matrices are 4x4 float32 NumPy arrays, row-major, for column vectors
+# (transformed = matrix @ vector), like the matrices of the OpenGL functions
+# they replace. Upload them transposed (glUniformMatrix4fv with transpose
+# GL_TRUE, or glLoadTransposeMatrixf).
+IDENTITY = numpy.identity(4, dtype=numpy.float32)
+
+
+# Same matrix as glFrustum.
+def frustum(left, right, bottom, top, near, far):
+    return numpy.array([
+        [2.0 * near / (right - left), 0.0, (right + left) / (right - left), 0.0],
+        [0.0, 2.0 * near / (top - bottom), (top + bottom) / (top - bottom), 0.0],
+        [0.0, 0.0, -(far + near) / (far - near), -2.0 * far * near / (far - near)],
+        [0.0, 0.0, -1.0, 0.0]], dtype=numpy.float32)
+
+
+# Same matrix as glOrtho.
+def ortho(left, right, bottom, top, near, far):
+    return numpy.array([
+        [2.0 / (right - left), 0.0, 0.0, -(right + left) / (right - left)],
+        [0.0, 2.0 / (top - bottom), 0.0, -(top + bottom) / (top - bottom)],
+        [0.0, 0.0, -2.0 / (far - near), -(far + near) / (far - near)],
+        [0.0, 0.0, 0.0, 1.0]], dtype=numpy.float32)
+
+
+# Same matrix as glTranslatef.
+def translation(x, y, z):
+    matrix = numpy.identity(4, dtype=numpy.float32)
+    matrix[0:3, 3] = (x, y, z)
+    return matrix
+
+
+# Same matrix as glRotatef: degrees around the axis (x, y, z).
+def rotation(degrees, x, y, z):
+    axis = numpy.array([x, y, z], dtype=numpy.float64)
+    x, y, z = axis / numpy.linalg.norm(axis)
+    c = math.cos(math.radians(degrees))
+    s = math.sin(math.radians(degrees))
+
+    matrix = numpy.identity(4, dtype=numpy.float32)
+    matrix[0:3, 0:3] = [
+        [x * x * (1 - c) + c, x * y * (1 - c) - z * s, x * z * (1 - c) + y * s],
+        [y * x * (1 - c) + z * s, y * y * (1 - c) + c, y * z * (1 - c) - x * s],
+        [x * z * (1 - c) - y * s, y * z * (1 - c) + x * s, z * z * (1 - c) + c]]
+    return matrix
+
+
+# Projection and modelview matrix of the scene, computed in NumPy instead of
+# on the OpenGL matrix stacks, and their product modelview_projection.
+# Vertices are transformed with the product, like gl_ModelViewProjectionMatrix,
+# so they land on exactly the same pixels in both profiles. Camera movement
+# is applied to the projection matrix (after the perspective), as the
+# emulator always did, so lighting stays fixed to the Connection Machine.
+# The matrices are replaced, never changed in place, so users can tell
+# whether they changed by identity (see RenderList).
+class Camera:
+    def __init__(self, width=1, height=1):
+        self.reset(width, height)
+
+    # Perspective for a viewport of the given size, camera back at the start.
+    def reset(self, width, height):
+        size = Z_NEAR * math.tan(math.radians(FIELD_OF_VIEW) / 2.0)
+
+        # Prevent division by zero.
+        w_divided_h = width / float(max(height, 1))
+        self.projection = frustum(-size, size, -size / w_divided_h, size / w_divided_h, Z_NEAR, Z_FAR)
+        self.modelview = translation(*MODEL_POSITION)
+        self.modelview_projection = self.projection @ self.modelview
+
+    # Rotate the camera by degrees around the vertical axis through the
+    # point distance in front of it (negative distances are in front).
+    def orbit(self, degrees, distance):
+        self.apply(translation(0.0, 0.0, distance) @ rotation(degrees, 0, 1, 0) @
+                   translation(0.0, 0.0, -distance))
+
+    # Move the picture up (or down, for negative distances).
+    def move(self, distance):
+        self.apply(translation(0.0, distance, 0.0))
+
+    def apply(self, matrix):
+        self.projection = self.projection @ matrix
+        self.modelview_projection = self.projection @ self.modelview
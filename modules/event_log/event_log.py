@@ -0,0 +1,95 @@
+# Version:	1.0
+# Author:	Vincent Diener - diener@teco.edu
+
+import json
+import queue
+import time as t
+
+from threading import Thread
+
+# Events waiting to be written at most. If the writer falls behind,
+# new events are dropped and counted instead of blocking the caller.
+QUEUE_SIZE = 10000
+
+# Events written per batch at most.
+BATCH_SIZE = 256
+
+
+# Structured event log, written as JSON lines by a background thread.
+# emit() only puts the event into a bounded queue, so the thread receiving
+# frames never waits for file I/O. Events that do not fit into the queue are
+# dropped and counted. The writer reports new drops as "events_dropped" events.
+class EventLog:
+    def __init__(self, path, queue_size=QUEUE_SIZE):
+        self.path = path
+        self.queue = queue.Queue(queue_size)
+        self.thread = None
+
+        # Events dropped because the queue was full, and how many of them
+        # the writer already reported.
+        self.dropped = 0
+        self.reported = 0
+
+        # Every how many frames a "frame" trace event is emitted. 0 disables them.
+        self.trace_period = 0
+
+    # Start the writer thread. Events emitted before are kept.
+    def start(self):
+        if (self.thread is None):
+            self.thread = Thread(target=self.writer, daemon=True)
+            self.thread.start()
+
+    # Emit per-frame trace events for the given fraction of frames (0.0 to 1.0).
+    def traceFrames(self, rate):
+        self.trace_period = int(round(1.0 / rate)) if rate > 0 else 0
+
+    # Should frame number n of a session be traced?
+    def tracing(self, n):
+        return self.trace_period > 0 and n % self.trace_period == 0
+
+    # Log an event. Never blocks.
+    def emit(self, event, **fields):
+        fields["time"] = t.time()
+        fields["event"] = event
+        try:
+            self.queue.put_nowait(fields)
+        except queue.Full:
+            self.dropped += 1
+
+    # Write all queued events and stop the writer thread.
+    # Waits at most timeout seconds.
+    def close(self, timeout=1.0):
+        if (self.thread is not None):
+            try:
+                self.queue.put(None, timeout=timeout)
+            except queue.Full:
+                return
+            self.thread.join(timeout)
+            self.thread = None
+
+    # This gets started as a thread.
+    # Writes events in batches until close() is called.
+    def writer(self):
+        with open(self.path, "a") as f:
+            running = True
+            while (running):
+                batch = [self.queue.get()]
+                try:
+                    while (len(batch) < BATCH_SIZE):
+                        batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    pass
+
+                # None is put into the queue by close().
+                if (None in batch):
+                    batch = [event for event in batch if event is not None]
+                    running = False
+
+                # Report events that were dropped since the last batch.
+                dropped = self.dropped
+                if (dropped != self.reported):
+                    batch.append({"time": t.time(), "event": "events_dropped", "count": dropped - self.reported})
+                    self.reported = dropped
+
+                f.write("".join(json.dumps(event, default=str) + "\n" for event in batch))
+                f.flush()
@@ -0,0 +1,492 @@
+# Version:	1.0
+# Author:	Vincent Diener - diener@teco.edu
+
+import json
+import multiprocessing
+import queue
+import struct
+import zlib
+import numpy
+
+from multiprocessing import resource_tracker, shared_memory
+
+# Frames that may wait for the encoder. If all slots are in use, the encoder
+# does not keep up and new frames are dropped instead of blocking the caller.
+EXPORT_SLOTS = 16
+
+# File formats by file extension. "raw" is uncompressed RGB(A) video
+# (e.g. for ffmpeg -f rawvideo) with a JSON file describing it.
+EXPORT_FORMATS = {".apng": "apng", ".png": "apng", ".gif": "gif", ".rgb": "raw", ".rgba": "raw"}
+
+# zlib level of APNG frames. Higher levels hardly make the files smaller
+# but take much longer.
+PNG_COMPRESSION = 1
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+# Returns the export format of a file from its extension.
+def exportFormat(path):
+    for extension, name in EXPORT_FORMATS.items():
+        if (path.lower().endswith(extension)):
+            return name
+    raise ValueError("Unknown export format: " + path + " (use " + ", ".join(EXPORT_FORMATS) + ")")
+
+
+# Returns the LEDs of a matrix in the given FrameFormat as image, a uint8
+# array (height, width, 3) with one pixel per LED. Red LEDs are red, like
+# in the emulator.
+def ledImage(matrix, frame_format):
+    values = matrix[:frame_format.values].reshape(frame_format.height, frame_format.width, frame_format.channels)
+    if (frame_format.channels == 3):
+        return values
+
+    image = numpy.zeros((frame_format.height, frame_format.width, 3), dtype=numpy.uint8)
+    if (frame_format.color_mode == 0):
+        image[:, :, 0] = values[:, :, 0]
+    else:
+        image[:] = values
+    return image
+
+
+# Returns the rectangle (top, bottom, left, right) that contains all pixels
+# that differ between two images of the same size, None if they are equal.
+def changedBox(previous, image):
+    changed = previous != image
+    # Reduce whole rows first, that is much faster than pixel by pixel.
+    rows = numpy.flatnonzero(changed.reshape(len(changed), -1).any(axis=1))
+    if (len(rows) == 0):
+        return None
+    top, bottom = int(rows[0]), int(rows[-1]) + 1
+    columns = numpy.flatnonzero(changed[top:bottom].any(axis=0).any(axis=1))
+    return top, bottom, int(columns[0]), int(columns[-1]) + 1
+
+
+# Base class of the animation writers. Frames are written as soon as they
+# arrive, only the part that changed since the last frame is encoded and
+# unchanged frames are skipped. How long a frame is shown is only known
+# when the next one arrives, so it is patched into the file afterwards.
+class AnimationWriter:
+    # Delays are written in 1 / units seconds.
+    units = 1000
+
+    def __init__(self, path, width, height, channels, fps):
+        self.path = path
+        self.width = width
+        self.height = height
+        self.channels = channels
+        self.fps = fps
+        self.frames = 0
+
+        # The image as shown after the last frame.
+        self.previous = numpy.zeros((height, width, channels), dtype=numpy.uint8)
+        self.time = None
+
+        self.file = open(path, "wb")
+        self.begin()
+
+    # Add an image (height, width, channels) shown from time (in seconds) on.
+    # Returns False if it was skipped because nothing changed.
+    def write(self, image, time):
+        if (self.frames == 0):
+            box = (0, self.height, 0, self.width)
+        else:
+            box = changedBox(self.previous, image)
+            if (box is None):
+                return False
+            self.patchDelay(round(time * self.units) - round(self.time * self.units))
+
+        top, bottom, left, right = box
+        self.previous[top:bottom, left:right] = image[top:bottom, left:right]
+        self.writeFrame(self.previous[top:bottom, left:right], left, top)
+
+        self.time = time
+        self.frames += 1
+        return True
+
+    def close(self):
+        if (self.frames > 0):
+            self.patchDelay(round(self.units / self.fps))
+        self.end()
+        self.file.close()
+
+    # Overwrite the delay of the last frame with the given number of units.
+    def patchDelay(self, delay):
+        end = self.file.tell()
+        self.file.seek(self.delay_offset)
+        self.file.write(self.delayBytes(delay))
+        self.file.seek(end)
+
+    def begin(self):
+        pass
+
+    def end(self):
+        pass
+
+
+# Returns a PNG chunk.
+def pngChunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+# Animated PNG, lossless. Changed parts are stored as frames at an offset
+# that replace what was there (blend and dispose operation 0).
+class ApngWriter(AnimationWriter):
+    units = 1000
+
+    def begin(self):
+        color_type = 6 if self.channels == 4 else 2
+        self.file.write(PNG_SIGNATURE)
+        self.file.write(pngChunk(b"IHDR", struct.pack(">IIBBBBB", self.width, self.height, 8, color_type, 0, 0, 0)))
+
+        # Number of frames, written when closing. 0 plays forever.
+        self.actl_offset = self.file.tell()
+        self.file.write(pngChunk(b"acTL", struct.pack(">II", 0, 0)))
+
+        # Sequence number of the next fcTL or fdAT chunk.
+        self.sequence = 0
+
+    def writeFrame(self, pixels, left, top):
+        height, width = pixels.shape[:2]
+
+        # Every row starts with its filter type, 0 (none).
+        rows = numpy.zeros((height, 1 + width * self.channels), dtype=numpy.uint8)
+        rows[:, 1:] = pixels.reshape(height, -1)
+        data = zlib.compress(rows, PNG_COMPRESSION)
+
+        self.control = (self.sequence, width, height, left, top)
+        self.delay_offset = self.file.tell()
+        self.file.write(self.delayBytes(0))
+        self.sequence += 1
+
+        # The first frame is also the image shown by viewers without APNG support.
+        if (self.frames == 0):
+            self.file.write(pngChunk(b"IDAT", data))
+        else:
+            self.file.write(pngChunk(b"fdAT", struct.pack(">I", self.sequence) + data))
+            self.sequence += 1
+
+    # The whole fcTL chunk, as its checksum changes with the delay.
+    def delayBytes(self, delay):
+        delay = min(max(delay, 1), 65535)
+        return pngChunk(b"fcTL", struct.pack(">IIIIIHHBB", *self.control, delay, self.units, 0, 0))
+
+    def end(self):
+        self.file.write(pngChunk(b"IEND", b""))
+        self.file.seek(self.actl_offset)
+        self.file.write(pngChunk(b"acTL", struct.pack(">II", self.frames, 0)))
+
+
+# Palette of the GIF writer: a 6x6x6 color cube and 40 shades of gray.
+GIF_CUBE = 6
+GIF_GRAYS = 40
+
+
+def gifPalette():
+    levels = numpy.arange(GIF_CUBE) * 255 // (GIF_CUBE - 1)
+    cube = numpy.stack(numpy.meshgrid(levels, levels, levels, indexing="ij"), axis=-1).reshape(-1, 3)
+    grays = numpy.repeat(numpy.arange(GIF_GRAYS) * 255 // (GIF_GRAYS - 1), 3).reshape(-1, 3)
+    return numpy.concatenate([cube, grays]).astype(numpy.uint8)
+
+
+GIF_PALETTE = gifPalette()
+
+
+# Returns the palette index of every pixel of an RGB(A) image: the closer
+# of the nearest cube color and the nearest gray.
+def quantize(pixels):
+    rgb = pixels[:, :, :3].astype(numpy.int32)
+    levels = (rgb * (GIF_CUBE - 1) + 127) // 255
+    cube = (levels[:, :, 0] * GIF_CUBE + levels[:, :, 1]) * GIF_CUBE + levels[:, :, 2]
+    gray = (rgb.sum(axis=2) * (GIF_GRAYS - 1) + 382) // 765 + GIF_CUBE ** 3
+
+    palette = GIF_PALETTE.astype(numpy.int32)
+    cube_error = ((palette[cube] - rgb) ** 2).sum(axis=2)
+    gray_error = ((palette[gray] - rgb) ** 2).sum(axis=2)
+    return numpy.where(gray_error < cube_error, gray, cube).astype(numpy.uint8)
+
+
+# LZW compression of GIF image data (8 bit palette indices).
+def lzwEncode(indices):
+    clear = 256
+    end = 257
+    size = 9
+    next_code = end + 1
+    codes = {}
+
+    out = bytearray()
+    buffer = clear
+    bits = size
+
+    data = iter(indices)
+    prefix = next(data)
+
+    for k in data:
+        key = prefix << 8 | k
+        code = codes.get(key)
+        if (code is not None):
+            prefix = code
+            continue
+
+        buffer |= prefix << bits
+        bits += size
+        while (bits >= 8):
+            out.append(buffer & 255)
+            buffer >>= 8
+            bits -= 8
+
+        if (next_code < 4096):
+            codes[key] = next_code
+            next_code += 1
+            # The decoder adds its codes one step later.
+            if (next_code - 1 == 1 << size):
+                size += 1
+        else:
+            # The table is full, start over.
+            buffer |= clear << bits
+            bits += size
+            codes.clear()
+            next_code = end + 1
+            size = 9
+
+        prefix = k
+
+    buffer |= prefix << bits
+    bits += size
+    if (next_code == 1 << size and size < 12):
+        size += 1
+    buffer |= end << bits
+    bits += size
+
+    while (bits > 0):
+        out.append(buffer & 255)
+        buffer >>= 8
+        bits -= 8
+    return bytes(out)
+
+
+# Animated GIF with the palette above. Changed parts are stored as
+# images at an offset over the previous ones (disposal method 1).
+# Loses colors and is the slowest format, mostly meant for the LEDs.
+class GifWriter(AnimationWriter):
+    units = 100
+
+    def begin(self):
+        # Global color table with 256 colors, 8 bits per color.
+        self.file.write(b"GIF89a" + struct.pack("<HHBBB", self.width, self.height, 0xF7, 0, 0))
+        self.file.write(GIF_PALETTE.tobytes().ljust(768, b"\0"))
+        # Loop forever.
+        self.file.write(b"\x21\xFF\x0BNETSCAPE2.0\x03\x01\x00\x00\x00")
+
+    def writeFrame(self, pixels, left, top):
+        height, width = pixels.shape[:2]
+        data = lzwEncode(quantize(pixels).tobytes())
+
+        # Graphic control extension, the delay is at offset 4.
+        self.delay_offset = self.file.tell() + 4
+        self.file.write(b"\x21\xF9\x04\x04" + self.delayBytes(0) + b"\x00\x00")
+
+        self.file.write(b"\x2C" + struct.pack("<HHHHB", left, top, width, height, 0) + b"\x08")
+        for i in range(0, len(data), 255):
+            block = data[i:i + 255]
+            self.file.write(bytes([len(block)]) + block)
+        self.file.write(b"\x00")
+
+    # Most viewers show delays below 2 as 10.
+    def delayBytes(self, delay):
+        return struct.pack("<H", min(max(delay, 2), 65535))
+
+    def end(self):
+        self.file.write(b"\x3B")
+
+
+# Uncompressed frames at a constant rate, one after the other. Unchanged
+# frames are written again. path + ".json" describes the video and holds
+# the time of every frame.
+class RawWriter:
+    def __init__(self, path, width, height, channels, fps):
+        self.path = path
+        self.width = width
+        self.height = height
+        self.channels = channels
+        self.fps = fps
+        self.frames = 0
+        self.times = []
+        self.file = open(path, "wb")
+
+    def write(self, image, time):
+        self.file.write(numpy.ascontiguousarray(image))
+        self.times.append(time)
+        self.frames += 1
+        return True
+
+    def close(self):
+        self.file.close()
+        with open(self.path + ".json", "w") as f:
+            json.dump({"width": self.width, "height": self.height,
+                       "pix_fmt": "rgba" if self.channels == 4 else "rgb24",
+                       "fps": self.fps, "frames": self.frames, "times": self.times}, f)
+
+
+WRITERS = {"apng": ApngWriter, "gif": GifWriter, "raw": RawWriter}
+
+
+# Main function of the encoder process. Gets the frames from the slots
+# named in the messages, scales them up, writes them and frees the slots.
+def encodeFrames(path, file_format, fps, scale, messages, free, results):
+    memory = None
+    slots = None
+    writer = None
+    skipped = 0
+
+    parent = multiprocessing.parent_process()
+
+    while (True):
+        # Finish the file if the emulator ended without closing the exporter.
+        try:
+            message = messages.get(timeout=1.0)
+        except queue.Empty:
+            if (parent.is_alive()):
+                continue
+            break
+
+        if (message is None):
+            break
+
+        if (message[0] == "open"):
+            name, shape, count = message[1:]
+            memory = shared_memory.SharedMemory(name=name)
+            slots = numpy.ndarray((count, ) + shape, dtype=numpy.uint8, buffer=memory.buf)
+            height, width, channels = shape
+            writer = WRITERS[file_format](path, width * scale, height * scale, channels, fps)
+            continue
+
+        slot, time = message[1:]
+        image = slots[slot]
+        if (scale > 1):
+            # A copy, so the slot can be used again right away.
+            image = image.repeat(scale, axis=0).repeat(scale, axis=1)
+            free.put(slot)
+            written = writer.write(image, time)
+        else:
+            written = writer.write(image, time)
+            free.put(slot)
+
+        if (not written):
+            skipped += 1
+
+    frames = 0
+    if (writer is not None):
+        writer.close()
+        frames = writer.frames
+
+    slots = None
+    if (memory is not None):
+        memory.close()
+
+    results.put({"written": frames, "unchanged": skipped})
+
+
+# Streams frames to an animation or video file. Frames are copied into
+# shared memory and encoded by a separate process, so submit() never waits
+# for the encoder. If the encoder falls behind, frames are dropped and
+# counted. All frames must have the size of the first one.
+# Create exporters before starting threads: the encoder process is forked
+# where the platform supports it.
+class Exporter:
+    def __init__(self, path, fps=60, scale=1, slots=EXPORT_SLOTS, file_format=None):
+        self.path = path
+        self.file_format = file_format or exportFormat(path)
+        self.count = slots
+
+        # Attached to by the encoder, so both use the same resource tracker.
+        resource_tracker.ensure_running()
+
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("fork" if "fork" in methods else "spawn")
+        self.messages = context.Queue(slots + 2)
+        self.free = context.Queue()
+        self.results = context.Queue()
+        self.process = context.Process(target=encodeFrames, daemon=True,
+                                       args=(path, self.file_format, fps, scale, self.messages, self.free,
+                                             self.results))
+        self.process.start()
+
+        # Slots are created with the first frame.
+        self.shape = None
+        self.memory = None
+        self.slots = None
+        self.available = []
+
+        self.queued = 0
+        self.dropped = 0
+        self.mismatched = 0
+        self.result = None
+
+    # Hand an image (height, width, channels, uint8) shown from time (in
+    # seconds) on to the encoder. With block False, the image is dropped if no
+    # slot is free. Returns True if it was handed on.
+    def submit(self, image, time, block=False):
+        if (self.shape is None):
+            self.open(image.shape)
+        elif (image.shape != self.shape):
+            self.mismatched += 1
+            return False
+
+        slot = self.takeSlot(block)
+        if (slot is None):
+            self.dropped += 1
+            return False
+
+        self.slots[slot] = image
+        self.messages.put(("frame", slot, time))
+        self.queued += 1
+        return True
+
+    def open(self, shape):
+        self.shape = tuple(shape)
+        self.memory = shared_memory.SharedMemory(create=True, size=self.count * int(numpy.prod(shape)))
+        self.slots = numpy.ndarray((self.count, ) + self.shape, dtype=numpy.uint8, buffer=self.memory.buf)
+        self.available = list(range(self.count))
+        self.messages.put(("open", self.memory.name, self.shape, self.count))
+
+    # Returns a free slot, None if there is none (and block is False).
+    def takeSlot(self, block):
+        try:
+            while (True):
+                self.available.append(self.free.get_nowait())
+        except queue.Empty:
+            pass
+
+        if (not self.available and block):
+            self.available.append(self.free.get())
+
+        if (self.available):
+            return self.available.pop()
+        return None
+
+    # Encode all frames handed on, close the file and end the encoder.
+    # Returns the statistics (see stats()).
+    def close(self):
+        if (self.result is None):
+            self.messages.put(None)
+            self.result = self.results.get()
+            self.process.join()
+
+            self.slots = None
+            if (self.memory is not None):
+                self.memory.close()
+                self.memory.unlink()
+
+        return self.stats()
+
+    # Frames submitted, handed on to the encoder, dropped because the encoder
+    # was busy, dropped because their size differed, and (after close()) those
+    # written to the file and skipped because nothing changed.
+    def stats(self):
+        stats = {"format": self.file_format, "path": self.path,
+                 "submitted": self.queued + self.dropped + self.mismatched,
+                 "queued": self.queued, "dropped": self.dropped, "mismatched": self.mismatched}
+        if (self.result is not None):
+            stats.update(self.result)
+        return stats
@@ -0,0 +1,166 @@
+# Version:	1.0
+# Author:	Vincent Diener - diener@teco.edu
+
+import struct
+import numpy
+
+from modules.frame_format.frame_format import formatFromHandshake
+
+# Highest protocol version supported by the emulator.
+# Version 1: every frame is sent as raw bytes (576 for 24x24 red LEDs, see
+#            modules/frame_format/frame_format.py).
+# Version 2: every frame is sent as a packet: encoding (1 byte), payload
+#            length (uint16, big endian) and the payload. A device asks for
+#            version 2 with the version byte of its handshake. The response
+#            then carries a third byte with the accepted version. Devices
+#            that send version 1 get the old two byte response.
+#            Frames larger than MAX_PACKET_PAYLOAD bytes (e.g. 148x148 RGB)
+#            do not fit into a packet and always use version 1.
+PROTOCOL_VERSION = 2
+
+# Packet header of protocol version 2.
+PACKET_HEADER = struct.Struct(">BH")
+
+# Frame encodings of protocol version 2.
+# RAW: the frame as in version 1 (576 bytes for 24x24 red LEDs).
+# BITS: 1 bit per byte of the frame (72 bytes for 24x24 red LEDs), most
+#       significant bit first. 1 is full brightness (255), 0 is off.
+#       For the common binary on/off patterns.
+# RLE: run length encoded (count, value) byte pairs, count 1 to 255.
+# DELTA: XOR against the previous frame, run length encoded like RLE.
+#        Needs a previous frame, so devices send a RAW, BITS or RLE
+#        keyframe first and then periodically (see KEYFRAME_INTERVAL).
+ENCODING_RAW = 0
+ENCODING_BITS = 1
+ENCODING_RLE = 2
+ENCODING_DELTA = 3
+
+# Devices should send a keyframe at least every this many frames.
+KEYFRAME_INTERVAL = 30
+
+# Size of one frame of the original 24x24 red LEDs.
+FRAME_SIZE = 576
+
+# Largest payload the packet header can describe.
+MAX_PACKET_PAYLOAD = 0xFFFF
+
+
+# Largest payload accepted for frames of the given size (RLE worst case).
+def maxPayload(frame_size):
+    return min(2 * frame_size, MAX_PACKET_PAYLOAD)
+
+
+# Largest packet a device sends for frames of the given size: the raw frame
+# in version 1, a RAW packet in version 2 (encode() never picks a larger
+# encoding).
+def maxPacket(frame_size, version):
+    if (version >= 2):
+        return PACKET_HEADER.size + frame_size
+    return frame_size
+
+
+# Protocol version used with a device, given its handshake.
+def protocolVersion(handshake):
+    if (formatFromHandshake(handshake).frame_size > MAX_PACKET_PAYLOAD):
+        return 1
+    return min(max(handshake.version, 1), PROTOCOL_VERSION)
+
+
+# Decodes version 2 packets into raw frames of frame_size bytes. Keeps the
+# previous frame for DELTA packets, so there is one codec per device.
+# Also encodes frames, for devices and tools that send version 2.
+class FrameCodec:
+    def __init__(self, frame_size=FRAME_SIZE):
+        self.frame_size = frame_size
+
+        # Last decoded frame (for DELTA), None until the first keyframe.
+        self.previous = None
+        self.frame = numpy.zeros(frame_size, dtype=numpy.uint8)
+
+        # Number of packets that could not be decoded.
+        self.errors = 0
+
+        # Frames encoded since the last keyframe (encoder side).
+        self.since_keyframe = 0
+
+    # Decode one packet payload. Returns the raw frame bytes (valid until
+    # the next call) or None if the packet is malformed.
+    def decode(self, encoding, payload):
+        payload = numpy.frombuffer(payload, dtype=numpy.uint8)
+
+        if (encoding == ENCODING_RAW and payload.size == self.frame_size):
+            self.frame[:] = payload
+        elif (encoding == ENCODING_BITS and payload.size == (self.frame_size + 7) // 8):
+            numpy.multiply(numpy.unpackbits(payload, count=self.frame_size), 255, out=self.frame)
+        elif (encoding == ENCODING_RLE and self.runLengthDecode(payload, self.frame)):
+            pass
+        elif (encoding == ENCODING_DELTA and self.previous is not None and
+              self.runLengthDecode(payload, self.frame)):
+            numpy.bitwise_xor(self.frame, self.previous, out=self.frame)
+        else:
+            self.errors += 1
+            return None
+
+        if (self.previous is None):
+            self.previous = numpy.zeros(self.frame_size, dtype=numpy.uint8)
+        self.previous[:] = self.frame
+
+        return self.frame
+
+    # Expand (count, value) pairs into out. Returns False if they do not
+    # add up to exactly one frame.
+    def runLengthDecode(self, payload, out):
+        if (payload.size % 2 != 0):
+            return False
+
+        counts = payload[0::2]
+        if (int(counts.sum()) != out.size):
+            return False
+
+        out[:] = numpy.repeat(payload[1::2], counts)
+        return True
+
+    # Encode one frame (frame_size bytes) into a complete version 2 packet.
+    # Picks the smallest encoding, but sends a keyframe every KEYFRAME_INTERVAL frames.
+    def encode(self, frame):
+        frame = numpy.frombuffer(bytes(frame), dtype=numpy.uint8)
+
+        candidates = [(ENCODING_RAW, frame.tobytes()), (ENCODING_RLE, self.runLengthEncode(frame))]
+
+        # Only binary frames can be packed to one bit per LED.
+        if (numpy.all((frame == 0) | (frame == 255))):
+            candidates.append((ENCODING_BITS, numpy.packbits(frame == 255).tobytes()))
+
+        if (self.previous is not None and self.since_keyframe < KEYFRAME_INTERVAL - 1):
+            candidates.append((ENCODING_DELTA, self.runLengthEncode(frame ^ self.previous)))
+
+        encoding, payload = min(candidates, key=lambda c: len(c[1]))
+
+        if (encoding == ENCODING_DELTA):
+            self.since_keyframe += 1
+        else:
+            self.since_keyframe = 0
+
+        if (self.previous is None):
+            self.previous = numpy.zeros(self.frame_size, dtype=numpy.uint8)
+        self.previous[:] = frame
+
+        return PACKET_HEADER.pack(encoding, len(payload)) + payload
+
+    # Encode a frame as (count, value) pairs.
+    def runLengthEncode(self, frame):
+        # Start index of every run of equal values.
+        starts = numpy.flatnonzero(numpy.concatenate(([True], frame[1:] != frame[:-1])))
+        lengths = numpy.diff(numpy.append(starts, frame.size))
+
+        # Runs longer than 255 are split.
+        pieces = (lengths + 254) // 255
+        values = numpy.repeat(frame[starts], pieces)
+        counts = numpy.full(values.size, 255, dtype=numpy.uint8)
+        last = numpy.cumsum(pieces) - 1
+        counts[last] = lengths - (pieces - 1) * 255
+
+        pairs = numpy.empty(2 * values.size, dtype=numpy.uint8)
+        pairs[0::2] = counts
+        pairs[1::2] = values
+        return pairs.tobytes()
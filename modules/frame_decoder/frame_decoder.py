@@ -0,0 +1,144 @@
+# Version:	1.0
+# Author:	Vincent Diener - diener@teco.edu
+
+from modules.frame_codec.frame_codec import FrameCodec, PACKET_HEADER, maxPayload, protocolVersion
+from modules.frame_format.frame_format import formatFromHandshake, DEFAULT_FORMAT
+
+# Size of one frame in bytes (24x24 red values) of devices that do not
+# send their size.
+FRAME_SIZE = DEFAULT_FORMAT.frame_size
+
+# Number of frames the receive ring can hold.
+RING_SLOTS = 4
+
+
+# Raised if a device sends something that cannot be framed.
+# The connection has to be closed, as the stream is out of sync.
+class ProtocolError(ValueError):
+    pass
+
+
+# Returns the decoder for a device, given its handshake: for the protocol
+# version (see frame_codec) and frame size (see frame_format) it asked for.
+def createDecoder(handshake):
+    frame_size = formatFromHandshake(handshake).frame_size
+    if (protocolVersion(handshake) >= 2):
+        return PacketDecoder(frame_size)
+    return FrameDecoder(frame_size)
+
+
+# Reassembles frames from a byte stream.
+# Data is received straight into a preallocated ring of frame slots, so a
+# frame that arrives split across several reads is put back together
+# without copying. Every read is limited to the rest of the current frame,
+# so a frame never straddles two slots.
+class FrameDecoder:
+    def __init__(self, frame_size=FRAME_SIZE, slots=RING_SLOTS):
+        self.frame_size = frame_size
+        self.slots = slots
+
+        # The ring buffer and a view on it.
+        self.ring = bytearray(frame_size * slots)
+        self.view = memoryview(self.ring)
+
+        # Slot that is currently filled and how many bytes it already holds.
+        self.slot = 0
+        self.fill = 0
+
+    # Returns the part of the ring the next read should go into.
+    def writeView(self):
+        start = self.slot * self.frame_size + self.fill
+        return self.view[start:(self.slot + 1) * self.frame_size]
+
+    # Mark n bytes of the write view as received.
+    # Returns a view on the completed frame, or None if it is still partial.
+    # The view stays valid until the ring wraps around (slots - 1 frames later).
+    def commit(self, n):
+        self.fill += n
+        if (self.fill < self.frame_size):
+            return None
+
+        start = self.slot * self.frame_size
+        frame = self.view[start:start + self.frame_size]
+
+        # Continue with the next slot.
+        self.slot = (self.slot + 1) % self.slots
+        self.fill = 0
+
+        return frame
+
+    # Read from a blocking socket until a frame is complete.
+    # Returns a view on the frame, or None if the connection was closed.
+    def recvFrame(self, sock):
+        while (True):
+            target = self.writeView()
+
+            # Not all socket types (e.g. some PyBluez versions) provide recv_into.
+            if (hasattr(sock, 'recv_into')):
+                n = sock.recv_into(target)
+            else:
+                chunk = sock.recv(len(target))
+                n = len(chunk)
+                target[:n] = chunk
+
+            # Broken connection might result in empty buffer getting read over and over again.
+            # An empty read means the connection is closed.
+            if (n == 0):
+                return None
+
+            frame = self.commit(n)
+            if (frame is not None):
+                return frame
+
+
+# Reassembles version 2 packets (see frame_codec) from a byte stream and
+# decodes them into raw frames. Reads go straight into the header and payload
+# buffers and are limited to the rest of the current packet.
+class PacketDecoder(FrameDecoder):
+    def __init__(self, frame_size=FRAME_SIZE):
+        self.max_payload = maxPayload(frame_size)
+        self.header = bytearray(PACKET_HEADER.size)
+        self.payload = bytearray(self.max_payload)
+        self.header_view = memoryview(self.header)
+        self.payload_view = memoryview(self.payload)
+
+        # Encoding of the current packet, None while its header is read.
+        self.encoding = None
+
+        # Bytes received and needed for the current header or payload.
+        self.fill = 0
+        self.size = PACKET_HEADER.size
+
+        self.codec = FrameCodec(frame_size)
+
+    def writeView(self):
+        if (self.encoding is None):
+            return self.header_view[self.fill:self.size]
+        return self.payload_view[self.fill:self.size]
+
+    # Mark n bytes of the write view as received.
+    # Returns the decoded frame once a packet is complete, otherwise None.
+    # Packets that are well framed but cannot be decoded are skipped.
+    def commit(self, n):
+        self.fill += n
+        if (self.fill < self.size):
+            return None
+
+        if (self.encoding is None):
+            # Header complete, continue with the payload.
+            self.encoding, self.size = PACKET_HEADER.unpack(self.header)
+            self.fill = 0
+
+            if (self.size > self.max_payload):
+                raise ProtocolError("Packet too large: " + str(self.size) + " bytes.")
+            if (self.size > 0):
+                return None
+
+        frame = self.codec.decode(self.encoding, self.payload_view[:self.size])
+
+        # Continue with the next header.
+        self.encoding = None
+        self.fill = 0
+        self.size = PACKET_HEADER.size
+
+        return frame
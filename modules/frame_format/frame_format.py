@@ -0,0 +1,71 @@
+# Version:	1.0
+# Author:	Vincent Diener - diener@teco.edu
+
+import numpy
+
+# Color modes a device can ask for with the colorMode byte of its handshake.
+# RED: one byte per LED, shown in red like on the real Connection Machine.
+# GRAYSCALE: one byte per LED, shown in white.
+# RGB: three bytes per LED (red, green, blue).
+COLOR_RED = 0
+COLOR_GRAYSCALE = 1
+COLOR_RGB = 2
+
+# Bytes per LED and name of every color mode.
+CHANNELS = {COLOR_RED: 1, COLOR_GRAYSCALE: 1, COLOR_RGB: 3}
+COLOR_NAMES = {COLOR_RED: "red", COLOR_GRAYSCALE: "grayscale", COLOR_RGB: "RGB"}
+
+# All formats created so far, see frameFormat().
+formats = {}
+
+
+# Size and color mode of the LED matrix of a device, as sent in its handshake.
+# Frames are sent row by row, from the top row to the bottom one and every
+# row from left to right. The values of one LED are next to each other.
+# Decoded matrices (e.g. BTHelper.matrix) keep that order, so they can be
+# uploaded to a texture as they are: uint8 values (0 to 255), value c of
+# the LED in column x of row r (counted from the top) is at index
+# (width * r + x) * channels + c.
+# Formats are shared (see frameFormat()), so they can be compared with "is".
+class FrameFormat:
+    def __init__(self, width, height, color_mode):
+        self.width = width
+        self.height = height
+        self.color_mode = color_mode
+        self.channels = CHANNELS[color_mode]
+
+        # Number of LEDs, and of values in a decoded matrix.
+        # Every value is sent as one byte, so values is also the frame size in bytes.
+        self.leds = width * height
+        self.values = self.leds * self.channels
+        self.frame_size = self.values
+
+    # Short description, e.g. "24x24 red".
+    def describe(self):
+        return str(self.width) + "x" + str(self.height) + " " + COLOR_NAMES[self.color_mode]
+
+    # Copy one received frame into the given uint8 array.
+    # data can be bytes, a bytearray or a memoryview.
+    def decode(self, data, out):
+        out[:] = numpy.frombuffer(data, dtype=numpy.uint8, count=self.frame_size)
+
+
+# Returns the format of the given size and color mode.
+def frameFormat(width, height, color_mode):
+    key = (width, height, color_mode)
+    if (key not in formats):
+        formats[key] = FrameFormat(width, height, color_mode)
+    return formats[key]
+
+
+# Format of the original Connection Machine: 24x24 red LEDs.
+DEFAULT_FORMAT = frameFormat(24, 24, COLOR_RED)
+
+
+# Returns the format a device asked for in its handshake.
+# Sizes of 0 and unknown color modes fall back to those of DEFAULT_FORMAT.
+def formatFromHandshake(handshake):
+    width = handshake.xSize or DEFAULT_FORMAT.width
+    height = handshake.ySize or DEFAULT_FORMAT.height
+    color_mode = handshake.colorMode if handshake.colorMode in CHANNELS else DEFAULT_FORMAT.color_mode
+    return frameFormat(width, height, color_mode)
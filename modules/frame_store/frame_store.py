@@ -0,0 +1,64 @@
+# Version:	1.0
+# Author:	Vincent Diener - diener@teco.edu
+
+import numpy
+
+
+# Triple buffered frame exchange between one writer (the reader thread of a
+# transport) and one reader (the render thread).
+# The writer fills the back buffer and publishes it as a whole, the reader
+# always picks up the newest complete frame. Neither side locks or copies:
+# publishing and picking up are single reference assignments, which are
+# atomic in CPython. Every published frame gets the next sequence number,
+# so the reader can tell whether anything changed since its last pick-up.
+class FrameStore:
+    def __init__(self, size=576, dtype=numpy.uint8):
+        self.buffers = [numpy.zeros(size, dtype=dtype) for x in range(3)]
+
+        # Index of the newest complete frame and its sequence number.
+        # Replaced as one tuple, so the reader always sees a matching pair.
+        self.front = (0, 0)
+
+        # Buffer the writer fills next.
+        self.back = 1
+
+        # Buffer the reader currently uses. The writer never touches it.
+        self.reading = 0
+
+    # Writer: returns the buffer to fill with the next frame.
+    def writeBuffer(self):
+        return self.buffers[self.back]
+
+    # Writer: make the filled buffer the newest frame.
+    def publish(self):
+        published = self.back
+        self.front = (published, self.front[1] + 1)
+
+        # Continue with the buffer that is neither published nor in use by the reader.
+        reading = self.reading
+        for index in range(3):
+            if (index != published and index != reading):
+                self.back = index
+                break
+
+    # Reader: returns (sequence number, buffer) of the newest frame.
+    # The buffer stays valid until the next call.
+    def acquire(self):
+        while (True):
+            index, seq = self.front
+            self.reading = index
+
+            # If the writer published in between, it may have picked this
+            # buffer as its next back buffer. Try again in that case.
+            if (self.front[0] == index):
+                return seq, self.buffers[index]
+
+    # Called by the render thread at every display update.
+    # Frames are shown as soon as they are published, so there is nothing to do.
+    # See JitterBuffer for a store that paces frames.
+    def tick(self, now=None):
+        pass
+
+    # Sequence number of the newest frame, without picking it up.
+    def sequence(self):
+        return self.front[1]
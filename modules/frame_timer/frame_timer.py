@@ -0,0 +1,79 @@
+# Version:	1.0
+# Author:	Vincent Diener - diener@teco.edu
+
+import time as t
+
+from collections import deque
+from pyglet.gl import *
+from ctypes import *
+
+# Frames measured on the GPU at the same time. Results are only read once
+# the GPU is done with a frame, so measuring never makes the CPU wait.
+QUERY_RING = 4
+
+# GPU times longer than this (in seconds) are dropped. Some drivers
+# return garbage for the first query.
+MAX_GPU_TIME = 1.0
+
+
+# Measures how long frames take on the CPU (wall clock between begin() and
+# end()) and on the GPU (timer queries, GL_TIME_ELAPSED). GPU times arrive
+# a few frames later. If all queries are still in use, frames only get a
+# CPU time.
+class FrameTimer:
+    def __init__(self, ring=QUERY_RING):
+        self.queries = (GLuint * ring)()
+        glGenQueries(ring, self.queries)
+        self.free = deque(self.queries)
+
+        # Frames measured on the GPU, oldest first: (query, CPU time).
+        self.pending = deque()
+
+        # Measured frames: (CPU seconds, GPU seconds or None).
+        self.done = []
+
+        self.time_begin = 0.0
+        self.query = None
+
+    def begin(self):
+        self.time_begin = t.perf_counter()
+        self.query = self.free.popleft() if self.free else None
+        if (self.query is not None):
+            glBeginQuery(GL_TIME_ELAPSED, self.query)
+
+    def end(self):
+        cpu = t.perf_counter() - self.time_begin
+        if (self.query is not None):
+            glEndQuery(GL_TIME_ELAPSED)
+            self.pending.append((self.query, cpu))
+        else:
+            self.done.append((cpu, None))
+
+        self.collect()
+
+    # Read the results of all queries the GPU is done with, in order.
+    def collect(self):
+        available = GLuint()
+        elapsed = GLuint64()
+
+        while (self.pending):
+            query, cpu = self.pending[0]
+            glGetQueryObjectuiv(query, GL_QUERY_RESULT_AVAILABLE, byref(available))
+            if (not available.value):
+                break
+
+            glGetQueryObjectui64v(query, GL_QUERY_RESULT, byref(elapsed))
+            gpu = elapsed.value / 1e9
+            self.done.append((cpu, gpu if gpu <= MAX_GPU_TIME else None))
+
+            self.pending.popleft()
+            self.free.append(query)
+
+    # Returns the frames measured since the last call as (CPU, GPU) seconds.
+    def results(self):
+        done = self.done
+        self.done = []
+        return done
+
+    def delete(self):
+        glDeleteQueries(len(self.queries), self.queries)
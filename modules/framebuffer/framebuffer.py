@@ -0,0 +1,123 @@
+# Version:	1.0
+# Author:	Vincent Diener - diener@teco.edu
+
+from pyglet.gl import *
+from ctypes import *
+
+
+# Offscreen framebuffer object with a color texture and a depth buffer.
+# The scene is rendered into it, and a post processing shader then samples
+# the color texture directly, without reading anything back from the GPU.
+# The texture has exactly the size of the framebuffer, so it is sampled
+# with texture coordinates from 0.0 to 1.0.
+# With samples > 0 (anti-aliasing), the scene is rendered into multisampled
+# renderbuffers instead, and resolve() copies them into the texture.
+class Framebuffer:
+    def __init__(self, width, height, samples=0):
+        self.width = 0
+        self.height = 0
+
+        self.fbo = GLuint()
+        self.texture = GLuint()
+        self.depth = GLuint()
+        glGenFramebuffers(1, byref(self.fbo))
+        glGenTextures(1, byref(self.texture))
+        glGenRenderbuffers(1, byref(self.depth))
+
+        # Multisampled framebuffer with color and depth renderbuffers.
+        self.samples = 0
+        if (samples > 0):
+            max_samples = GLint()
+            glGetIntegerv(GL_MAX_SAMPLES, byref(max_samples))
+            self.samples = min(samples, max_samples.value)
+
+        if (self.samples > 0):
+            self.fbo_multisample = GLuint()
+            self.color_multisample = GLuint()
+            self.depth_multisample = GLuint()
+            glGenFramebuffers(1, byref(self.fbo_multisample))
+            glGenRenderbuffers(1, byref(self.color_multisample))
+            glGenRenderbuffers(1, byref(self.depth_multisample))
+
+        self.resize(width, height)
+
+    # (Re)allocate color texture and depth buffer for the given size.
+    # Call from on_resize. Does nothing if the size did not change.
+    # Sizes of 0 (e.g. a minimized window) are allocated as 1 pixel, an
+    # empty framebuffer is incomplete.
+    def resize(self, width, height):
+        width = max(width, 1)
+        height = max(height, 1)
+        if (width == self.width and height == self.height):
+            return
+
+        self.width = width
+        self.height = height
+
+        # Color texture, filtered as post processing samples between pixels.
+        glBindTexture(GL_TEXTURE_2D, self.texture)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_EDGE)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP_TO_EDGE)
+        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA8, width, height, 0, GL_RGBA, GL_UNSIGNED_BYTE, None)
+        glBindTexture(GL_TEXTURE_2D, 0)
+
+        # Depth buffer.
+        glBindRenderbuffer(GL_RENDERBUFFER, self.depth)
+        glRenderbufferStorage(GL_RENDERBUFFER, GL_DEPTH_COMPONENT24, width, height)
+        glBindRenderbuffer(GL_RENDERBUFFER, 0)
+
+        # Attach both.
+        glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+        glFramebufferTexture2D(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_TEXTURE_2D, self.texture, 0)
+        glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_DEPTH_ATTACHMENT, GL_RENDERBUFFER, self.depth)
+        self.checkStatus()
+
+        if (self.samples > 0):
+            for renderbuffer, internal_format in ((self.color_multisample, GL_RGBA8),
+                                                  (self.depth_multisample, GL_DEPTH_COMPONENT24)):
+                glBindRenderbuffer(GL_RENDERBUFFER, renderbuffer)
+                glRenderbufferStorageMultisample(GL_RENDERBUFFER, self.samples, internal_format, width, height)
+            glBindRenderbuffer(GL_RENDERBUFFER, 0)
+
+            glBindFramebuffer(GL_FRAMEBUFFER, self.fbo_multisample)
+            glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_RENDERBUFFER, self.color_multisample)
+            glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_DEPTH_ATTACHMENT, GL_RENDERBUFFER, self.depth_multisample)
+            self.checkStatus()
+
+    # Raises if the bound framebuffer is incomplete, unbinds it otherwise.
+    def checkStatus(self):
+        status = glCheckFramebufferStatus(GL_FRAMEBUFFER)
+        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+
+        if (status != GL_FRAMEBUFFER_COMPLETE):
+            raise RuntimeError("Framebuffer incomplete (status " + hex(status) + ").")
+
+    # Render into the framebuffer.
+    def bind(self):
+        glBindFramebuffer(GL_FRAMEBUFFER, self.fbo_multisample if self.samples > 0 else self.fbo)
+
+    # Copy the multisampled rendering into the texture, averaging the samples
+    # of every pixel. Call after rendering, before the texture is used.
+    def resolve(self):
+        if (self.samples > 0):
+            glBindFramebuffer(GL_READ_FRAMEBUFFER, self.fbo_multisample)
+            glBindFramebuffer(GL_DRAW_FRAMEBUFFER, self.fbo)
+            glBlitFramebuffer(0, 0, self.width, self.height, 0, 0, self.width, self.height, GL_COLOR_BUFFER_BIT,
+                              GL_NEAREST)
+            glBindFramebuffer(GL_FRAMEBUFFER, 0)
+
+    # Render into the window again.
+    def unbind(self):
+        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+
+    def delete(self):
+        glDeleteFramebuffers(1, byref(self.fbo))
+        glDeleteTextures(1, byref(self.texture))
+        glDeleteRenderbuffers(1, byref(self.depth))
+
+        if (self.samples > 0):
+            glDeleteFramebuffers(1, byref(self.fbo_multisample))
+            glDeleteRenderbuffers(1, byref(self.color_multisample))
+            glDeleteRenderbuffers(1, byref(self.depth_multisample))
@@ -0,0 +1,186 @@
+# Version:	1.0
+# Author:	Vincent Diener - diener@teco.edu
+
+import numpy
+
+from pyglet.gl import *
+from ctypes import *
+
+# Floats per vertex: position (x, y, z), normal (x, y, z), texture coordinate (u, v).
+VERTEX_FLOATS = 8
+VERTEX_STRIDE = VERTEX_FLOATS * 4
+
+# Corners of the six faces of a cube with edge length 2 (top, bottom, front,
+# back, left, right), four corners per face in drawing order.
+CUBE_CORNERS = numpy.array([
+    [[1, 1, -1], [-1, 1, -1], [-1, 1, 1], [1, 1, 1]],
+    [[1, -1, -1], [-1, -1, -1], [-1, -1, 1], [1, -1, 1]],
+    [[1, 1, 1], [-1, 1, 1], [-1, -1, 1], [1, -1, 1]],
+    [[1, -1, -1], [-1, -1, -1], [-1, 1, -1], [1, 1, -1]],
+    [[-1, 1, 1], [-1, 1, -1], [-1, -1, -1], [-1, -1, 1]],
+    [[1, 1, 1], [1, 1, -1], [1, -1, -1], [1, -1, 1]]], dtype=numpy.float32)
+
+# Texture coordinates of the four corners of every quad.
+QUAD_TEXCOORDS = numpy.array([[0, 0], [1, 0], [1, 1], [0, 1]], dtype=numpy.float32)
+
+# Half the edge length of the ground quad, times d.
+GROUND_SIZE = 4.66
+
+# Vertices of the two triangles every quad is split into for the core profile,
+# which has no GL_QUADS. Same winding as the quad.
+QUAD_TRIANGLES = numpy.array([0, 1, 2, 0, 2, 3])
+
+# Attribute locations of position, normal and texture coordinate in the
+# core profile shaders (shaders/core).
+ATTRIBUTE_POSITION = 0
+ATTRIBUTE_NORMAL = 1
+ATTRIBUTE_TEXCOORD = 2
+
+
+# Return quads for cubes with the given sizes (n, 3) along x, y and z,
+# centered at the given positions (n, 3), as vertex array (n * 24, VERTEX_FLOATS).
+def cubes(sizes, positions):
+    sizes = numpy.asarray(sizes, dtype=numpy.float32).reshape(-1, 1, 1, 3)
+    positions = numpy.asarray(positions, dtype=numpy.float32).reshape(-1, 1, 1, 3)
+
+    corners = CUBE_CORNERS * (sizes / 2.0)
+
+    # Normal of each face, not normalized (the shaders normalize).
+    normals = numpy.cross(corners[:, :, 0] - corners[:, :, 1], corners[:, :, 0] - corners[:, :, 2])
+
+    vertices = numpy.empty(corners.shape[:3] + (VERTEX_FLOATS, ), dtype=numpy.float32)
+    vertices[..., 0:3] = corners + positions
+    vertices[..., 3:6] = normals[:, :, numpy.newaxis, :]
+    vertices[..., 6:8] = QUAD_TEXCOORDS
+    return vertices.reshape(-1, VERTEX_FLOATS)
+
+
+# Return ground quads at the given heights, centered at x and z,
+# as vertex array (len(heights) * 4, VERTEX_FLOATS).
+def groundQuads(heights, x, z, d):
+    g = GROUND_SIZE * d
+    heights = numpy.asarray(heights, dtype=numpy.float32).reshape(-1, 1)
+
+    vertices = numpy.empty((len(heights), 4, VERTEX_FLOATS), dtype=numpy.float32)
+    vertices[:, :, 0] = x + numpy.array([g, g, -g, -g])
+    vertices[:, :, 1] = heights
+    vertices[:, :, 2] = z + numpy.array([-g, g, g, -g])
+    # The ground was always lit with the default normal (0, 0, 1).
+    # Kept, so it looks the same.
+    vertices[:, :, 3:6] = (0.0, 0.0, 1.0)
+    vertices[:, :, 6:8] = QUAD_TEXCOORDS
+    return vertices.reshape(-1, VERTEX_FLOATS)
+
+
+# Return a flat quad from (left, bottom) to (right, top) at depth z, facing
+# the viewer, textured from (0, 0) to (1, 1), as vertex array (4, VERTEX_FLOATS).
+def quad(left, bottom, right, top, z):
+    vertices = numpy.zeros((4, VERTEX_FLOATS), dtype=numpy.float32)
+    vertices[:, 0:3] = [[left, bottom, z], [right, bottom, z], [right, top, z], [left, top, z]]
+    vertices[:, 5] = 1.0
+    vertices[:, 6:8] = QUAD_TEXCOORDS
+    return vertices
+
+
+# Return the parts of one Connection Machine of size d standing at (x, z),
+# as dictionary of vertex arrays:
+# "metal_0" center cube and stand, "metal_1" the 8 main cubes and "ground"
+# the ground quad (used by the simple and the detailed floor).
+def machineParts(d, x=0.0, z=0.0):
+    offset = numpy.array([x, 0.0, z], dtype=numpy.float32)
+
+    # Center cube and stand.
+    metal_0 = cubes([[3.33 * d, 3.33 * d, 3.33 * d], [2.833 * d, 0.5 * d, 2.833 * d]],
+                    numpy.array([[0, 0, 0], [0, -1.9 * d, 0]]) + offset)
+
+    # 4 cubes facing front, then 4 facing back.
+    corners = numpy.array([[1, 1, 1], [-1, 1, 1], [1, -1, 1], [-1, -1, 1],
+                           [1, 1, -1], [-1, 1, -1], [1, -1, -1], [-1, -1, -1]], dtype=numpy.float32)
+    metal_1 = cubes(numpy.full((8, 3), 1.666 * d), corners * d + offset)
+
+    return {"metal_0": metal_0,
+            "metal_1": metal_1,
+            "ground": groundQuads([-2.2 * d + 11.0 * 0.004], x, z, d)}
+
+
+# Static geometry in a single vertex buffer object, drawn part by part.
+# All parts share one interleaved vertex array, so switching between them
+# only changes the range passed to glDrawArrays.
+# With core True (OpenGL 3.3 core profile), the quads are split into
+# triangles and the vertex layout is kept in a vertex array object, for the
+# generic attributes of the shaders in shaders/core. Otherwise the quads
+# are drawn with the fixed function vertex arrays.
+class GeometryBuffer:
+    def __init__(self, core=False):
+        self.core = core
+        self.vbo = GLuint()
+        glGenBuffers(1, byref(self.vbo))
+
+        # First vertex and vertex count of every part.
+        self.ranges = {}
+
+        self.vao = None
+        if (core):
+            self.vao = GLuint()
+            glGenVertexArrays(1, byref(self.vao))
+            glBindVertexArray(self.vao)
+            glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+            for location, size, offset in ((ATTRIBUTE_POSITION, 3, 0), (ATTRIBUTE_NORMAL, 3, 3),
+                                           (ATTRIBUTE_TEXCOORD, 2, 6)):
+                glEnableVertexAttribArray(location)
+                glVertexAttribPointer(location, size, GL_FLOAT, GL_FALSE, VERTEX_STRIDE, offset * 4)
+            glBindVertexArray(0)
+            glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    # Replace the content with the given parts (list of dictionaries as
+    # returned by machineParts). Parts with the same name are merged.
+    def upload(self, parts_list):
+        names = []
+        for parts in parts_list:
+            names += [name for name in parts if name not in names]
+
+        arrays = []
+        first = 0
+        for name in names:
+            array = numpy.concatenate([parts[name] for parts in parts_list if name in parts])
+            if (self.core):
+                array = array.reshape(-1, 4, VERTEX_FLOATS)[:, QUAD_TRIANGLES].reshape(-1, VERTEX_FLOATS)
+            self.ranges[name] = (first, len(array))
+            first += len(array)
+            arrays.append(array)
+
+        vertices = numpy.ascontiguousarray(numpy.concatenate(arrays), dtype=numpy.float32)
+
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices.ctypes.data, GL_STATIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    # Set up the vertex arrays. Call before drawing parts.
+    def bind(self):
+        if (self.core):
+            glBindVertexArray(self.vao)
+            return
+
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glEnableClientState(GL_NORMAL_ARRAY)
+        glEnableClientState(GL_TEXTURE_COORD_ARRAY)
+        glVertexPointer(3, GL_FLOAT, VERTEX_STRIDE, 0)
+        glNormalPointer(GL_FLOAT, VERTEX_STRIDE, 3 * 4)
+        glTexCoordPointer(2, GL_FLOAT, VERTEX_STRIDE, 6 * 4)
+
+    # Reset the vertex arrays, so pyglet batches can be drawn again.
+    def unbind(self):
+        if (self.core):
+            glBindVertexArray(0)
+            return
+
+        glDisableClientState(GL_VERTEX_ARRAY)
+        glDisableClientState(GL_NORMAL_ARRAY)
+        glDisableClientState(GL_TEXTURE_COORD_ARRAY)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    # Draw the named part. bind() must have been called.
+    def draw(self, name):
+        first, count = self.ranges[name]
+        glDrawArrays(GL_TRIANGLES if self.core else GL_QUADS, first, count)
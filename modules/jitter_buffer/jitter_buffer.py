@@ -0,0 +1,170 @@
+# Version:	1.0
+# Author:	Vincent Diener - diener@teco.edu
+
+import time as t
+import numpy
+
+# Show the newest frame that is due, skip older ones. Lowest latency.
+POLICY_COALESCE = "coalesce"
+
+# Show every frame, one per tick, oldest first. Frames are only dropped
+# if the buffer overflows.
+POLICY_QUEUE = "queue"
+
+# Weight of a new measurement in the moving averages of frame intervals.
+SMOOTHING = 0.1
+
+# Ticks without new frames are only counted as duplicates if the device sent
+# something within this many seconds. Otherwise it is just idle.
+IDLE_TIME = 1.0
+
+
+# Jitter buffer and frame pacer for one device.
+# The reader thread stamps every frame with its arrival time and queues it.
+# The pacer (tick(), called by the render thread at every display update)
+# presents the queued frames at the measured cadence of the device, delayed
+# by a fixed playout delay, so bursty delivery does not show up as stutter.
+# Has the same interface as FrameStore: writeBuffer()/publish() for the
+# writer, acquire()/sequence() for the reader.
+# Frames live in a preallocated ring. The writer only advances written, the
+# reader only advances shown, so no locking is needed.
+class JitterBuffer:
+    def __init__(self, delay=0.1, capacity=16, policy=POLICY_COALESCE, size=576, dtype=numpy.uint8):
+        self.delay = delay
+        self.capacity = capacity
+        self.policy = policy
+
+        # The ring of frames and their arrival times.
+        self.buffers = [numpy.zeros(size, dtype=dtype) for x in range(capacity)]
+        self.arrival = numpy.zeros(capacity)
+
+        # Frames published (writer) and index of the presented frame (reader).
+        # The presented frame keeps its slot until the next one is shown.
+        self.written = 0
+        self.shown = -1
+
+        # Where the next frame will be written. Points to scratch if the ring is full.
+        self.scratch = numpy.zeros(size, dtype=dtype)
+        self.full = False
+
+        # Presentation time of each scheduled frame and number of scheduled frames.
+        self.due = numpy.zeros(capacity)
+        self.scheduled = 0
+
+        # Measured cadence: average time between frames of the device
+        # and between two ticks of the pacer.
+        self.interval = 0.0
+        self.tick_interval = 0.0
+        self.last_tick = None
+
+        # Increases every time another frame is presented.
+        self.present_seq = 0
+
+        # Statistics. overflowed is counted by the writer, the rest by the reader.
+        self.late = 0
+        self.dropped = 0
+        self.duplicated = 0
+        self.overflowed = 0
+
+    # Writer: returns the buffer to fill with the next frame.
+    def writeBuffer(self):
+        self.full = self.written - self.shown >= self.capacity
+        if (self.full):
+            return self.scratch
+        return self.buffers[self.written % self.capacity]
+
+    # Writer: timestamp the filled buffer and queue it.
+    def publish(self):
+        if (self.full):
+            self.overflowed += 1
+            return
+
+        self.arrival[self.written % self.capacity] = t.perf_counter()
+        self.written += 1
+
+    # Pacer: present the frame that is due at time now (time.perf_counter()).
+    def tick(self, now=None):
+        if (now is None):
+            now = t.perf_counter()
+
+        # Measure the cadence of the pacer.
+        if (self.last_tick is not None):
+            self.tick_interval += SMOOTHING * ((now - self.last_tick) - self.tick_interval)
+        self.last_tick = now
+
+        self.schedule()
+
+        # Find the frames that are due.
+        first = self.shown + 1
+        last = first
+        while (last < self.scheduled and self.due[last % self.capacity] <= now):
+            last += 1
+
+        if (last == first):
+            # Nothing due. If the device is active and a frame was expected
+            # by now, the presented frame is shown again.
+            if (self.shown >= 0 and self.written > 0):
+                expected = self.due[self.shown % self.capacity] + self.interval + self.tick_interval
+                recent = self.arrival[(self.written - 1) % self.capacity] > now - IDLE_TIME
+                if (now >= expected and recent):
+                    self.duplicated += 1
+            return
+
+        if (self.policy == POLICY_COALESCE):
+            # Show the newest due frame, the older ones are dropped.
+            self.dropped += last - first - 1
+            self.shown = last - 1
+        else:
+            # Show the oldest due frame.
+            self.shown = first
+
+        self.present_seq += 1
+
+    # Give all newly arrived frames a presentation time.
+    def schedule(self):
+        written = self.written
+        while (self.scheduled < written):
+            index = self.scheduled
+            arrival = self.arrival[index % self.capacity]
+
+            if (index == 0):
+                due = arrival + self.delay
+            else:
+                previous_arrival = self.arrival[(index - 1) % self.capacity]
+                previous_due = self.due[(index - 1) % self.capacity]
+
+                # Update the measured cadence of the device.
+                self.interval += SMOOTHING * ((arrival - previous_arrival) - self.interval)
+
+                # The frame should be shown one interval after the previous one.
+                due = previous_due + self.interval
+
+                if (arrival > due):
+                    # It arrived after its slot. Show it as soon as possible.
+                    self.late += 1
+                    due = arrival
+                elif (due > arrival + 2 * self.delay):
+                    # The device sped up and too much is buffered. Resync.
+                    due = arrival + self.delay
+
+            self.due[index % self.capacity] = due
+            self.scheduled += 1
+
+    # Reader: returns (sequence number, buffer) of the presented frame.
+    # The buffer stays valid until the next tick.
+    def acquire(self):
+        if (self.shown < 0):
+            return self.present_seq, self.scratch
+        return self.present_seq, self.buffers[self.shown % self.capacity]
+
+    # Sequence number of the presented frame.
+    def sequence(self):
+        return self.present_seq
+
+    # Statistics as a dictionary, e.g. for logging.
+    def stats(self):
+        return {"late": self.late,
+                "dropped": self.dropped + self.overflowed,
+                "duplicated": self.duplicated,
+                "fps_in": float(1.0 / self.interval) if self.interval > 0 else 0.0,
+                "fps_out": float(1.0 / self.tick_interval) if self.tick_interval > 0 else 0.0}
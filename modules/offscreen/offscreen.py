@@ -0,0 +1,128 @@
+# Version:	1.0
+# Author:	Vincent Diener - diener@teco.edu
+
+import numpy
+import pyglet
+
+from collections import deque
+from pyglet.gl import *
+from ctypes import *
+
+from modules.framebuffer.framebuffer import Framebuffer
+
+# Frames being read back at the same time. The oldest one is only waited
+# for when all pixel buffers are in use, by then the GPU is long done with it.
+READBACK_RING = 3
+
+# Nanoseconds to wait for a frame at most.
+READBACK_TIMEOUT = 10 * 1000 * 1000 * 1000
+
+
+# Reads frames back from a framebuffer through a ring of pixel buffer
+# objects. glReadPixels into a pixel buffer returns right away, the copy
+# happens on the GPU while the next frames are drawn.
+class PixelReader:
+    def __init__(self, width, height, ring=READBACK_RING):
+        self.width = width
+        self.height = height
+        self.frame_bytes = width * height * 4
+
+        self.pbos = (GLuint * ring)()
+        glGenBuffers(ring, self.pbos)
+        for pbo in self.pbos:
+            glBindBuffer(GL_PIXEL_PACK_BUFFER, pbo)
+            glBufferData(GL_PIXEL_PACK_BUFFER, self.frame_bytes, None, GL_STREAM_READ)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+
+        # Frames being read back, oldest first: (pixel buffer, fence, tag).
+        self.pending = deque()
+        self.next = 0
+
+    # Start reading back what was drawn to the framebuffer fbo (0 is the
+    # window). tag is returned with the frame. Returns the oldest frame as
+    # (tag, pixels) once all pixel buffers are in use, None before.
+    # pixels is a uint8 array (height, width, 4), RGBA, the top row first.
+    def read(self, fbo, tag=None):
+        frame = None
+        if (len(self.pending) == len(self.pbos)):
+            frame = self.finish()
+
+        pbo = self.pbos[self.next]
+        self.next = (self.next + 1) % len(self.pbos)
+
+        glBindFramebuffer(GL_READ_FRAMEBUFFER, fbo)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, pbo)
+        glPixelStorei(GL_PACK_ALIGNMENT, 4)
+        # With a pixel buffer bound, the pointer is an offset into it.
+        glReadPixels(0, 0, self.width, self.height, GL_RGBA, GL_UNSIGNED_BYTE, None)
+        fence = glFenceSync(GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+
+        self.pending.append((pbo, fence, tag))
+        return frame
+
+    # Wait for the oldest frame being read back and return it as (tag, pixels).
+    def finish(self):
+        pbo, fence, tag = self.pending.popleft()
+        glClientWaitSync(fence, GL_SYNC_FLUSH_COMMANDS_BIT, READBACK_TIMEOUT)
+        glDeleteSync(fence)
+
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, pbo)
+        pointer = glMapBufferRange(GL_PIXEL_PACK_BUFFER, 0, self.frame_bytes, GL_MAP_READ_BIT)
+        data = cast(pointer, POINTER(c_ubyte * self.frame_bytes)).contents
+        # OpenGL returns the bottom row first.
+        pixels = numpy.frombuffer(data, dtype=numpy.uint8).reshape(self.height, self.width, 4)[::-1].copy()
+        glUnmapBuffer(GL_PIXEL_PACK_BUFFER)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+
+        return tag, pixels
+
+    # Return all frames still being read back, oldest first.
+    def flush(self):
+        frames = []
+        while (self.pending):
+            frames.append(self.finish())
+        return frames
+
+    def delete(self):
+        self.flush()
+        glDeleteBuffers(len(self.pbos), self.pbos)
+
+
+# Renders a Scene into an offscreen framebuffer of the given size and reads
+# the frames back with a PixelReader. Only needs an OpenGL context, no
+# visible window.
+class OffscreenRenderer:
+    def __init__(self, scene, width, height, ring=READBACK_RING):
+        self.scene = scene
+        self.width = width
+        self.height = height
+
+        self.target = Framebuffer(width, height)
+        scene.resize(width, height)
+
+        self.reader = PixelReader(width, height, ring)
+
+    # Draw the scene and start reading it back. tag is returned with the frame.
+    # Returns the oldest frame as (tag, pixels) once all pixel buffers are
+    # in use, None before, see PixelReader.read().
+    def render(self, tag=None):
+        self.scene.draw(self.target.fbo.value)
+        return self.reader.read(self.target.fbo, tag)
+
+    # Return all frames still being read back, oldest first.
+    def flush(self):
+        return self.reader.flush()
+
+    def delete(self):
+        self.reader.delete()
+        self.target.delete()
+
+
+# Save pixels as returned by OffscreenRenderer (top row first) as PNG.
+def savePNG(path, pixels):
+    height, width = pixels.shape[:2]
+    # pyglet expects the bottom row first.
+    image = pyglet.image.ImageData(width, height, "RGBA", numpy.ascontiguousarray(pixels[::-1]).tobytes())
+    image.save(path)
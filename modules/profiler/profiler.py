@@ -0,0 +1,194 @@
+# Version:	1.0
+# Author:	Vincent Diener - diener@teco.edu
+
+import json
+import threading
+import time as t
+import pyglet
+import pyglet.shapes
+
+from collections import deque
+from pyglet.gl import *
+from ctypes import *
+
+# Events kept for the trace. When there are more, the oldest are dropped.
+MAX_EVENTS = 200000
+
+# GPU sections waiting for their results at most. Beyond that, new
+# sections are only measured on the CPU until the GPU caught up.
+MAX_PENDING = 1024
+
+# Weight of the newest measurement in the averages shown in the HUD.
+SMOOTHING = 0.1
+
+# Name of the GPU timeline in the trace and averages.
+GPU = "GPU"
+
+
+# Measures sections of code on the CPU and, with timestamp queries, what
+# they draw on the GPU. Code to measure is wrapped in begin() and end():
+#   section = profiler.begin("leds", "render", gpu=True)
+#   ...
+#   profiler.end(section)
+# CPU sections may be measured in any thread, GPU sections only where the
+# OpenGL context is current. GPU results are read a few frames later, when
+# the GPU is done, so measuring never makes the CPU wait. Timestamps
+# (glQueryCounter) are used instead of GL_TIME_ELAPSED queries, as those
+# can not be nested (e.g. in the whole frame measured by FrameTimer).
+# Code that may be profiled keeps a profiler attribute that is None when
+# profiling is off, so it costs nothing but a check then.
+class Profiler:
+    def __init__(self, max_events=MAX_EVENTS):
+        # Measured sections: (name, category, thread, start, duration), in
+        # seconds on the time.perf_counter() clock. GPU sections have thread GPU.
+        self.events = deque(maxlen=max_events)
+
+        # Smoothed duration in seconds by (name, thread), see averages().
+        self.smoothed = {}
+        self.lock = threading.Lock()
+
+        # GPU sections waiting for their results: (name, category, begin query, end query).
+        self.pending = deque()
+        self.free_queries = []
+
+        # GPU timestamps (nanoseconds) + offset = time.perf_counter(). Measured every frame.
+        self.gpu_offset = None
+
+    # Start a section. Returns the section to pass to end().
+    def begin(self, name, category, gpu=False):
+        queries = None
+        if (gpu and len(self.pending) < MAX_PENDING):
+            queries = (self.query(), self.query())
+            glQueryCounter(queries[0], GL_TIMESTAMP)
+        return name, category, t.perf_counter(), queries
+
+    def end(self, section):
+        name, category, start, queries = section
+        self.add(name, category, threading.current_thread().name, start, t.perf_counter() - start)
+
+        if (queries is not None):
+            glQueryCounter(queries[1], GL_TIMESTAMP)
+            self.pending.append((name, category) + queries)
+
+    # Call once per frame in the render thread: reads the GPU results that
+    # are available and measures the offset between the GPU and CPU clocks.
+    def frame(self):
+        self.collect()
+
+        timestamp = GLint64()
+        glGetInteger64v(GL_TIMESTAMP, byref(timestamp))
+        self.gpu_offset = t.perf_counter() - timestamp.value / 1e9
+
+    def collect(self):
+        available = GLuint()
+        begin = GLuint64()
+        end = GLuint64()
+
+        while (self.pending):
+            name, category, query_begin, query_end = self.pending[0]
+            glGetQueryObjectuiv(query_end, GL_QUERY_RESULT_AVAILABLE, byref(available))
+            if (not available.value):
+                break
+
+            glGetQueryObjectui64v(query_begin, GL_QUERY_RESULT, byref(begin))
+            glGetQueryObjectui64v(query_end, GL_QUERY_RESULT, byref(end))
+            if (self.gpu_offset is not None and end.value >= begin.value):
+                self.add(name, category, GPU, begin.value / 1e9 + self.gpu_offset, (end.value - begin.value) / 1e9)
+
+            self.pending.popleft()
+            self.free_queries += (query_begin, query_end)
+
+    # Returns an unused query object.
+    def query(self):
+        if (not self.free_queries):
+            queries = (GLuint * 64)()
+            glGenQueries(64, queries)
+            self.free_queries = list(queries)
+        return self.free_queries.pop()
+
+    def add(self, name, category, thread, start, duration):
+        self.events.append((name, category, thread, start, duration))
+
+        key = (name, thread)
+        with self.lock:
+            last = self.smoothed.get(key)
+            self.smoothed[key] = duration if last is None else last + (duration - last) * SMOOTHING
+
+    # Smoothed durations in seconds: {name: {thread: seconds}}.
+    def averages(self):
+        averages = {}
+        with self.lock:
+            for (name, thread), duration in self.smoothed.items():
+                averages.setdefault(name, {})[thread] = duration
+        return averages
+
+    # Write all events as Chrome trace event JSON, e.g. for chrome://tracing
+    # or ui.perfetto.dev. Every thread and the GPU get their own row.
+    def save(self, path):
+        events = list(self.events)
+        threads = {}
+        trace = []
+
+        for name, category, thread, start, duration in events:
+            if (thread not in threads):
+                threads[thread] = len(threads) + 1
+                trace.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": threads[thread],
+                              "args": {"name": thread}})
+
+            trace.append({"name": name, "cat": category, "ph": "X", "pid": 1, "tid": threads[thread],
+                          "ts": start * 1e6, "dur": duration * 1e6})
+
+        with open(path, "w") as f:
+            json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, f)
+
+        return len(events)
+
+    def delete(self):
+        self.collect()
+        queries = self.free_queries + [query for section in self.pending for query in section[2:]]
+        if (queries):
+            glDeleteQueries(len(queries), (GLuint * len(queries))(*queries))
+        self.free_queries = []
+        self.pending.clear()
+
+
+# Seconds between updates of the HUD text.
+HUD_INTERVAL = 0.5
+
+
+# Space around the HUD text, in pixels.
+HUD_MARGIN = 6
+
+
+# On-screen table of the smoothed CPU and GPU time of every section of a
+# Profiler, in milliseconds, on a light background in the lower left
+# corner. Drawn in an overlay projection (see Scene).
+class ProfilerHud:
+    def __init__(self, profiler, interval=HUD_INTERVAL):
+        self.profiler = profiler
+        self.interval = interval
+        self.updated = 0.0
+        self.label = pyglet.text.Label("", font_name=["DejaVu Sans Mono", "Courier New", "monospace"],
+                                       font_size=9, x=10 + HUD_MARGIN, y=10 + HUD_MARGIN, width=400,
+                                       multiline=True, anchor_y="bottom", color=(0, 0, 0, 255))
+        self.background = pyglet.shapes.Rectangle(10, 10, 0, 0, color=(255, 255, 255))
+        self.background.opacity = 192
+
+    def text(self):
+        lines = ["section".ljust(24) + "CPU ms".rjust(8) + "GPU ms".rjust(8)]
+        for name, times in sorted(self.profiler.averages().items()):
+            cpu = [duration for thread, duration in times.items() if thread != GPU]
+            gpu = times.get(GPU)
+            lines.append(name[:24].ljust(24) + (format(max(cpu) * 1000, ".2f") if cpu else "-").rjust(8) +
+                         (format(gpu * 1000, ".2f") if gpu is not None else "-").rjust(8))
+        return "\n".join(lines)
+
+    def draw(self):
+        now = t.perf_counter()
+        if (now - self.updated >= self.interval):
+            self.label.text = self.text()
+            self.background.width = self.label.content_width + 2 * HUD_MARGIN
+            self.background.height = self.label.content_height + 2 * HUD_MARGIN
+            self.updated = now
+        self.background.draw()
+        self.label.draw()
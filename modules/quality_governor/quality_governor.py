@@ -0,0 +1,113 @@
+# Version:	1.0
+# Author:	Vincent Diener - diener@teco.edu
+
+import time as t
+
+from collections import deque
+
+# Features of a Scene the governor may turn off, in this order (the most
+# expensive first) and turned back on in reverse order.
+QUALITY_STEPS = ("post_processing", "floor", "multisample", "lighting")
+
+# Frames averaged at most, and measured at least before deciding anything.
+# When nothing moves, only few frames are drawn.
+SAMPLES = 30
+MIN_SAMPLES = 10
+
+# A feature is turned back on once frames take less than this part of the budget.
+HEADROOM = 0.7
+
+# Seconds to wait after a change, so its effect is measured before the next one.
+HOLD = 1.0
+
+# Seconds a feature stays off at least. If it has to be turned off again
+# soon after it was turned back on, this doubles, up to MAX_HOLD.
+RESTORE_HOLD = 2.0
+MAX_HOLD = 60.0
+
+
+# Holds a frame rate by turning off expensive features of a Scene while
+# frames take longer than the budget (1 / target_fps), and turning them
+# back on when there is headroom again. Frame times (the longer of CPU and
+# GPU time, see FrameTimer) are averaged over the last SAMPLES frames.
+# The features stay normal attributes of the scene: if the user turns a
+# feature back on (e.g. with a key), the governor leaves it on and only
+# turns it off again if frames take too long.
+class QualityGovernor:
+    def __init__(self, scene, target_fps, steps=QUALITY_STEPS, samples=SAMPLES, headroom=HEADROOM, hold=HOLD,
+                 clock=t.perf_counter):
+        self.scene = scene
+        self.budget = 1.0 / target_fps
+        self.steps = steps
+        self.headroom = headroom
+        self.hold = hold
+        self.clock = clock
+
+        self.frame_times = deque(maxlen=samples)
+
+        # Features turned off by the governor, in order, and when.
+        self.reduced = []
+        self.reduced_at = {}
+
+        # When features were turned back on, and how long they stay off at least.
+        self.restored_at = {}
+        self.restore_hold = {name: RESTORE_HOLD for name in steps}
+
+        # Nothing changes before this time.
+        self.hold_until = 0.0
+
+        # Number of changes so far, and the average frame time the last decision was based on.
+        self.changes = 0
+        self.frame_time = None
+
+    # Add a measured frame (seconds). gpu may be None if it is not known.
+    def addFrame(self, cpu, gpu=None):
+        self.frame_times.append(max(cpu, gpu or 0.0))
+
+    # Average frame time in seconds, None before the first frame.
+    def frameTime(self):
+        if (not self.frame_times):
+            return None
+        return sum(self.frame_times) / len(self.frame_times)
+
+    # Turn a feature off or back on if needed. Returns (feature, on) for a
+    # change, None otherwise.
+    def update(self):
+        now = self.clock()
+        if (len(self.frame_times) < MIN_SAMPLES or now < self.hold_until):
+            return None
+
+        # Features the user turned back on are not reduced anymore.
+        self.reduced = [name for name in self.reduced if not getattr(self.scene, name)]
+
+        frame_time = self.frameTime()
+        self.frame_time = frame_time
+
+        if (frame_time > self.budget):
+            for name in self.steps:
+                if (getattr(self.scene, name)):
+                    # Turned back on too early: keep it off longer next time.
+                    if (now - self.restored_at.get(name, -MAX_HOLD) < self.restore_hold[name] + self.hold):
+                        self.restore_hold[name] = min(self.restore_hold[name] * 2, MAX_HOLD)
+
+                    setattr(self.scene, name, False)
+                    self.reduced.append(name)
+                    self.reduced_at[name] = now
+                    return self.changed(now, name, False)
+
+        elif (frame_time < self.budget * self.headroom and self.reduced):
+            name = self.reduced[-1]
+            if (now >= self.reduced_at[name] + self.restore_hold[name]):
+                setattr(self.scene, name, True)
+                self.reduced.pop()
+                self.restored_at[name] = now
+                return self.changed(now, name, True)
+
+        return None
+
+    # Measure again from scratch after a change.
+    def changed(self, now, name, on):
+        self.frame_times.clear()
+        self.hold_until = now + self.hold
+        self.changes += 1
+        return name, on
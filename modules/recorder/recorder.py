@@ -0,0 +1,107 @@
+# Version:	1.0
+# Author:	Vincent Diener - diener@teco.edu
+
+import os
+import struct
+import time as t
+import numpy
+
+# Recording file layout (little endian):
+#   Header: magic (8 bytes), header size (uint32), frame size (uint32),
+#           handshake packet as sent by the device, zero padded to a
+#           multiple of 8 bytes.
+#   Frames: time since the handshake in seconds (float64), followed by the
+#           raw frame (frame size bytes, in the format of the handshake).
+#           Frames of protocol version 2 are recorded decoded, not as the
+#           packets (RLE, DELTA, ...) sent by the device.
+# The file is only ever appended to, and all frame records have the same
+# size, so it can be memory-mapped and indexed directly for replay.
+MAGIC = b"CMREC002"
+HEADER = struct.Struct("<8sII")
+TIME = struct.Struct("<d")
+
+# Recordings of the first version have uint16 sizes (frames up to 65535
+# bytes) and are still read.
+MAGIC_V1 = b"CMREC001"
+HEADER_V1 = struct.Struct("<8sHH")
+
+
+# NumPy record type of one frame in a recording.
+def frameType(frame_size):
+    return numpy.dtype([("time", "<f8"), ("data", "u1", (frame_size, ))])
+
+
+# Writes the handshake and all frames of one session to a recording file.
+class SessionRecorder:
+    def __init__(self, path, handshake_bytes, frame_size=576):
+        self.path = path
+        self.frame_size = frame_size
+        self.frames = 0
+
+        # Header, padded so the frame records are aligned.
+        header_size = HEADER.size + len(handshake_bytes)
+        header_size += -header_size % 8
+        header = HEADER.pack(MAGIC, header_size, frame_size) + handshake_bytes
+
+        self.file = open(path, "wb")
+        self.file.write(header.ljust(header_size, b"\0"))
+
+        # Frame records are built in place: timestamp and data in one buffer.
+        self.record = bytearray(8 + frame_size)
+        self.record_data = memoryview(self.record)[8:]
+
+        # Timestamps are relative to the handshake.
+        self.time_start = t.perf_counter()
+
+    # Append one raw (decoded) frame.
+    def writeFrame(self, data):
+        TIME.pack_into(self.record, 0, t.perf_counter() - self.time_start)
+        self.record_data[:] = data
+        self.file.write(self.record)
+        self.frames += 1
+
+    def close(self):
+        self.file.close()
+
+
+# A recording opened for replay. Frames are memory-mapped, not read.
+class SessionRecording:
+    def __init__(self, path):
+        self.path = path
+
+        with open(path, "rb") as f:
+            magic = f.read(len(MAGIC))
+            if (magic == MAGIC):
+                header_struct = HEADER
+            elif (magic == MAGIC_V1):
+                header_struct = HEADER_V1
+            else:
+                raise ValueError(path + " is not a Connection Machine recording.")
+
+            f.seek(0)
+            magic, header_size, frame_size = header_struct.unpack(f.read(header_struct.size))
+
+            # Handshake packet as sent by the device (without padding).
+            header = f.read(header_size - header_struct.size)
+            self.handshake_bytes = header[:5 + header[4]]
+
+        self.frame_size = frame_size
+
+        # Map all complete frame records. A recording that was cut off
+        # in the middle of a frame just ends one frame earlier.
+        record_type = frameType(frame_size)
+        count = (os.path.getsize(path) - header_size) // record_type.itemsize
+
+        if (count > 0):
+            self.frames = numpy.memmap(path, dtype=record_type, mode="r", offset=header_size, shape=(count, ))
+        else:
+            self.frames = numpy.zeros(0, dtype=record_type)
+
+    def __len__(self):
+        return len(self.frames)
+
+    # Duration of the recording in seconds.
+    def duration(self):
+        if (len(self.frames) == 0):
+            return 0.0
+        return float(self.frames["time"][-1])
@@ -0,0 +1,197 @@
+# Version:	1.0
+# Author:	Vincent Diener - diener@teco.edu
+
+from pyglet.gl import *
+from ctypes import *
+
+
+# Texture given by a function returning its OpenGL name, for textures that
+# are created or replaced later (LED values, framebuffer).
+class TextureName:
+    target = GL_TEXTURE_2D
+
+    def __init__(self, get):
+        self.get = get
+
+    @property
+    def id(self):
+        return self.get()
+
+
+# One draw call and the state it needs.
+# draw is called to draw (e.g. a Batch.draw), shader is a Shader or None.
+# textures are bound to texture units 0, 1, ... (anything with target and id).
+# uniformi and uniformf map uniform names to values or to functions
+# returning the value each frame. Tuples set vec2, vec3 and vec4 uniforms.
+# enabled is a function returning whether to draw this frame, None always draws.
+# name identifies the pass when profiling (see RenderList.profiler).
+# uniformm maps uniform names to 4x4 matrices (see modules/camera) or to
+# functions returning them. Matrices are compared by identity, so they must
+# be replaced, not changed in place.
+class RenderPass:
+    def __init__(self, draw, shader=None, textures=(), uniformi=None, uniformf=None, blend=True, depth=True,
+                 enabled=None, name="pass", uniformm=None):
+        self.draw = draw
+        self.name = name
+        self.uniformm = uniformm or {}
+        self.shader = shader
+        self.textures = tuple(textures)
+        self.uniformi = uniformi or {}
+        self.uniformf = uniformf or {}
+        self.blend = blend
+        self.depth = depth
+        self.enabled = enabled
+
+
+# Passes drawn together. before and after are called around the passes of the
+# layer (e.g. to bind a vertex buffer or set up a projection), but only if at
+# least one pass is enabled. If sort is True, the passes may be reordered
+# to switch programs and textures less often. Passes whose order matters
+# (blended overlays) belong in a layer with sort False.
+class RenderLayer:
+    def __init__(self, before=None, after=None, sort=True):
+        self.before = before
+        self.after = after
+        self.sort = sort
+        self.passes = []
+
+        # Textures in the order they were first added, to sort by. Not by
+        # name, that would upload textures that are only loaded when used.
+        self.texture_order = {}
+
+    def add(self, render_pass):
+        self.passes.append(render_pass)
+        for texture in render_pass.textures:
+            self.texture_order.setdefault(texture, len(self.texture_order))
+
+        # Stable sort: passes with the same program and textures keep their order.
+        if (self.sort):
+            self.passes.sort(key=lambda p: (p.shader.handle if p.shader is not None else 0,
+                                            [self.texture_order[texture] for texture in p.textures]))
+        return render_pass
+
+
+# Retained list of layers, drawn in order by execute() once per frame.
+# Program, texture, uniform, blend and depth changes are only sent to
+# OpenGL when they differ from the current state.
+class RenderList:
+    def __init__(self):
+        self.layers = []
+
+        # Last value of every uniform set by the list, by (program, name).
+        # Programs keep their uniform values, so these stay valid between frames.
+        self.uniforms = {}
+
+        # Counters of the last frame.
+        self.passes_drawn = 0
+        self.program_switches = 0
+        self.texture_binds = 0
+
+        # Profiler measuring every pass on the CPU and GPU, None to not measure.
+        self.profiler = None
+
+    # Add a layer after all others and return it.
+    def layer(self, before=None, after=None, sort=True):
+        layer = RenderLayer(before, after, sort)
+        self.layers.append(layer)
+        return layer
+
+    # Draw all enabled passes.
+    def execute(self):
+        # Other code (texture uploads, pyglet) may change the state between
+        # frames, so only the uniform values are trusted.
+        self.program = None
+        self.bound = {}
+        self.unit = None
+        self.blend = None
+        self.depth = None
+
+        self.passes_drawn = 0
+        self.program_switches = 0
+        self.texture_binds = 0
+        profiler = self.profiler
+
+        for layer in self.layers:
+            passes = [p for p in layer.passes if p.enabled is None or p.enabled()]
+            if (not passes):
+                continue
+
+            if (layer.before is not None):
+                layer.before()
+
+            for render_pass in passes:
+                if (profiler is None):
+                    self.drawPass(render_pass)
+                else:
+                    section = profiler.begin(render_pass.name, "render", gpu=True)
+                    self.drawPass(render_pass)
+                    profiler.end(section)
+
+            if (layer.after is not None):
+                layer.after()
+
+        glUseProgram(0)
+        glActiveTexture(GL_TEXTURE0)
+
+    def drawPass(self, render_pass):
+        shader = render_pass.shader
+        program = shader.handle if shader is not None else 0
+
+        if (program != self.program):
+            glUseProgram(program)
+            self.program = program
+            self.program_switches += 1
+
+        for unit, texture in enumerate(render_pass.textures):
+            name = texture.id
+            if (self.bound.get(unit) != name):
+                if (unit != self.unit):
+                    glActiveTexture(GL_TEXTURE0 + unit)
+                    self.unit = unit
+                glBindTexture(texture.target, name)
+                self.bound[unit] = name
+                self.texture_binds += 1
+
+        # Leave unit 0 active for code drawing outside the list.
+        if (self.unit != 0):
+            glActiveTexture(GL_TEXTURE0)
+            self.unit = 0
+
+        if (shader is not None):
+            self.setUniforms(shader, render_pass.uniformi, shader.uniformi)
+            self.setUniforms(shader, render_pass.uniformf, shader.uniformf)
+            self.setMatrices(shader, render_pass.uniformm)
+
+        if (render_pass.blend != self.blend):
+            (glEnable if render_pass.blend else glDisable)(GL_BLEND)
+            self.blend = render_pass.blend
+
+        if (render_pass.depth != self.depth):
+            (glEnable if render_pass.depth else glDisable)(GL_DEPTH_TEST)
+            self.depth = render_pass.depth
+
+        render_pass.draw()
+        self.passes_drawn += 1
+
+    def setUniforms(self, shader, uniforms, setter):
+        for name, value in uniforms.items():
+            if (callable(value)):
+                value = value()
+            if (not isinstance(value, tuple)):
+                value = (value, )
+
+            key = (shader.handle, name)
+            if (self.uniforms.get(key) != value):
+                setter(name, *value)
+                self.uniforms[key] = value
+
+    def setMatrices(self, shader, matrices):
+        for name, matrix in matrices.items():
+            if (callable(matrix)):
+                matrix = matrix()
+
+            key = (shader.handle, name)
+            if (self.uniforms.get(key) is not matrix):
+                # NumPy matrices are row-major, OpenGL transposes them.
+                glUniformMatrix4fv(shader.location(name), 1, GL_TRUE, matrix.ctypes.data_as(POINTER(GLfloat)))
+                self.uniforms[key] = matrix
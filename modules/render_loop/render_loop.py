@@ -0,0 +1,67 @@
+# Version:	1.0
+# Author:	Vincent Diener - diener@teco.edu
+
+import pyglet
+
+
+# Event loop that only redraws windows whose content is out of date.
+# The default pyglet loop redraws every window after any event or scheduled
+# function, so a timer alone keeps it rendering the full scene. This loop
+# only redraws windows that have window.invalid set, at most max_fps times
+# per second. Whatever changes the picture sets it (new LED frame, key press,
+# resize, a tick of a running animation). With nothing to draw, the loop
+# sleeps until the next event, task or tick of the Scheduler.
+# max_fps only limits how often frames are drawn, the scheduler runs
+# everything else on the wall clock. Frames are drawn at a steady cadence,
+# so with vsync (flip() waits for the display) a limit at the refresh rate
+# does not fall back to every other refresh. None draws as often as vsync
+# (or the GPU) allows.
+class OnDemandEventLoop(pyglet.app.EventLoop):
+    def __init__(self, max_fps, scheduler=None):
+        pyglet.app.EventLoop.__init__(self)
+        self.frame_interval = 1.0 / max_fps if max_fps else 0.0
+        self.scheduler = scheduler
+
+        # Clock time the next frame is due and number of redraws so far.
+        self.next_draw = 0.0
+        self.frames_drawn = 0
+
+    def idle(self):
+        dt = self.clock.update_time()
+        self.clock.call_scheduled_functions(dt)
+
+        # Tasks and simulation ticks, these may invalidate windows.
+        if (self.scheduler is not None):
+            self.scheduler.update()
+
+        wait = None
+        invalid = [window for window in pyglet.app.windows if window.invalid]
+        if (invalid):
+            now = self.clock.time()
+            wait = self.next_draw - now
+
+            # Redraw, unless the last redraw was too recent.
+            if (wait <= 0):
+                for window in invalid:
+                    window.switch_to()
+                    window.dispatch_event('on_draw')
+                    window.flip()
+
+                # Keep the cadence, a late frame does not delay the next ones.
+                self.next_draw = max(self.next_draw + self.frame_interval, now)
+                self.frames_drawn += 1
+
+                # Windows that are still invalid are redrawn next frame.
+                wait = None
+                if (any(window.invalid for window in invalid)):
+                    wait = max(self.next_draw - self.clock.time(), 0.0)
+
+        # Wake up for the next scheduled function, task, tick or redraw, whatever comes first.
+        times = [wait, self.clock.get_sleep_time(True)]
+        if (self.scheduler is not None):
+            times.append(self.scheduler.sleepTime())
+
+        times = [time for time in times if time is not None]
+        if (not times):
+            return None
+        return min(times)
@@ -0,0 +1,449 @@
+# Version:	1.0
+# Author:	Vincent Diener - diener@teco.edu
+
+import pyglet
+
+from pyglet.gl import *
+from ctypes import *
+
+from modules.camera.camera import Camera, ortho, IDENTITY
+from modules.framebuffer.framebuffer import Framebuffer
+from modules.geometry.geometry import GeometryBuffer, machineParts, GROUND_SIZE
+from modules.gl_helper.gl_helper import GLHelper
+from modules.render_list.render_list import RenderList, RenderPass, TextureName
+from modules.shader_loader.shader_loader import ShaderLoader
+from modules.shader_registry.shader_registry import ShaderRegistry
+from modules.texture_cache.texture_cache import TextureCache
+
+# The background color (RGB, 0-255).
+BG_COLOR = (201, 198, 198)
+
+# The detailed floor looks like this many layers of its texture, stacked
+# GROUND_LAYER_HEIGHT apart. shaders/ground.fs draws them in a single pass.
+GROUND_LAYERS = 12
+GROUND_LAYER_HEIGHT = 0.004
+
+# This d parameter determines the size of the Connection Machine.
+MACHINE_SIZE = 1.5
+
+# Light position (in eye space), diffuse and ambient color.
+LIGHT_POSITION = (-12.0, 0.0, -4.0)
+LIGHT_DIFFUSE = (5.0, 0.8, 0.8)
+LIGHT_AMBIENT = (0.23, 0.23, 0.23)
+
+# The animations were made for 60 frames per second. Time and the
+# instruction timer still count in these frames, but advance with the
+# wall clock, whatever the frame rate.
+ANIMATION_RATE = 60.0
+
+
+# Everything needed to draw the emulator: textures, shaders, geometry and
+# the render list, plus the state the picture depends on (time, lighting,
+# floor, instructions, post processing). Needs a current OpenGL context,
+# but no window: draw() renders into any framebuffer.
+# width and height are the initial size of the viewport. The overlays are
+# laid out for it and stretched with the viewport.
+# With core True, the scene is drawn for an OpenGL 3.3 core profile context:
+# triangles from vertex array objects, the shaders in shaders/core and the
+# matrices of camera passed as uniforms. Otherwise it uses the fixed
+# function matrix stacks, lighting and vertex arrays.
+# samples is the number of samples per pixel (anti-aliasing) of the post
+# processing framebuffer, like those of the window, 0 for none.
+class Scene:
+    def __init__(self, width, height, shader_cache_dir=None, texture_cache_dir=None, bg_color=BG_COLOR,
+                 d=MACHINE_SIZE, core=False, samples=0):
+        self.width = width
+        self.height = height
+        self.d = d
+        self.core = core
+
+        # Projection and modelview matrix, see modules/camera/camera.py.
+        # Reset by resize().
+        self.camera = Camera(width, height)
+
+        # Matrices of the flat overlays.
+        self.overlay_projection = ortho(0, width, 0, height, -1, 1)
+
+        # Time (frames at ANIMATION_RATE since the start)
+        self.time = 0.0
+
+        # Show instructions or hide them?
+        self.show_instructions = True
+
+        # Timer for instruction fade, 0 (shown) to 50 (hidden).
+        self.instruction_timer = 0.0
+
+        # Enable lighting?
+        self.lighting = True
+
+        # Render detailed floor?
+        self.floor = False
+
+        # Use post processing shader (shaders/post_processing.fs).
+        self.post_processing = False
+
+        # Use multisampling (anti-aliasing), if the framebuffer has samples.
+        self.multisample = True
+
+        # Profiler measuring the render passes and LED updates, None to not
+        # measure (see useProfiler). hud is drawn over everything while show_hud is True.
+        self.profiler = None
+        self.hud = None
+        self.show_hud = False
+
+        # Framebuffer the finished picture goes to, 0 is the window.
+        self.target = 0
+
+        # Create GL helper.
+        self.gl = GLHelper(width, height)
+
+        # Load textures. Enable transparency for some.
+        # They are decoded in parallel. The detailed floor textures are only
+        # decoded when the floor is switched on for the first time.
+        self.textures = TextureCache(texture_cache_dir)
+        # The LED shape is repeated per LED in shaders/led.fs, mipmaps would blur the edges between LEDs.
+        self.texture_led = self.textures.load("textures/led.png", True, mipmaps=False)
+        self.texture_metal_0 = self.textures.load("textures/metal_0.jpg", False)
+        self.texture_metal_1 = self.textures.load("textures/metal_1.jpeg", False)
+        self.texture_simple_ground = self.textures.load("textures/ground_0.png", True)
+        self.texture_detailed_ground = self.textures.load("textures/ground_1.png", True, lazy=True)
+        self.texture_effect_red = self.textures.load("textures/effect_red.png", True, lazy=True)
+        self.texture_fade = self.textures.load("textures/fade.png", True)
+        self.texture_logo = self.textures.load("textures/logo.png", True)
+        self.texture_instructions = self.textures.load("textures/instructions.png", True)
+        self.textures.uploadAll()
+
+        # Create framebuffer for post processing shader. Resized in resize().
+        # Multisampled like the window, so post processing keeps the anti-aliasing.
+        self.framebuffer = Framebuffer(width, height, samples)
+
+        # Create draw batches.
+        self.batch_led = pyglet.graphics.Batch()
+        self.batch_fade = pyglet.graphics.Batch()
+        self.batch_logo = pyglet.graphics.Batch()
+        self.batch_instructions = pyglet.graphics.Batch()
+        self.batch_fullscreen = pyglet.graphics.Batch()
+
+        # Create shaders. Errors in a shader raise ShaderError with the driver log.
+        shader_dir = 'shaders/core/' if core else 'shaders/'
+        self.shaders = ShaderRegistry(shader_cache_dir)
+        self.shader_body = ShaderLoader(shader_dir + 'cm_body.vs', shader_dir + 'cm_body.fs', self.shaders).shader
+        self.shader_leds = ShaderLoader(shader_dir + 'led.vs', shader_dir + 'led.fs', self.shaders).shader
+        self.shader_ground = ShaderLoader(shader_dir + 'ground.vs', shader_dir + 'ground.fs', self.shaders).shader
+        self.shader_pp = ShaderLoader(shader_dir + 'post_processing.vs', shader_dir + 'post_processing.fs',
+                                      self.shaders).shader
+
+        # Set texture units for shaders.
+        self.shader_body.bind()
+        self.shader_body.uniformi(b'tex0', 0)
+
+        self.shader_leds.bind()
+        self.shader_leds.uniformi(b'tex0', 0)
+        self.shader_leds.uniformi(b'data', 1)
+
+        self.shader_ground.bind()
+        self.shader_ground.uniformi(b'tex0', 0)
+        self.shader_ground.uniformi(b'tex1', 1)
+        self.shader_ground.uniformf(b'layers', GROUND_LAYERS)
+        self.shader_ground.uniformf(b'layer_height', GROUND_LAYER_HEIGHT)
+        self.shader_ground.uniformf(b'ground_size', 2.0 * GROUND_SIZE * d)
+
+        self.shader_pp.bind()
+        self.shader_pp.uniformi(b'tex0', 0)
+        self.shader_pp.unbind()
+
+        # Without fixed function lighting, the shaders get the light as uniforms.
+        if (core):
+            for shader in (self.shader_body, self.shader_ground):
+                shader.bind()
+                shader.uniformf(b'light_position', *LIGHT_POSITION)
+                shader.uniformf(b'light_diffuse', *LIGHT_DIFFUSE)
+                shader.uniformf(b'light_ambient', *LIGHT_AMBIENT)
+                shader.unbind()
+
+        # Set buffer clear color.
+        glClearColor(bg_color[0] / 255.0, bg_color[1] / 255.0, bg_color[2] / 255.0, 1.0)
+
+        # Enable alpha blending.
+        glEnable(GL_BLEND)
+        glBlendEquation(GL_FUNC_ADD)
+        glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+
+        # Enable depth testing.
+        glEnable(GL_DEPTH_TEST)
+
+        # Connection Machine (center cube, stand, 8 main cubes) and ground with shadow,
+        # in a single static vertex buffer. See modules/geometry/geometry.py.
+        self.geometry = GeometryBuffer(core)
+        self.geometry.upload([machineParts(d)])
+
+        # Draw flat overlays. The core profile has no pyglet batches, the
+        # overlays and the LED quad are parts of vertex buffers instead.
+        if (core):
+            self.overlay_geometry = GeometryBuffer(core)
+            self.overlay_geometry.upload([{"fullscreen": self.gl.overlayQuad(0, 0, 0, width, height),
+                                           "fade": self.gl.overlayQuad(0, 0, -0.001, width, height),
+                                           "logo": self.gl.overlayQuad(10, 5, -0.002, width / 4.5, height / 13.5),
+                                           "instructions": self.gl.overlayQuad(0, 0, -0.003, width, height)}])
+            self.led_geometry = GeometryBuffer(core)
+        else:
+            self.gl.drawOverlay(self.batch_fullscreen, 0, 0, 0, width, height)
+            self.gl.drawOverlay(self.batch_fade, 0, 0, -0.001, width, height)
+            self.gl.drawOverlay(self.batch_logo, 10, 5, -0.002, width / 4.5, height / 13.5)
+            self.gl.drawOverlay(self.batch_instructions, 0, 0, -0.003, width, height)
+
+        # Draw passes of every frame, in order.
+        self.render_list = self.createRenderList()
+
+    # Set up viewport, lighting and camera for a viewport of the given size.
+    # Also resets the camera. A minimized window has a size of 0x0, which is
+    # treated as 1x1.
+    def resize(self, width, height):
+        width = max(width, 1)
+        height = max(height, 1)
+
+        gl = self.gl
+        gl.gl_x = width
+        gl.gl_y = height
+
+        # The post processing framebuffer has the size of the viewport.
+        self.framebuffer.resize(width, height)
+
+        # Create viewport.
+        glViewport(0, 0, width, height)
+
+        # Set up perspective and put model in correct position.
+        self.camera.reset(width, height)
+
+        # Set lighting parameters. The core profile shaders get them as uniforms.
+        if (not self.core):
+            glEnable(GL_LIGHTING)
+            glEnable(GL_LIGHT0)
+            glMatrixMode(GL_MODELVIEW)
+            glLoadIdentity()
+            glLightfv(GL_LIGHT0, GL_POSITION, gl.vec(*LIGHT_POSITION, 0.0))
+            glLightfv(GL_LIGHT0, GL_DIFFUSE, gl.vec(*LIGHT_DIFFUSE, 1.0))
+            glLightfv(GL_LIGHT0, GL_AMBIENT, gl.vec(*LIGHT_AMBIENT, 1.0))
+
+    # Show the given LED matrix (in the given FrameFormat).
+    def setLeds(self, matrix, frameFormat):
+        if (self.profiler is None):
+            self.gl.drawAllLeds(self.ledBatch(), matrix, frameFormat, self.d)
+        else:
+            section = self.profiler.begin("drawAllLeds", "leds", gpu=True)
+            self.gl.drawAllLeds(self.ledBatch(), matrix, frameFormat, self.d)
+            self.profiler.end(section)
+
+    # Batch or vertex buffer (core profile) the LED quad is added to.
+    def ledBatch(self):
+        return self.led_geometry if self.core else self.batch_led
+
+    # Measure the render passes and LED updates with the given Profiler
+    # (None to stop), and draw hud (e.g. a ProfilerHud) while show_hud is True.
+    # pyglet draws the ProfilerHud with the fixed function pipeline, so there
+    # is none in the core profile.
+    def useProfiler(self, profiler, hud=None):
+        self.profiler = profiler
+        self.render_list.profiler = profiler
+        self.hud = hud
+
+    # Progress time by dt seconds.
+    def advance(self, dt):
+        frames = dt * ANIMATION_RATE
+        self.time += frames
+
+        # This creates the fade effect for the instructions.
+        if (self.show_instructions and self.instruction_timer > 0):
+            self.instruction_timer = max(self.instruction_timer - 3 * frames, 0.0)
+
+        if (not self.show_instructions and self.instruction_timer < 50):
+            self.instruction_timer = min(self.instruction_timer + 3 * frames, 50.0)
+
+    # Draw the scene, overlays and post processing into the framebuffer
+    # target (0 is the window), see createRenderList().
+    def draw(self, target=0):
+        self.target = target
+
+        # With post processing, render the scene into the framebuffer first.
+        if (self.post_processing):
+            self.framebuffer.bind()
+        else:
+            glBindFramebuffer(GL_FRAMEBUFFER, target)
+
+        # Clear buffer.
+        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+
+        if (self.multisample):
+            glEnable(GL_MULTISAMPLE)
+        else:
+            glDisable(GL_MULTISAMPLE)
+
+        # The core profile shaders get the matrices as uniforms.
+        if (not self.core):
+            glMatrixMode(GL_PROJECTION)
+            glLoadTransposeMatrixf(self.camera.projection.ctypes.data_as(POINTER(GLfloat)))
+            glMatrixMode(GL_MODELVIEW)
+            glLoadTransposeMatrixf(self.camera.modelview.ctypes.data_as(POINTER(GLfloat)))
+
+        self.render_list.execute()
+
+    # Returns True while the picture changes from frame to frame.
+    def isAnimating(self):
+        # Fade in from black.
+        if (self.time < 50):
+            return True
+
+        # Instructions fading in or out.
+        if ((self.show_instructions and self.instruction_timer > 0) or
+                (not self.show_instructions and self.instruction_timer < 50)):
+            return True
+
+        # The red ring on the detailed floor and the post processing effects move all the time.
+        return self.floor or self.post_processing
+
+    # Set up an orthogonal projection for the flat overlays.
+    def pushOverlayProjection(self):
+        glMatrixMode(GL_MODELVIEW)
+        glPushMatrix()
+        glLoadIdentity()
+        glMatrixMode(GL_PROJECTION)
+        glPushMatrix()
+        glLoadIdentity()
+        glOrtho(0, self.width, 0, self.height, -1, 1)
+
+    # Load old perspective.
+    def popOverlayProjection(self):
+        glPopMatrix()
+        glMatrixMode(GL_MODELVIEW)
+        glPopMatrix()
+
+    # Set up drawing the flat overlays: the orthogonal projection, or in the
+    # core profile their vertex buffer (the passes set the matrices).
+    def beginOverlays(self):
+        if (self.core):
+            self.overlay_geometry.bind()
+        else:
+            self.pushOverlayProjection()
+
+    def endOverlays(self):
+        if (self.core):
+            self.overlay_geometry.unbind()
+        else:
+            self.popOverlayProjection()
+
+    # Returns the function drawing the named overlay: its batch, or in the
+    # core profile its part of the overlay vertex buffer.
+    def overlay(self, batch, name):
+        if (self.core):
+            return lambda: self.overlay_geometry.draw(name)
+        return batch.draw
+
+    # Show the rendered scene from the framebuffer in the target.
+    def beginPostProcessing(self):
+        self.framebuffer.resolve()
+        glBindFramebuffer(GL_FRAMEBUFFER, self.target)
+        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+        self.beginOverlays()
+
+    # pyglet draws text with the fixed function pipeline, so without lighting.
+    def drawHud(self):
+        glPushAttrib(GL_ENABLE_BIT)
+        glDisable(GL_LIGHTING)
+        self.hud.draw()
+        glPopAttrib()
+
+    # Returns a RenderList drawing everything in draw().
+    # Passes read the state (time, lighting, floor, ...) when they are drawn.
+    # To draw something new, add a pass to the right layer.
+    def createRenderList(self):
+        render_list = RenderList()
+        gl = self.gl
+        geometry = self.geometry
+
+        # Matrices of the scene and of the overlays. Only the core profile
+        # shaders have them, the others use the fixed function matrices.
+        matrices = None
+        overlay_matrices = None
+        if (self.core):
+            matrices = {b'modelview_projection': lambda: self.camera.modelview_projection,
+                        b'modelview': lambda: self.camera.modelview}
+            overlay_matrices = {b'modelview_projection': self.overlay_projection, b'modelview': IDENTITY}
+
+        # Connection Machine with or without lighting.
+        # Time is 0, so drawing is fully opaque.
+        # Connection Machine and floor are all in one vertex buffer.
+        scene = render_list.layer(geometry.bind, geometry.unbind)
+        body_uniforms = {b'do_light': lambda: self.lighting}
+
+        # Connection Machine center cube and stand, 8 main cubes.
+        scene.add(RenderPass(lambda: geometry.draw("metal_0"), self.shader_body, [self.texture_metal_0],
+                             body_uniforms, {b'time': 0.0}, name="body metal_0", uniformm=matrices))
+        scene.add(RenderPass(lambda: geometry.draw("metal_1"), self.shader_body, [self.texture_metal_1],
+                             body_uniforms, {b'time': 0.0}, name="body metal_1", uniformm=matrices))
+
+        # Floor, blended, so it comes after the Connection Machine: the
+        # simple floor, or the detailed texture (GROUND_LAYERS layers) over
+        # the flashing red ring effect, all in one pass. Time is passed in to
+        # create the effect.
+        floor = render_list.layer(geometry.bind, geometry.unbind, sort=False)
+        floor.add(RenderPass(lambda: geometry.draw("ground"), self.shader_body, [self.texture_simple_ground],
+                             body_uniforms, {b'time': 0.0}, enabled=lambda: not self.floor, name="ground",
+                             uniformm=matrices))
+        floor.add(RenderPass(lambda: geometry.draw("ground"), self.shader_ground,
+                             [self.texture_detailed_ground, self.texture_effect_red],
+                             {b'do_light': lambda: self.lighting}, {b'time': lambda: self.time},
+                             enabled=lambda: self.floor, name="floor", uniformm=matrices))
+
+        # Front LEDs.
+        # They are a single quad, the shader draws every LED from the data
+        # texture (one texel per LED) that setLeds updates.
+        # In the core profile, the quad is in its own vertex buffer.
+        if (self.core):
+            leds = render_list.layer(self.led_geometry.bind, self.led_geometry.unbind)
+            draw_leds = lambda: self.led_geometry.draw("leds")
+        else:
+            leds = render_list.layer()
+            draw_leds = self.batch_led.draw
+        leds.add(RenderPass(draw_leds, self.shader_leds,
+                            [self.texture_led, TextureName(lambda: gl.ledTexture.value)],
+                            {b'color_mode': lambda: gl.ledFormat.color_mode},
+                            {b'size': lambda: (float(gl.ledFormat.width), float(gl.ledFormat.height)),
+                             b'gap': lambda: gl.ledGap},
+                            enabled=lambda: gl.ledFormat is not None, name="leds", uniformm=matrices))
+
+        # Overlays without lighting, in this order (they are blended).
+        overlays = render_list.layer(self.beginOverlays, self.endOverlays, sort=False)
+
+        # Instructions. Time is set to the instruction_timer to create the fade effect.
+        overlays.add(RenderPass(self.overlay(self.batch_instructions, "instructions"), self.shader_body,
+                                [self.texture_instructions], {b'do_light': False},
+                                {b'time': lambda: self.instruction_timer}, name="instructions",
+                                uniformm=overlay_matrices))
+
+        # Logo. Time is 0, so it is drawn fully opaque.
+        overlays.add(RenderPass(self.overlay(self.batch_logo, "logo"), self.shader_body, [self.texture_logo],
+                                {b'do_light': False}, {b'time': 0.0}, name="logo", uniformm=overlay_matrices))
+
+        # Fade-in-from-black overlay.
+        # Normal time is passed in, so it becomes transparent in 50 frames.
+        overlays.add(RenderPass(self.overlay(self.batch_fade, "fade"), self.shader_body, [self.texture_fade],
+                                {b'do_light': False}, {b'time': lambda: self.time}, name="fade",
+                                uniformm=overlay_matrices))
+
+        # Post processing shader, draws the framebuffer texture to the target.
+        # The framebuffer texture has exactly the size of the viewport, so all of it is used.
+        post_processing = render_list.layer(self.beginPostProcessing, self.endOverlays)
+        post_processing.add(RenderPass(self.overlay(self.batch_fullscreen, "fullscreen"), self.shader_pp,
+                                       [TextureName(lambda: self.framebuffer.texture.value)],
+                                       {b'tex_width': lambda: gl.gl_x, b'tex_height': lambda: gl.gl_y},
+                                       {b'ratio_x': 1.0, b'ratio_y': 1.0, b'time': lambda: self.time},
+                                       enabled=lambda: self.post_processing, name="post processing",
+                                       uniformm=overlay_matrices))
+
+        # Profiler HUD, over everything (also the post processing).
+        # Only in the compatibility profile, see useProfiler.
+        hud = render_list.layer(self.pushOverlayProjection, self.popOverlayProjection, sort=False)
+        hud.add(RenderPass(self.drawHud, depth=False,
+                           enabled=lambda: self.hud is not None and self.show_hud, name="hud"))
+
+        return render_list
@@ -0,0 +1,98 @@
+# Version:	1.0
+# Author:	Vincent Diener - diener@teco.edu
+
+import time as t
+
+# Simulation steps per second.
+TICK_RATE = 60
+
+# Steps run at most per update. If the simulation falls further behind
+# (e.g. the window was dragged), the rest is skipped instead of catching up.
+MAX_TICKS = 5
+
+
+# Periodic function of a Scheduler.
+class Task:
+    def __init__(self, interval, func, now):
+        self.interval = interval
+        self.func = func
+        self.next = now + interval
+        self.last = now
+
+
+# Runs everything that happens over time, on the wall clock:
+# - tasks: functions called every interval seconds with the seconds since
+#   their last call, e.g. polling for new LED frames.
+# - ticks: the simulation (animations, camera movement) is advanced in fixed
+#   steps of 1 / tick_rate seconds. Every tick function is called with that
+#   step. Ticks only run while active() returns True. When it turns True
+#   again, the simulation starts from there instead of catching up.
+# How often frames are drawn does not change how fast anything runs, see
+# OnDemandEventLoop.
+class Scheduler:
+    def __init__(self, tick_rate=TICK_RATE, active=None, max_ticks=MAX_TICKS, clock=t.perf_counter):
+        self.step = 1.0 / tick_rate
+        self.active = active or (lambda: True)
+        self.max_ticks = max_ticks
+        self.clock = clock
+
+        self.tasks = []
+        self.tick_funcs = []
+
+        # Wall clock time of the next tick.
+        self.next_tick = None
+
+        # Ticks run, and skipped because the simulation fell behind.
+        self.ticks = 0
+        self.ticks_skipped = 0
+
+    # Call func(dt) every interval seconds.
+    def every(self, interval, func):
+        self.tasks.append(Task(interval, func, self.clock()))
+
+    # Call func(dt) every tick.
+    def onTick(self, func):
+        self.tick_funcs.append(func)
+
+    # Run the tasks and ticks that are due. Returns the number of ticks run.
+    def update(self):
+        now = self.clock()
+
+        for task in self.tasks:
+            if (now >= task.next):
+                task.func(now - task.last)
+                task.last = now
+                # Keep the cadence, but do not call a late task several times.
+                task.next = max(task.next + task.interval, now)
+
+        if (not self.active()):
+            self.next_tick = None
+            return 0
+
+        if (self.next_tick is None):
+            self.next_tick = now
+
+        ticks = 0
+        while (now >= self.next_tick and ticks < self.max_ticks):
+            for func in self.tick_funcs:
+                func(self.step)
+            self.next_tick += self.step
+            ticks += 1
+
+        # Too far behind: skip the rest.
+        if (now >= self.next_tick):
+            skipped = int((now - self.next_tick) / self.step) + 1
+            self.ticks_skipped += skipped
+            self.next_tick += skipped * self.step
+
+        self.ticks += ticks
+        return ticks
+
+    # Seconds until the next task or tick is due.
+    def sleepTime(self):
+        times = [task.next for task in self.tasks]
+        if (self.next_tick is not None or self.active()):
+            times.append(self.next_tick if self.next_tick is not None else self.clock())
+        if (not times):
+            return None
+        return max(min(times) - self.clock(), 0.0)
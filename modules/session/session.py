@@ -0,0 +1,195 @@
+# Version:	1.0
+# Author:	Vincent Diener - diener@teco.edu
+
+import math
+import time as t
+import numpy
+
+from modules.frame_format.frame_format import frameFormat, COLOR_RED, COLOR_RGB, DEFAULT_FORMAT
+from modules.frame_store.frame_store import FrameStore
+
+# One connected device.
+# Every session has its own matrix of LED values and its own statistics.
+class Session:
+    def __init__(self, session_id, address, frames):
+        self.session_id = session_id
+        self.address = address
+
+        # Handshake packet, set once it is received.
+        self.handshake = None
+
+        # Format of the LEDs of this device (see FrameFormat) and their values
+        # in that format. Written by the reader thread, read by the render thread.
+        # frames is a FrameStore or a JitterBuffer.
+        # The render thread only uses display, which is replaced as one tuple,
+        # so it always sees a matching pair.
+        self.format = DEFAULT_FORMAT
+        self.frames = frames
+        self.display = (self.format, self.frames)
+
+        # SessionRecorder if the session is recorded.
+        self.recorder = None
+
+        # Statistics.
+        self.time_connect = t.time()
+        self.time_last_frame = None
+        self.frames_received = 0
+
+    # Short description for the window title.
+    def describe(self):
+        if (self.handshake is not None and self.handshake.name):
+            return self.handshake.name.decode("UTF-8", "replace")
+        return "#" + str(self.session_id)
+
+
+# Keeps track of all connected sessions and decides what the panel shows:
+# either the selected session or all sessions tiled next to each other.
+# Sessions are added and removed by the reader thread and read by the render
+# thread, so the session list is replaced instead of modified in place.
+class SessionManager:
+    def __init__(self):
+        self.sessions = []
+        self.next_id = 0
+
+        # Creates the frame store of a session, given the number of values per frame.
+        self.frame_factory = FrameStore
+
+        # Index of the session shown on the panel.
+        self.selected = 0
+
+        # Show all sessions at once?
+        self.tile = False
+
+        # Source rows/columns for each session and tile size, see compose().
+        self.tile_index = {}
+
+        # What compose() wrote last time, to detect changes.
+        self.composed = None
+
+        # Format and values compose() writes. Replaced when the format changes.
+        self.format = DEFAULT_FORMAT
+        self.matrix = numpy.zeros(DEFAULT_FORMAT.values, dtype=numpy.uint8)
+
+    # Create a session for a newly connected device.
+    # It uses the default format until setFormat() is called.
+    def add(self, address):
+        session = Session(self.next_id, address, self.frame_factory(DEFAULT_FORMAT.values))
+        self.next_id += 1
+        self.sessions = self.sessions + [session]
+        return session
+
+    # Switch a session to the format from its handshake.
+    # Called by the reader thread before the first frame.
+    def setFormat(self, session, frame_format):
+        if (frame_format is not session.format):
+            session.format = frame_format
+            session.frames = self.frame_factory(frame_format.values)
+            session.display = (session.format, session.frames)
+
+    # Remove a session after its device disconnected.
+    def remove(self, session):
+        self.sessions = [s for s in self.sessions if s is not session]
+
+    # Select the next session (wraps around).
+    def selectNext(self):
+        sessions = self.sessions
+        if (sessions):
+            self.selected = (self.selected + 1) % len(sessions)
+
+    # Toggle between showing the selected session and tiling all sessions.
+    def toggleTile(self):
+        self.tile = not self.tile
+
+    # Returns the selected session or None if no device is connected.
+    def selectedSession(self):
+        sessions = self.sessions
+        if (not sessions):
+            return None
+        return sessions[self.selected % len(sessions)]
+
+    # Let the frame stores of all sessions present their next frame.
+    def tick(self, now):
+        for session in self.sessions:
+            session.display[1].tick(now)
+
+    # Use a matrix of the given format for the next compose().
+    def useFormat(self, frame_format):
+        if (frame_format is not self.format):
+            self.format = frame_format
+            self.matrix = numpy.zeros(frame_format.values, dtype=numpy.uint8)
+            self.composed = None
+
+    # Write what the panel should show into self.matrix, in self.format.
+    # That is the format of the shown session or, for tiles, the largest size
+    # of all tiled sessions, in RGB if their color modes differ.
+    # Returns False if there is no session to show or nothing changed
+    # since the last call.
+    def compose(self):
+        sessions = self.sessions
+        if (not sessions):
+            self.composed = None
+            return False
+
+        if (not self.tile or len(sessions) == 1):
+            session = sessions[self.selected % len(sessions)]
+            frame_format, frames = session.display
+            seq, matrix = frames.acquire()
+
+            # Same frame of the same session as last time?
+            key = (session.session_id, frames, seq)
+            if (key == self.composed):
+                return False
+
+            self.useFormat(frame_format)
+            self.matrix[:] = matrix
+            self.composed = key
+            return True
+
+        # Tile the sessions in a grid of size x size, each one scaled down
+        # to the size of a tile by nearest neighbour sampling.
+        size = min(int(math.ceil(math.sqrt(len(sessions)))), 24)
+        displays = [session.display for session in sessions[:size * size]]
+
+        width = max(frame_format.width for frame_format, frames in displays)
+        height = max(frame_format.height for frame_format, frames in displays)
+        modes = set(frame_format.color_mode for frame_format, frames in displays)
+        color_mode = modes.pop() if len(modes) == 1 else COLOR_RGB
+
+        # Every tile has to be at least one LED.
+        size = min(size, width, height)
+        displays = displays[:size * size]
+        tile_x = width // size
+        tile_y = height // size
+
+        key = tuple((frames, frames.sequence()) for frame_format, frames in displays)
+        if (key == self.composed):
+            return False
+
+        self.useFormat(frameFormat(width, height, color_mode))
+
+        # First axis of the matrix goes top to bottom, second one left to right.
+        # Fill tiles row by row, starting at the top left.
+        panel = self.matrix.reshape(height, width, self.format.channels)
+        panel[:] = 0
+        for i, (frame_format, frames) in enumerate(displays):
+            index_key = (frame_format.width, frame_format.height, tile_x, tile_y)
+            if (index_key not in self.tile_index):
+                self.tile_index[index_key] = numpy.ix_(numpy.arange(tile_y) * frame_format.height // tile_y,
+                                                       numpy.arange(tile_x) * frame_format.width // tile_x)
+
+            seq, matrix = frames.acquire()
+            tile = matrix.reshape(frame_format.height, frame_format.width, frame_format.channels)[
+                self.tile_index[index_key]]
+
+            x = (i % size) * tile_x
+            y = (i // size) * tile_y
+            target = panel[y:y + tile_y, x:x + tile_x]
+
+            # Red tiles among RGB ones only light up red, grayscale ones all channels.
+            if (frame_format.color_mode == COLOR_RED and self.format.color_mode == COLOR_RGB):
+                target[:, :, 0:1] = tile
+            else:
+                target[:] = tile
+
+        self.composed = key
+        return True
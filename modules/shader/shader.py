@@ -8,14 +8,32 @@
 from pyglet.gl import *
 from ctypes import *
 
+# raised when a shader does not compile or a program does not link,
+# the message is the info log of the driver
+class ShaderError(Exception):
+    pass
+
 class Shader:
     # vert, frag and geom take arrays of source strings
     # the arrays will be concattenated into one string by OpenGL
-    def __init__(self, vert = [], frag = [], geom = []):
+    # binary is an optional (format, bytes) tuple from getBinary(), if the
+    # driver accepts it the sources are not compiled at all
+    # retrievable asks the driver to keep the binary for getBinary(), only
+    # pass True if it supports program binaries (GL 4.1 or ARB_get_program_binary)
+    def __init__(self, vert = [], frag = [], geom = [], binary = None, retrievable = False):
         # create the program handle
         self.handle = glCreateProgram()
         # we are not linked yet
         self.linked = False
+        # uniform locations by name, filled in at link time
+        self.locations = {}
+        # whether the program was loaded from a binary instead of compiled
+        self.fromBinary = False
+ 
+        if binary is not None:
+            self.loadBinary(*binary)
+        if self.linked:
+            return
  
         # create the vertex shader
         self.createShader(vert, GL_VERTEX_SHADER)
@@ -25,7 +43,7 @@ class Shader:
         # self.createShader(frag, GL_GEOMETRY_SHADER_EXT)
  
         # attempt to link the program
-        self.link()
+        self.link(retrievable)
  
     def createShader(self, strings, type):
         count = len(strings)
@@ -48,7 +66,7 @@ class Shader:
         # retrieve the compile status
         glGetShaderiv(shader, GL_COMPILE_STATUS, byref(temp))
  
-        # if compilation failed, print the log
+        # if compilation failed, raise with the log
         if not temp:
             # retrieve the log length
             glGetShaderiv(shader, GL_INFO_LOG_LENGTH, byref(temp))
@@ -56,13 +74,20 @@ class Shader:
             buffer = create_string_buffer(temp.value)
             # retrieve the log text
             glGetShaderInfoLog(shader, temp, None, buffer)
-            # print the log to the console
-            print(buffer.value)
-        else:
-            # all is well, so attach the shader to the program
-            glAttachShader(self.handle, shader);
+            glDeleteShader(shader)
+            glDeleteProgram(self.handle)
+            raise ShaderError(buffer.value.decode("UTF-8", "replace"))
+ 
+        # all is well, so attach the shader to the program
+        glAttachShader(self.handle, shader)
+        # the program keeps the compiled code, the shader object can go
+        glDeleteShader(shader)
+ 
+    def link(self, retrievable = False):
+        # ask the driver to keep the linked code around for getBinary()
+        if retrievable:
+            glProgramParameteri(self.handle, GL_PROGRAM_BINARY_RETRIEVABLE_HINT, GL_TRUE)
  
-    def link(self):
         # link the program
         glLinkProgram(self.handle)
  
@@ -70,7 +95,7 @@ class Shader:
         # retrieve the link status
         glGetProgramiv(self.handle, GL_LINK_STATUS, byref(temp))
  
-        # if linking failed, print the log
+        # if linking failed, raise with the log
         if not temp:
             #   retrieve the log length
             glGetProgramiv(self.handle, GL_INFO_LOG_LENGTH, byref(temp))
@@ -78,11 +103,67 @@ class Shader:
             buffer = create_string_buffer(temp.value)
             # retrieve the log text
             glGetProgramInfoLog(self.handle, temp, None, buffer)
-            # print the log to the console
-            print(buffer.value)
-        else:
-            # all is well, so we are linked
+            glDeleteProgram(self.handle)
+            raise ShaderError(buffer.value.decode("UTF-8", "replace"))
+ 
+        # all is well, so we are linked
+        self.linked = True
+        self.findUniforms()
+ 
+    # load a program binary from getBinary()
+    # leaves linked False if the driver rejects it (e.g. after a driver update)
+    def loadBinary(self, format, data):
+        try:
+            glProgramBinary(self.handle, format, data, len(data))
+        except GLException:
+            # unknown format, pyglet raises when debug_gl is on
+            return
+ 
+        temp = c_int(0)
+        glGetProgramiv(self.handle, GL_LINK_STATUS, byref(temp))
+        if temp:
             self.linked = True
+            self.fromBinary = True
+            self.findUniforms()
+ 
+    # return the linked program as a (format, bytes) tuple
+    def getBinary(self):
+        temp = c_int(0)
+        glGetProgramiv(self.handle, GL_PROGRAM_BINARY_LENGTH, byref(temp))
+        buffer = create_string_buffer(temp.value)
+        format = GLenum(0)
+        glGetProgramBinary(self.handle, temp, None, byref(format), buffer)
+        return format.value, buffer.raw
+ 
+    # store the location of every active uniform, so setting a uniform
+    # does not have to ask the driver each frame
+    def findUniforms(self):
+        count = c_int(0)
+        glGetProgramiv(self.handle, GL_ACTIVE_UNIFORMS, byref(count))
+        length = c_int(0)
+        glGetProgramiv(self.handle, GL_ACTIVE_UNIFORM_MAX_LENGTH, byref(length))
+ 
+        buffer = create_string_buffer(max(length.value, 1))
+        size = c_int(0)
+        type = GLenum(0)
+        for i in range(count.value):
+            glGetActiveUniform(self.handle, i, len(buffer), None, byref(size), byref(type), buffer)
+            name = buffer.value
+            location = glGetUniformLocation(self.handle, name)
+            self.locations[name] = location
+            # arrays are reported as "name[0]", but set as "name"
+            if name.endswith(b'[0]'):
+                self.locations[name[:-3]] = location
+ 
+    # location of the named uniform, -1 if the program does not use it
+    def location(self, name):
+        try:
+            return self.locations[name]
+        except KeyError:
+            # not active, e.g. optimized away by the compiler
+            # remember that as well, setting it is a no-op
+            location = self.locations[name] = glGetUniformLocation(self.handle, name)
+            return location
  
     def bind(self):
         # bind the program
@@ -104,7 +185,7 @@ class Shader:
                 3 : glUniform3f,
                 4 : glUniform4f
                 # retrieve the uniform location, and set
-            }[len(vals)](glGetUniformLocation(self.handle, name), *vals)
+            }[len(vals)](self.location(name), *vals)
  
     # upload an integer uniform
     # this program must be currently bound
@@ -117,13 +198,13 @@ class Shader:
                 3 : glUniform3i,
                 4 : glUniform4i
                 # retrieve the uniform location, and set
-            }[len(vals)](glGetUniformLocation(self.handle, name), *vals)
+            }[len(vals)](self.location(name), *vals)
  
     # upload a uniform matrix
     # works with matrices stored as lists,
     # as well as euclid matrices
     def uniform_matrixf(self, name, mat):
         # obtian the uniform location
-        loc = glGetUniformLocation(self.Handle, name)
+        loc = self.location(name)
         # uplaod the 4x4 floating point matrix
         glUniformMatrix4fv(loc, 1, False, (c_float * 16)(*mat))
\ No newline at end of file
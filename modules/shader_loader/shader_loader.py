@@ -6,7 +6,12 @@ from modules.shader.shader import Shader
 
 class ShaderLoader:
     # Return vert+frag shader compiled from files.
-    def __init__(self, vert_path, frag_path):
+    # With a ShaderRegistry, programs are shared and cached on disk.
+    def __init__(self, vert_path, frag_path, registry=None):
+        if (registry is not None):
+            self.shader = registry.load(vert_path, frag_path)
+            return
+
         # Load shaders from file.
         vert_str = self.readShader(vert_path)
         frag_str = self.readShader(frag_path)
@@ -24,4 +29,4 @@ class ShaderLoader:
 
     # Compile shaders.
     def makeShader(self, vertex_str, frag_str):
-        return Shader([vertex_str], [frag_str])
\ No newline at end of file
+        return Shader([vertex_str], [frag_str])
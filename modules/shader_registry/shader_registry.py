@@ -0,0 +1,100 @@
+# Version:	1.0
+# Author:	Vincent Diener - diener@teco.edu
+
+import hashlib
+import os
+import struct
+
+from pyglet.gl import *
+from ctypes import *
+
+from modules.cache_file.cache_file import writeCacheFile
+from modules.shader.shader import Shader, ShaderError
+
+
+# Compiles and links every shader program once and keeps it by its source
+# files. If cache_dir is set and the driver supports program binaries
+# (OpenGL 4.1 or GL_ARB_get_program_binary), linked programs are stored there,
+# keyed by a hash of the sources and the driver. Later starts load the binary
+# instead of compiling the sources.
+class ShaderRegistry:
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir
+        self.programs = {}
+
+        # Programs loaded from the cache and compiled from source.
+        self.loaded = 0
+        self.compiled = 0
+
+        formats = GLint(0)
+        if (gl_info.have_version(4, 1) or gl_info.have_extension("GL_ARB_get_program_binary")):
+            glGetIntegerv(GL_NUM_PROGRAM_BINARY_FORMATS, byref(formats))
+        self.use_binaries = cache_dir is not None and formats.value > 0
+
+    # Return the program linked from the given vertex and fragment shader files.
+    # Raises ShaderError with the file names and the driver log if it fails.
+    def load(self, vert_path, frag_path):
+        program = self.programs.get((vert_path, frag_path))
+        if (program is not None):
+            return program
+
+        vert_str = self.readShader(vert_path)
+        frag_str = self.readShader(frag_path)
+        path = self.binaryPath(vert_str, frag_str)
+
+        try:
+            program = Shader([vert_str], [frag_str], binary=self.readBinary(path), retrievable=self.use_binaries)
+        except ShaderError as e:
+            raise ShaderError(vert_path + ", " + frag_path + ":\n" + str(e)) from None
+
+        if (program.fromBinary):
+            self.loaded += 1
+        else:
+            self.compiled += 1
+            self.writeBinary(path, program)
+
+        self.programs[(vert_path, frag_path)] = program
+        return program
+
+    # Read file and return contents as bytes.
+    def readShader(self, path):
+        with open(path, "rb") as shader_f:
+            return shader_f.read()
+
+    # Path of the cached binary for the given sources, None if not cached.
+    # Binaries only work with the driver that created them, so the driver
+    # is part of the key.
+    def binaryPath(self, vert_str, frag_str):
+        if (not self.use_binaries):
+            return None
+
+        key = hashlib.sha256()
+        for part in (gl_info.get_vendor(), gl_info.get_renderer(), gl_info.get_version()):
+            key.update(part.encode("UTF-8") + b"\0")
+        key.update(vert_str + b"\0" + frag_str)
+        return os.path.join(self.cache_dir, key.hexdigest() + ".bin")
+
+    # Return the (format, bytes) tuple stored at path, None if there is none.
+    def readBinary(self, path):
+        if (path is None or not os.path.exists(path)):
+            return None
+
+        with open(path, "rb") as binary_f:
+            data = binary_f.read()
+        if (len(data) < 4):
+            return None
+        return struct.unpack("<I", data[:4])[0], data[4:]
+
+    # Store the linked program at path: the binary format, then the binary
+    # (see writeCacheFile()).
+    def writeBinary(self, path, program):
+        if (path is None):
+            return
+
+        try:
+            format, data = program.getBinary()
+        except GLException:
+            return
+
+        if (data):
+            writeCacheFile(path, lambda binary_f: binary_f.write(struct.pack("<I", format) + data))
@@ -0,0 +1,224 @@
+# Version:	1.0
+# Author:	Vincent Diener - diener@teco.edu
+
+import asyncio
+import time as t
+import numpy
+
+from modules.frame_codec.frame_codec import FrameCodec, maxPacket
+from modules.frame_format.frame_format import frameFormat, COLOR_RED
+from modules.transport.transport import MAX_DATAGRAM
+
+# Frames that may wait in the send buffer of a connection. If more are
+# waiting, the emulator does not keep up and new frames are dropped.
+HIGH_WATER_FRAMES = 8
+
+# Patterns the simulator can send.
+PATTERNS = ["random", "noise", "blink", "gradient", "scroll"]
+
+
+# Returns a function that creates frame number n (size bytes) of a pattern.
+# seed makes the random patterns differ between devices.
+def createPattern(name, seed=0, size=576):
+    rng = numpy.random.default_rng(seed)
+    ramp = (numpy.arange(size) % 24 * 255 // 23).astype(numpy.uint8)
+
+    if (name == "random"):
+        # Binary on/off, like schedule_randomize in the emulator.
+        return lambda n: (rng.integers(0, 2, size, dtype=numpy.uint8) * 255).tobytes()
+    if (name == "noise"):
+        return lambda n: rng.integers(0, 256, size, dtype=numpy.uint8).tobytes()
+    if (name == "blink"):
+        return lambda n: bytes([255 if n % 2 == 0 else 0]) * size
+    if (name == "gradient"):
+        return lambda n: ramp.tobytes()
+    if (name == "scroll"):
+        return lambda n: numpy.roll(ramp, n).tobytes()
+
+    raise ValueError("Unknown pattern: " + str(name))
+
+
+# Returns the p-th percentile (0 to 100) of a list of values.
+def percentile(values, p):
+    if (not values):
+        return 0.0
+    return float(numpy.percentile(values, p))
+
+
+# One simulated device: does the real handshake and streams frames at a
+# fixed rate over TCP or a Unix domain socket.
+class DeviceSimulator:
+    def __init__(self, index, pattern, fps, version=1, xSize=24, ySize=24, colorMode=COLOR_RED):
+        self.index = index
+        self.fps = fps
+        self.version = version
+
+        frame_size = frameFormat(xSize, ySize, colorMode).frame_size
+        self.pattern = createPattern(pattern, index, frame_size)
+        self.codec = FrameCodec(frame_size) if version >= 2 else None
+        self.frame_size = frame_size
+
+        name = ("sim-" + str(index)).encode("UTF-8")
+        self.handshake = bytes([version, xSize, ySize, colorMode, len(name)]) + name
+
+        # Results.
+        self.handshake_latency = None
+        self.sent = 0
+        self.dropped = 0
+        self.failed = 0
+        self.bytes_sent = 0
+        self.error = None
+
+    # Encode frame n for the wire.
+    def payload(self, n):
+        frame = self.pattern(n)
+        if (self.codec is not None):
+            return self.codec.encode(frame)
+        return frame
+
+    # Length of the response to the handshake.
+    def responseSize(self):
+        return 3 if self.version >= 2 else 2
+
+    # Connect with open_connection (a coroutine returning reader and writer)
+    # and stream frames until time_end (time.perf_counter()).
+    async def runStream(self, open_connection, time_end):
+        try:
+            time_connect = t.perf_counter()
+            reader, writer = await open_connection()
+
+            writer.write(self.handshake)
+            await reader.readexactly(self.responseSize())
+            self.handshake_latency = t.perf_counter() - time_connect
+
+            high_water = HIGH_WATER_FRAMES * self.frame_size
+            n = 0
+            time_next = t.perf_counter()
+
+            while (t.perf_counter() < time_end):
+                # Drop the frame if the emulator does not keep up.
+                if (writer.transport.get_write_buffer_size() > high_water):
+                    self.dropped += 1
+                else:
+                    data = self.payload(n)
+                    writer.write(data)
+                    self.sent += 1
+                    self.bytes_sent += len(data)
+
+                n += 1
+                time_next += 1.0 / self.fps
+                await asyncio.sleep(max(time_next - t.perf_counter(), 0.0))
+
+            writer.close()
+        except (OSError, asyncio.IncompleteReadError) as e:
+            self.error = e
+
+    # Same over UDP: one datagram per packet.
+    async def runDatagram(self, host, port, time_end):
+        loop = asyncio.get_running_loop()
+        response = loop.create_future()
+        device = self
+
+        # Resolves the future with the first datagram (the response).
+        # asyncio reports failed sends (e.g. EMSGSIZE) here, not as exceptions.
+        class ResponseProtocol(asyncio.DatagramProtocol):
+            def datagram_received(self, data, addr):
+                if (not response.done()):
+                    response.set_result(data)
+
+            def error_received(self, exc):
+                device.failed += 1
+
+        try:
+            time_connect = t.perf_counter()
+            transport, protocol = await loop.create_datagram_endpoint(ResponseProtocol, remote_addr=(host, port))
+
+            transport.sendto(self.handshake)
+            if ((await asyncio.wait_for(response, 5.0))[:1] != b"\0"):
+                # The emulator rejected the handshake (see BTHelper.onReject).
+                raise ConnectionRefusedError("Handshake rejected by the emulator.")
+            self.handshake_latency = t.perf_counter() - time_connect
+
+            n = 0
+            time_next = t.perf_counter()
+
+            while (t.perf_counter() < time_end):
+                data = self.payload(n)
+                failed = self.failed
+                transport.sendto(data)
+
+                # Only count the datagram if sending it did not fail right away.
+                if (self.failed == failed):
+                    self.sent += 1
+                    self.bytes_sent += len(data)
+
+                n += 1
+                time_next += 1.0 / self.fps
+                await asyncio.sleep(max(time_next - t.perf_counter(), 0.0))
+
+            # An empty datagram ends the session.
+            transport.sendto(b"")
+            transport.close()
+        except (OSError, asyncio.TimeoutError) as e:
+            self.error = e
+
+
+# Runs many simulated devices in parallel on one event loop and collects
+# the results. transport is "tcp", "udp" or "unix".
+# Raises ValueError if the frames do not fit into a datagram (udp only).
+class LoadGenerator:
+    def __init__(self, transport, host, port, path, connections, fps, pattern, version, xSize=24, ySize=24,
+                 colorMode=COLOR_RED):
+        if (transport == "udp"):
+            packet_size = maxPacket(frameFormat(xSize, ySize, colorMode).frame_size, version)
+            if (packet_size > MAX_DATAGRAM):
+                raise ValueError("Packets of " + str(packet_size) + " bytes do not fit into a UDP datagram (max. " +
+                                 str(MAX_DATAGRAM) + " bytes).")
+
+        self.transport = transport
+        self.host = host
+        self.port = port
+        self.path = path
+        self.devices = [DeviceSimulator(i, pattern, fps, version, xSize, ySize, colorMode)
+                        for i in range(connections)]
+        self.duration = 0.0
+
+    def openConnection(self):
+        if (self.transport == "unix"):
+            return asyncio.open_unix_connection(self.path)
+        return asyncio.open_connection(self.host, self.port)
+
+    async def runAll(self, duration):
+        time_start = t.perf_counter()
+        time_end = time_start + duration
+
+        if (self.transport == "udp"):
+            tasks = [device.runDatagram(self.host, self.port, time_end) for device in self.devices]
+        else:
+            tasks = [device.runStream(self.openConnection, time_end) for device in self.devices]
+
+        await asyncio.gather(*tasks)
+        self.duration = t.perf_counter() - time_start
+
+    # Run for the given number of seconds.
+    def run(self, duration):
+        asyncio.run(self.runAll(duration))
+
+    # Summary of the run as a dictionary.
+    def results(self):
+        latencies = [d.handshake_latency for d in self.devices if d.handshake_latency is not None]
+        sent = sum(d.sent for d in self.devices)
+        duration = max(self.duration, 1e-9)
+
+        return {"connections": len(self.devices),
+                "connected": len(latencies),
+                "errors": sum(1 for d in self.devices if d.error is not None),
+                "sent": sent,
+                "dropped": sum(d.dropped for d in self.devices),
+                "failed": sum(d.failed for d in self.devices),
+                "frames_per_second": sent / duration,
+                "megabytes_per_second": sum(d.bytes_sent for d in self.devices) / duration / 1e6,
+                "handshake_p50_ms": percentile(latencies, 50) * 1000.0,
+                "handshake_p90_ms": percentile(latencies, 90) * 1000.0,
+                "handshake_p99_ms": percentile(latencies, 99) * 1000.0,
+                "handshake_max_ms": max(latencies) * 1000.0 if latencies else 0.0}
@@ -0,0 +1,88 @@
+# Version:	1.0
+# Author:	Vincent Diener - diener@teco.edu
+
+import sys
+import time as t
+
+from modules.export.export import Exporter, ledImage, EXPORT_FORMATS
+
+
+# Base class for frame sinks.
+# In headless mode, every new content of the LED matrix is passed to the
+# sinks instead of the renderer. matrix holds the LED values (uint8) in the
+# layout of BTHelper.matrix, which is the order devices send them in, and is
+# only valid during the call. frame_format is its FrameFormat (576 red values
+# without devices).
+class FrameSink:
+    def onFrame(self, seq, matrix, frame_format):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+# Calls a function with every frame.
+class CallbackSink(FrameSink):
+    def __init__(self, callback):
+        self.callback = callback
+
+    def onFrame(self, seq, matrix, frame_format):
+        self.callback(seq, matrix, frame_format)
+
+
+# Appends every frame to a file as bytes (LED values 0 to 255), e.g. 576
+# bytes for 24x24 red LEDs. Frames of different formats are not separated.
+class FileSink(FrameSink):
+    def __init__(self, path):
+        self.file = open(path, "wb")
+
+    def onFrame(self, seq, matrix, frame_format):
+        self.file.write(matrix)
+
+    def close(self):
+        self.file.close()
+
+
+# Writes one line per frame to stdout: sequence number, size (e.g. 24x24)
+# and the LED values (0 to 255) as hex. RGB values are marked with ":rgb".
+class StdoutSink(FrameSink):
+    def onFrame(self, seq, matrix, frame_format):
+        size = str(frame_format.width) + "x" + str(frame_format.height)
+        if (frame_format.channels == 3):
+            size += ":rgb"
+        sys.stdout.write(str(seq) + " " + size + " " + matrix.tobytes().hex() + "\n")
+        sys.stdout.flush()
+
+
+# Exports the LEDs as animation or video (see modules/export/export.py),
+# scale pixels per LED, shown as long as they were on the panel. Frames are
+# encoded in a separate process. Frames of other formats than the first one
+# are dropped. Frames the encoder can not keep up with are dropped too,
+# unless block is True (for input that does not run in real time).
+class ExportSink(FrameSink):
+    def __init__(self, path, fps=30, scale=8, block=False):
+        self.exporter = Exporter(path, fps, scale)
+        self.block = block
+
+    def onFrame(self, seq, matrix, frame_format):
+        self.exporter.submit(ledImage(matrix, frame_format), t.perf_counter(), self.block)
+
+    # Returns the statistics of the exporter.
+    def close(self):
+        stats = self.exporter.close()
+        sys.stderr.write("export: " + str(stats["written"]) + " frames written to " + stats["path"] + ", " +
+                         str(stats["dropped"]) + " dropped (encoder busy), " + str(stats["mismatched"]) +
+                         " dropped (other format)\n")
+        return stats
+
+
+# Create a sink from a command line argument: "stdout" or a file path.
+# Files with the extension of an export format (e.g. .apng or .gif) are
+# exported with ExportSink, others get the raw frames. block is passed on
+# to ExportSink.
+def createSink(name, fps=30, block=False):
+    if (name == "stdout"):
+        return StdoutSink()
+    if (name.lower().endswith(tuple(EXPORT_FORMATS))):
+        return ExportSink(name, fps, block=block)
+    return FileSink(name)
@@ -0,0 +1,156 @@
+# Version:	1.0
+# Author:	Vincent Diener - diener@teco.edu
+
+import hashlib
+import os
+import numpy
+import pyglet
+
+from concurrent.futures import ThreadPoolExecutor
+from pyglet.gl import *
+from ctypes import *
+
+from modules.cache_file.cache_file import writeCacheFile
+
+# Threads decoding textures at most.
+DECODE_WORKERS = 4
+
+
+# Decoded textures are stored in cache_dir as .npy files (height, width, channels),
+# keyed by a hash of the image file. On later starts they are memory mapped
+# instead of decoded. Textures are decoded in a pool of threads and uploaded
+# to OpenGL once, the first time their id is used.
+class TextureCache:
+    def __init__(self, cache_dir=None, workers=DECODE_WORKERS):
+        self.cache_dir = cache_dir
+        self.pool = ThreadPoolExecutor(workers)
+        self.textures = []
+
+        # Textures read from the cache and decoded from the image file.
+        self.hits = 0
+        self.misses = 0
+
+    # Return a texture for the given image file, with transparency if alpha is True.
+    # Decoding starts right away, unless lazy is True: then the image is only
+    # decoded when the texture is used for the first time.
+    def load(self, path, alpha, lazy=False, mipmaps=True):
+        texture = CachedTexture(self, path, alpha, mipmaps)
+        if (not lazy):
+            texture.decode()
+        self.textures.append(texture)
+        return texture
+
+    # Upload all textures that are not lazy, so the first frame does not wait for them.
+    def uploadAll(self):
+        for texture in self.textures:
+            if (texture.pixels is not None):
+                texture.upload()
+
+    # Return the pixels of the image file as uint8 array (height, width, channels).
+    # Rows are stored from the bottom, as OpenGL expects them.
+    def readPixels(self, path, alpha):
+        channels = 4 if alpha else 3
+
+        with open(path, "rb") as image_f:
+            data = image_f.read()
+
+        cache_path = None
+        if (self.cache_dir is not None):
+            key = hashlib.sha256(data).hexdigest()
+            cache_path = os.path.join(self.cache_dir, key + "-" + str(channels) + ".npy")
+
+            if (os.path.exists(cache_path)):
+                try:
+                    pixels = numpy.load(cache_path, mmap_mode="r")
+                    self.hits += 1
+                    return pixels
+                except (OSError, ValueError):
+                    # Broken cache file, decode again and replace it.
+                    pass
+
+        image = pyglet.image.load(path).get_image_data()
+        pixels = numpy.frombuffer(image.get_data("RGBA" if alpha else "RGB", image.width * channels),
+                                  dtype=numpy.uint8).reshape(image.height, image.width, channels)
+        self.misses += 1
+
+        if (cache_path is not None):
+            self.writePixels(cache_path, pixels)
+
+        return pixels
+
+    # Store decoded pixels, see writeCacheFile().
+    def writePixels(self, cache_path, pixels):
+        writeCacheFile(cache_path, lambda cache_f: numpy.save(cache_f, pixels))
+
+    # Stop the decode threads.
+    def close(self):
+        self.pool.shutdown(wait=False)
+
+
+# Texture from a TextureCache. Can be used like a pyglet texture:
+# glBindTexture(texture.target, texture.id) uploads it if needed.
+class CachedTexture:
+    target = GL_TEXTURE_2D
+
+    def __init__(self, cache, path, alpha, mipmaps):
+        self.cache = cache
+        self.path = path
+        self.alpha = alpha
+        self.mipmaps = mipmaps
+
+        # Future of the decoded pixels, None until decoding starts.
+        self.pixels = None
+        self.handle = None
+        self.width = 0
+        self.height = 0
+
+    # Start decoding in the pool of the cache.
+    def decode(self):
+        if (self.pixels is None):
+            self.pixels = self.cache.pool.submit(self.cache.readPixels, self.path, self.alpha)
+
+    # OpenGL name of the texture. Uploads the texture the first time.
+    @property
+    def id(self):
+        if (self.handle is None):
+            self.upload()
+        return self.handle.value
+
+    # Upload the pixels once, waiting for decoding to finish if needed.
+    def upload(self):
+        if (self.handle is not None):
+            return
+
+        self.decode()
+        # Raises if the image could not be decoded.
+        pixels = numpy.ascontiguousarray(self.pixels.result())
+        self.height, self.width = pixels.shape[:2]
+        pixel_format = GL_RGBA if self.alpha else GL_RGB
+
+        # Uploads may happen in the middle of drawing (e.g. from a RenderList),
+        # so the texture bound to the active unit is restored afterwards.
+        previous = GLint()
+        glGetIntegerv(GL_TEXTURE_BINDING_2D, byref(previous))
+
+        self.handle = GLuint()
+        glGenTextures(1, byref(self.handle))
+        glBindTexture(GL_TEXTURE_2D, self.handle)
+
+        if (self.mipmaps):
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR_MIPMAP_LINEAR)
+        else:
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+
+        # Rows of RGB textures are not padded.
+        glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+        glTexImage2D(GL_TEXTURE_2D, 0, pixel_format, self.width, self.height, 0, pixel_format, GL_UNSIGNED_BYTE,
+                     pixels.ctypes.data)
+
+        if (self.mipmaps):
+            glGenerateMipmap(GL_TEXTURE_2D)
+
+        glBindTexture(GL_TEXTURE_2D, previous.value)
+
+        # The pixels are on the GPU now.
+        self.pixels = None
@@ -0,0 +1,407 @@
+# Version:	1.0
+# Author:	Vincent Diener - diener@teco.edu
+
+import asyncio
+import os
+import time as t
+
+from modules.frame_codec.frame_codec import FrameCodec, PACKET_HEADER, maxPacket, protocolVersion
+from modules.frame_decoder.frame_decoder import createDecoder, ProtocolError
+from modules.frame_format.frame_format import formatFromHandshake
+from modules.recorder.recorder import SessionRecording
+
+# PyBluez is only needed for the RFCOMM transport.
+# The network transports work without it.
+try:
+    import bluetooth
+except ImportError:
+    bluetooth = None
+
+# Seconds of silence after which a UDP device is considered disconnected.
+UDP_TIMEOUT = 5.0
+
+# Largest UDP payload over IPv4 (65535 minus IP and UDP headers).
+MAX_DATAGRAM = 65507
+
+
+# Handshake packet sent by a device after connecting.
+# More info: see http://www.teco.kit.edu/cm/dev/
+class Handshake:
+    def __init__(self, version, xSize, ySize, colorMode, name):
+        self.version = version
+        self.xSize = xSize
+        self.ySize = ySize
+        self.colorMode = colorMode
+        self.name = name
+
+    # Parse a complete handshake packet (5 header bytes followed by the name).
+    # Returns None if the packet is malformed.
+    @staticmethod
+    def fromBytes(data):
+        if (len(data) < 5 or len(data) < 5 + data[4]):
+            return None
+
+        return Handshake(data[0], data[1], data[2], data[3], bytes(data[5:5 + data[4]]))
+
+    # The handshake packet as sent by the device.
+    def toBytes(self):
+        return bytes([self.version, self.xSize, self.ySize, self.colorMode, len(self.name)]) + self.name
+
+
+# Base class for all transports.
+# A transport accepts devices, reads the handshake and frames and passes them
+# on to its handler (usually the BTHelper). The handler has to provide
+# onListen(description), onConnect(address), onHandshake(session, handshake),
+# onFrame(session, data) and onDisconnect(session).
+# onConnect returns the session object that is passed to the other calls for
+# that device. onHandshake returns the response bytes that are sent back.
+# Transports that can not carry the frames a device asks for call
+# onReject(address, handshake, reason) instead of onConnect and send back
+# the response it returns.
+class Transport:
+    def __init__(self, handler):
+        self.handler = handler
+
+    # This gets started as a thread. Blocks forever.
+    def serve(self):
+        raise NotImplementedError
+
+
+# The original Bluetooth transport: blocking RFCOMM socket, one device at a time.
+class RFCOMMTransport(Transport):
+    def __init__(self, handler, port=16):
+        Transport.__init__(self, handler)
+        self.port = port
+
+    def serve(self):
+        if (bluetooth is None):
+            raise RuntimeError("The RFCOMM transport needs PyBluez (module 'bluetooth').")
+
+        while (True):
+            # Set up server socket and start listening.
+            server_sock = bluetooth.BluetoothSocket(bluetooth.RFCOMM)
+            server_sock.bind(("", self.port))
+            server_sock.listen(1)
+
+            # Print Bluetooth address and RFCOMM port to window title.
+            addr = str(server_sock.getsockname()[0])
+            port = str(server_sock.getsockname()[1])
+            self.handler.onListen(addr + " Port: " + port)
+
+            # Connection established.
+            client_sock, address = server_sock.accept()
+            session = self.handler.onConnect(address)
+
+            try:
+                self.serveClient(client_sock, session)
+            except (IOError, OSError, ProtocolError):
+                # Broken connection. Go back to listening.
+                pass
+
+            # Close connection.
+            client_sock.close()
+            server_sock.close()
+            self.handler.onDisconnect(session)
+
+    # Read handshake and frames until the device disconnects.
+    def serveClient(self, client_sock, session):
+        # Receive handshake packet.
+        header = self.recvExactly(client_sock, 5)
+        if (header is None):
+            return
+
+        name = self.recvExactly(client_sock, header[4])
+        if (name is None):
+            return
+
+        handshake = Handshake.fromBytes(header + name)
+        client_sock.send(self.handler.onHandshake(session, handshake))
+
+        # Frames are reassembled straight into the buffers of the decoder.
+        decoder = createDecoder(handshake)
+
+        # Loop while connection is open.
+        while (True):
+            frame = decoder.recvFrame(client_sock)
+            if (frame is None):
+                return
+
+            self.handler.onFrame(session, frame)
+
+    # Receive exactly the given number of bytes.
+    # Returns None if the connection was closed before that.
+    def recvExactly(self, sock, size):
+        data = b""
+        while (len(data) < size):
+            chunk = sock.recv(size - len(data))
+            if (not chunk):
+                return None
+            data += chunk
+        return data
+
+
+# Base class for transports running on an asyncio event loop.
+# serve() creates a private event loop in the calling thread. All devices
+# are served concurrently on that one loop, there is no thread per device.
+class AsyncTransport(Transport):
+    def __init__(self, handler):
+        Transport.__init__(self, handler)
+        self.loop = None
+
+    def serve(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self.start())
+        self.loop.run_forever()
+
+    # Start listening. Implemented by the subclasses.
+    async def start(self):
+        raise NotImplementedError
+
+
+# asyncio protocol for one stream based device (TCP or Unix domain socket).
+# The event loop receives straight into the buffers returned by get_buffer:
+# first the handshake buffer, then the buffers of the frame decoder.
+class StreamProtocol(asyncio.BufferedProtocol):
+    def __init__(self, owner):
+        self.owner = owner
+        self.transport = None
+        self.session = None
+
+        # Handshake: 5 header bytes followed by up to 255 name bytes.
+        # handshake_size grows once the name length is known.
+        self.handshake = bytearray(5 + 255)
+        self.handshake_fill = 0
+        self.handshake_size = 5
+
+        # Created once the handshake is done.
+        self.decoder = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.session = self.owner.handler.onConnect(transport.get_extra_info('peername'))
+
+    def get_buffer(self, sizehint):
+        if (self.decoder is not None):
+            return self.decoder.writeView()
+
+        # Never read past the handshake into the first frame.
+        return memoryview(self.handshake)[self.handshake_fill:self.handshake_size]
+
+    def buffer_updated(self, nbytes):
+        # Handshake is done, this is frame data.
+        if (self.decoder is not None):
+            try:
+                frame = self.decoder.commit(nbytes)
+            except ProtocolError:
+                self.transport.close()
+                return
+
+            if (frame is not None):
+                self.owner.handler.onFrame(self.session, frame)
+            return
+
+        # Receive handshake packet.
+        self.handshake_fill += nbytes
+        if (self.handshake_size == 5 and self.handshake_fill == 5):
+            self.handshake_size += self.handshake[4]
+
+        if (self.handshake_fill < self.handshake_size):
+            return
+
+        handshake = Handshake.fromBytes(self.handshake[:self.handshake_size])
+
+        # Send back the response.
+        self.transport.write(self.owner.handler.onHandshake(self.session, handshake))
+        self.decoder = createDecoder(handshake)
+
+    def connection_lost(self, exc):
+        self.owner.handler.onDisconnect(self.session)
+
+
+# Frames over TCP. Useful for producers on the same host or in the LAN.
+class TCPTransport(AsyncTransport):
+    def __init__(self, handler, host="0.0.0.0", port=5016):
+        AsyncTransport.__init__(self, handler)
+        self.host = host
+        self.port = port
+
+    async def start(self):
+        server = await self.loop.create_server(lambda: StreamProtocol(self), self.host, self.port)
+        addr = server.sockets[0].getsockname()
+        self.handler.onListen("TCP " + str(addr[0]) + " Port: " + str(addr[1]))
+
+
+# Frames over a Unix domain socket. Lowest latency for producers on the same host.
+class UnixTransport(AsyncTransport):
+    def __init__(self, handler, path="/tmp/cm-emulator.sock"):
+        AsyncTransport.__init__(self, handler)
+        self.path = path
+
+    async def start(self):
+        # Remove stale socket file from an earlier run.
+        if (os.path.exists(self.path)):
+            os.unlink(self.path)
+
+        await self.loop.create_unix_server(lambda: StreamProtocol(self), self.path)
+        self.handler.onListen("Unix " + self.path)
+
+
+# Frames over UDP. Every datagram is one packet: the first datagram of a
+# device is its handshake, every following datagram one raw frame of the size
+# given in the handshake (protocol version 1) or one encoded frame packet
+# (version 2).
+# A frame (or version 2 packet) has to fit into one datagram, at most
+# MAX_DATAGRAM bytes: e.g. 147x147 RGB (64827 bytes) does, 148x148 RGB does
+# not. Handshakes asking for larger frames are rejected.
+# Devices are told apart by their address. An empty datagram or UDP_TIMEOUT
+# seconds of silence end the session.
+class UDPTransport(AsyncTransport):
+    def __init__(self, handler, host="0.0.0.0", port=5016):
+        AsyncTransport.__init__(self, handler)
+        self.host = host
+        self.port = port
+
+        # Session, time of the last datagram, frame size and FrameCodec
+        # (version 2 only) for each device address.
+        self.sessions = {}
+        self.last_seen = {}
+        self.frame_sizes = {}
+        self.codecs = {}
+
+    async def start(self):
+        transport, protocol = await self.loop.create_datagram_endpoint(
+            lambda: UDPProtocol(self), local_addr=(self.host, self.port))
+        addr = transport.get_extra_info('sockname')
+        self.handler.onListen("UDP " + str(addr[0]) + " Port: " + str(addr[1]))
+
+        # Look for silent devices once per second.
+        self.loop.call_later(1.0, self.expireSessions)
+
+    def datagramReceived(self, udp_transport, data, address):
+        session = self.sessions.get(address)
+
+        if (session is None):
+            # First datagram of a new device has to be the handshake.
+            handshake = Handshake.fromBytes(data)
+            if (handshake is None):
+                return
+
+            frame_size = formatFromHandshake(handshake).frame_size
+            packet_size = maxPacket(frame_size, protocolVersion(handshake))
+            if (packet_size > MAX_DATAGRAM):
+                reason = ("packets of " + str(packet_size) + " bytes do not fit into a datagram (max. " +
+                          str(MAX_DATAGRAM) + ")")
+                udp_transport.sendto(self.handler.onReject(address, handshake, reason), address)
+                return
+
+            session = self.handler.onConnect(address)
+            self.sessions[address] = session
+            self.frame_sizes[address] = frame_size
+            if (protocolVersion(handshake) >= 2):
+                self.codecs[address] = FrameCodec(self.frame_sizes[address])
+            udp_transport.sendto(self.handler.onHandshake(session, handshake), address)
+        elif (not data):
+            self.endSession(address)
+            return
+        elif (address in self.codecs):
+            # Encoded frame packet.
+            if (len(data) >= PACKET_HEADER.size):
+                encoding, length = PACKET_HEADER.unpack_from(data)
+                if (len(data) == PACKET_HEADER.size + length):
+                    frame = self.codecs[address].decode(encoding, memoryview(data)[PACKET_HEADER.size:])
+                    if (frame is not None):
+                        self.handler.onFrame(session, frame)
+        elif (len(data) == self.frame_sizes[address]):
+            self.handler.onFrame(session, data)
+
+        self.last_seen[address] = self.loop.time()
+
+    def expireSessions(self):
+        deadline = self.loop.time() - UDP_TIMEOUT
+        for address in [a for a, seen in self.last_seen.items() if seen < deadline]:
+            self.endSession(address)
+
+        self.loop.call_later(1.0, self.expireSessions)
+
+    def endSession(self, address):
+        session = self.sessions.pop(address)
+        del self.last_seen[address]
+        del self.frame_sizes[address]
+        self.codecs.pop(address, None)
+        self.handler.onDisconnect(session)
+
+
+# asyncio protocol that forwards datagrams to the UDPTransport.
+class UDPProtocol(asyncio.DatagramProtocol):
+    def __init__(self, owner):
+        self.owner = owner
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.owner.datagramReceived(self.transport, data, addr)
+
+
+# Replays a recording made by SessionRecorder as if the device was connected.
+# speed 1.0 keeps the original timing, 2.0 replays twice as fast and so on.
+# speed 0 replays as fast as possible, e.g. for benchmarks.
+class ReplayTransport(Transport):
+    def __init__(self, handler, path, speed=1.0, repeat=False):
+        Transport.__init__(self, handler)
+        self.path = path
+        self.speed = speed
+        self.repeat = repeat
+
+        # Frames per second of the last replay, measured.
+        self.replay_fps = 0.0
+
+    def serve(self):
+        recording = SessionRecording(self.path)
+        self.handler.onListen("Replay " + os.path.basename(self.path))
+
+        while (True):
+            self.replay(recording)
+            if (not self.repeat):
+                return
+
+    # Replay the recording once.
+    def replay(self, recording):
+        session = self.handler.onConnect(self.path)
+        self.handler.onHandshake(session, Handshake.fromBytes(recording.handshake_bytes))
+
+        times = recording.frames["time"]
+        data = recording.frames["data"]
+        time_start = t.perf_counter()
+
+        for i in range(len(recording)):
+            # Wait until the frame is due.
+            if (self.speed > 0):
+                delay = time_start + times[i] / self.speed - t.perf_counter()
+                if (delay > 0):
+                    t.sleep(delay)
+
+            self.handler.onFrame(session, data[i])
+
+        duration = t.perf_counter() - time_start
+        self.replay_fps = len(recording) / duration if duration > 0 else 0.0
+        self.handler.onDisconnect(session)
+
+
+# Create a transport by name ("rfcomm", "tcp", "udp", "unix" or "replay").
+# For "replay", path is the recording to replay.
+def createTransport(name, handler, host="0.0.0.0", port=None, path="/tmp/cm-emulator.sock", speed=1.0):
+    if (name == "rfcomm"):
+        return RFCOMMTransport(handler, 16 if port is None else port)
+    if (name == "tcp"):
+        return TCPTransport(handler, host, 5016 if port is None else port)
+    if (name == "udp"):
+        return UDPTransport(handler, host, 5016 if port is None else port)
+    if (name == "unix"):
+        return UnixTransport(handler, path)
+    if (name == "replay"):
+        return ReplayTransport(handler, path, speed)
+
+    raise ValueError("Unknown transport: " + str(name))
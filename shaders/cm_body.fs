@@ -4,7 +4,7 @@
 #version 110
 
 uniform sampler2D tex0;
-uniform int time;
+uniform float time;
 uniform bool do_light;
 
 varying vec3 N;
@@ -12,7 +12,7 @@ varying vec3 V;
 
 void main() {
 	// Calculate fade factor from time for 50 frame fade in.
-	float fade = max(50.0 - float(time), 0.0) / 50.0;
+	float fade = max(50.0 - time, 0.0) / 50.0;
    
 	// Get texture coordinate.
 	vec2 c = gl_TexCoord[0].xy;
@@ -0,0 +1,42 @@
+// Version:	1.0
+// Author:	Vincent Diener - diener@teco.edu
+
+#version 330 core
+
+// OpenGL 3.3 core profile version of shaders/cm_body.fs.
+uniform sampler2D tex0;
+uniform float time;
+uniform bool do_light;
+
+// Light position (in eye space), ambient and diffuse color, see modules/scene/scene.py.
+uniform vec3 light_position;
+uniform vec3 light_ambient;
+uniform vec3 light_diffuse;
+
+in vec3 N;
+in vec3 V;
+in vec2 C;
+
+out vec4 frag_color;
+
+void main() {
+	// Calculate fade factor from time for 50 frame fade in.
+	float fade = max(50.0 - time, 0.0) / 50.0;
+
+	// Get current pixel.
+	vec4 current = texture(tex0, C);
+
+	// Add lighting?
+	if (do_light) {
+		vec3 L = normalize(light_position - V);
+
+		// Calculate diffuse term.
+		vec3 diff = clamp(light_diffuse * max(dot(normalize(N), L), 0.0), 0.0, 1.0);
+		vec3 out_col = clamp(current.rgb * (light_ambient + diff), 0.0, 1.0);
+
+		frag_color = vec4(out_col, current.a * fade);
+	} else {
+		// If not, just use texture color.
+		frag_color = vec4(current.rgb, current.a * fade);
+	}
+}
@@ -0,0 +1,29 @@
+// Version:	1.0
+// Author:	Vincent Diener - diener@teco.edu
+
+#version 330 core
+
+// OpenGL 3.3 core profile version of shaders/cm_body.vs.
+// The matrices come from modules/camera/camera.py.
+uniform mat4 modelview_projection;
+uniform mat4 modelview;
+
+layout(location = 0) in vec3 position;
+layout(location = 1) in vec3 normal;
+layout(location = 2) in vec2 texcoord;
+
+out vec3 N;
+out vec3 V;
+out vec2 C;
+
+void main() {
+	// Transform the vertex position.
+	gl_Position = modelview_projection * vec4(position, 1.0);
+
+	// Pass transformed vertex position and normal to fragment shader.
+	V = vec3(modelview * vec4(position, 1.0));
+	N = normalize(transpose(inverse(mat3(modelview))) * normal);
+
+	// Pass through the texture coordinate.
+	C = texcoord;
+}
@@ -0,0 +1,87 @@
+// Version:	1.0
+// Author:	Vincent Diener - diener@teco.edu
+
+#version 330 core
+
+// OpenGL 3.3 core profile version of shaders/ground.fs.
+
+// Detailed ground texture.
+uniform sampler2D tex0;
+
+// Red ring texture, only its alpha value is used.
+uniform sampler2D tex1;
+
+uniform float time;
+uniform bool do_light;
+
+// Light position (in eye space), ambient and diffuse color, see modules/scene/scene.py.
+uniform vec3 light_position;
+uniform vec3 light_ambient;
+uniform vec3 light_diffuse;
+
+// Number of detailed ground layers, the distance between two of them
+// and the edge length of the ground quad. The quad is the top layer.
+uniform float layers;
+uniform float layer_height;
+uniform float ground_size;
+
+in vec3 N;
+in vec3 V;
+in vec3 P;
+in vec3 E;
+in vec2 C;
+
+out vec4 frag_color;
+
+// Texture coordinate where the view ray hits the plane depth below the quad.
+// The texture u runs along z, v against x.
+vec2 below(vec2 c, float depth) {
+	vec3 ray = P - E;
+	vec3 offset = ray * (depth / max(-ray.y, 0.0001));
+	return c + vec2(offset.z, -offset.x) / ground_size;
+}
+
+// Is the texture coordinate on the quad?
+float inside(vec2 c) {
+	return (c.x >= 0.0 && c.x <= 1.0 && c.y >= 0.0 && c.y <= 1.0) ? 1.0 : 0.0;
+}
+
+void main() {
+	// Get texture coordinate.
+	vec2 c = C;
+
+	// Light like the Connection Machine. The layers are close enough to share it.
+	vec3 light = vec3(1.0);
+	if (do_light) {
+		vec3 L = normalize(light_position - V);
+		vec3 diff = clamp(light_diffuse * max(dot(normalize(N), L), 0.0), 0.0, 1.0);
+		light = light_ambient + diff;
+	}
+
+	// Red flash effect, one layer below the lowest ground layer.
+	vec2 r = below(c, layers * layer_height);
+	vec2 from_middle = vec2(0.5, 0.5) - r;
+	float red = 0.5 - ((length(from_middle)));
+	red += pow(1.0 - distance(normalize(from_middle) * sin(mod(time, 140.0) / -30.0), from_middle), 20.0);
+
+	// Blend all layers from the bottom up, like drawing them one after another.
+	// color is premultiplied with alpha.
+	float alpha = texture(tex1, r).a * inside(r);
+	vec3 color = vec3(clamp(red, 0.0, 1.0), 0.0, 0.0) * alpha;
+
+	for (int i = 0; i < 64; i++) {
+		if (float(i) >= layers) {
+			break;
+		}
+
+		vec2 l = below(c, (layers - 1.0 - float(i)) * layer_height);
+		vec4 current = texture(tex0, l);
+		float a = current.a * inside(l);
+
+		color = clamp(current.rgb * light, 0.0, 1.0) * a + color * (1.0 - a);
+		alpha = a + alpha * (1.0 - a);
+	}
+
+	// Write fragment. Blending multiplies with alpha again.
+	frag_color = vec4(color / max(alpha, 0.0001), alpha);
+}
@@ -0,0 +1,35 @@
+// Version:	1.0
+// Author:	Vincent Diener - diener@teco.edu
+
+#version 330 core
+
+// OpenGL 3.3 core profile version of shaders/ground.vs.
+uniform mat4 modelview_projection;
+uniform mat4 modelview;
+
+layout(location = 0) in vec3 position;
+layout(location = 1) in vec3 normal;
+layout(location = 2) in vec2 texcoord;
+
+out vec3 N;
+out vec3 V;
+out vec2 C;
+
+// Vertex and camera position in object space, to find the layers below.
+out vec3 P;
+out vec3 E;
+
+void main() {
+    // Transform the vertex position.
+    gl_Position = modelview_projection * vec4(position, 1.0);
+
+    // Pass transformed vertex position and normal to fragment shader.
+    V = vec3(modelview * vec4(position, 1.0));
+    N = normalize(transpose(inverse(mat3(modelview))) * normal);
+
+    P = position;
+    E = vec3(inverse(modelview) * vec4(0.0, 0.0, 0.0, 1.0));
+
+    // Pass through the texture coordinate.
+    C = texcoord;
+}
@@ -0,0 +1,21 @@
+// Version:	1.0
+// Author:	Vincent Diener - diener@teco.edu
+
+#version 330 core
+
+// OpenGL 3.3 core profile version of shaders/led.vs.
+uniform mat4 modelview_projection;
+
+layout(location = 0) in vec3 position;
+layout(location = 2) in vec2 texcoord;
+
+out vec2 C;
+
+void main() {
+    // Transform the vertex position.
+    gl_Position = modelview_projection * vec4(position, 1.0);
+
+    // Pass through the texture coordinate.
+    // It goes from (0, 0) at the bottom left LED to (1, 1) at the top right one.
+    C = texcoord;
+}
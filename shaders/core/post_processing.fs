@@ -0,0 +1,110 @@
+// Version:	1.0
+// Author:	Vincent Diener - diener@teco.edu
+
+#version 330 core
+
+// OpenGL 3.3 core profile version of shaders/post_processing.fs.
+
+uniform sampler2D tex0;
+
+// Time (in frames at 60 frames per second, see modules/scene/scene.py).
+uniform float time;
+
+// Width and height of input texture.
+// In this case, it's the width and height of the framebuffer.
+uniform int tex_width;
+uniform int tex_height;
+
+// Part of the texture that holds the image. The framebuffer texture has
+// exactly the size of the image, so both are 1.0. A texture that is larger
+// than the image (e.g. rounded up to a power of two) needs smaller ratios.
+uniform float ratio_x;
+uniform float ratio_y;
+
+in vec2 C;
+
+out vec4 frag_color;
+
+vec2 rOffset = vec2(0.005, 0.005);
+vec2 gOffset = vec2(0.002, 0.002);
+vec2 bOffset = vec2(0.003, 0.003);
+
+void pp_funct_0(vec2 uv) {
+	// Calculate inverse of color. Set alpha to 1.
+    vec4 color = texture(tex0, uv);		
+    frag_color = vec4(vec3(1.0) - color.rgb, 1.0);
+} 
+
+void pp_funct_1(vec2 uv) {
+	// Alter x coordinate using the y coordinate and time to create wave effect.
+	uv.x += sin(uv.y * 4.0*2.0*3.14159 + time / 10.0) / 85.0;
+	uv.y += sin(uv.x * 4.0*2.0*3.14159 + time / 10.0) / 85.0;
+    vec4 color = texture(tex0, uv);
+	
+	// Uncomment for a really trippy color effect.
+	//color.r += sin(((time + 12.0) + uv.x * 10.9 * uv.y * 91.9) / 40.0) / 4.0;	
+	//color.g += cos(((time + 55.0) + uv.x * 24.9 * uv.y * 10.9) / 32.0) / 3.0;	
+	//color.b += cos(((time + 23.0) + uv.x * 77.9 * uv.y * 13.9) / 88.0) / 2.0;	
+    frag_color = vec4(color.rgb, 1.0);
+} 
+
+// Chromatic aberration
+void pp_funct_2(vec2 uv) {	
+	float timeMult = (sin(time / 30.0) + 1.0) / 2.0;
+
+	vec2 toMiddle = uv - vec2(0.5 * ratio_x, 0.5 * ratio_y);
+	float ml = pow(length(toMiddle), timeMult);
+	vec2 uv2 = toMiddle * pow(1.005, timeMult * 4.0) + vec2(0.5 * ratio_x, 0.5 * ratio_y);
+	vec2 uv3 = toMiddle * pow(0.995, timeMult * 2.0) + vec2(0.5 * ratio_x, 0.5 * ratio_y);
+	vec2 uv4 = toMiddle * pow(1.006, timeMult * 3.0) + vec2(0.5 * ratio_x, 0.5 * ratio_y);
+
+    vec4 rValue = texture(tex0, uv2);  
+    vec4 gValue = texture(tex0, uv3);
+    vec4 bValue = texture(tex0, uv4);  
+
+	vec2 a = vec2(0.005, 0.01);
+	vec2 b = vec2(0.00, 0.00);
+	vec2 c = vec2(-0.005, 0.005);
+	vec2 d = vec2(0.005, -0.005);
+	
+	rValue += texture(tex0, uv2 + uv2 * ml * a);
+	rValue += texture(tex0, uv2 + uv2 * ml * b);
+	rValue += texture(tex0, uv2 + uv2 * ml * c);
+	rValue += texture(tex0, uv2 + uv2 * ml * d);
+	
+	gValue += texture(tex0, uv3 + uv3 * ml * a);
+	gValue += texture(tex0, uv3 + uv3 * ml * b);
+	gValue += texture(tex0, uv3 + uv3 * ml * c);
+	gValue += texture(tex0, uv3 + uv3 * ml * d);
+	
+	bValue += texture(tex0, uv4 + uv4 * ml * a);
+	bValue += texture(tex0, uv4 + uv4 * ml * b);
+	bValue += texture(tex0, uv4 + uv4 * ml * c);
+	bValue += texture(tex0, uv4 + uv4 * ml * d);
+	
+	frag_color = vec4(rValue.r / 5.0, gValue.g / 5.0, bValue.b / 5.0, 1.0);
+
+} 
+
+// Zoom
+void pp_funct_3(vec2 uv) {	
+	vec2 distToMiddle = (uv - vec2(0.5 * ratio_x, 0.5 * ratio_y));
+	
+	float timeMult = (sin(time / 49.0) + 1.0) * 45.4;
+	distToMiddle *= timeMult;
+	//float a = (distToMiddle) * 10.6;
+    vec4 rValue = texture(tex0, uv - rOffset + distToMiddle);  
+    vec4 gValue = texture(tex0, uv - gOffset + distToMiddle);
+    vec4 bValue = texture(tex0, uv - bOffset + distToMiddle);  
+
+
+	frag_color = vec4(rValue.r, gValue.g, bValue.b, 1.0);
+
+} 
+
+void main()
+{
+	// Transform coordinates.
+	vec2 uv = C * vec2(ratio_x, ratio_y);
+	pp_funct_1(uv);
+}
\ No newline at end of file
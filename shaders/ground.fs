@@ -3,21 +3,76 @@
 
 #version 110
 
+// Detailed ground texture.
 uniform sampler2D tex0;
-uniform int time;
+
+// Red ring texture, only its alpha value is used.
+uniform sampler2D tex1;
+
+uniform float time;
+uniform bool do_light;
+
+// Number of detailed ground layers, the distance between two of them
+// and the edge length of the ground quad. The quad is the top layer.
+uniform float layers;
+uniform float layer_height;
+uniform float ground_size;
+
+varying vec3 N;
+varying vec3 V;
+varying vec3 P;
+varying vec3 E;
+
+// Texture coordinate where the view ray hits the plane depth below the quad.
+// The texture u runs along z, v against x.
+vec2 below(vec2 c, float depth) {
+	vec3 ray = P - E;
+	vec3 offset = ray * (depth / max(-ray.y, 0.0001));
+	return c + vec2(offset.z, -offset.x) / ground_size;
+}
+
+// Is the texture coordinate on the quad?
+float inside(vec2 c) {
+	return (c.x >= 0.0 && c.x <= 1.0 && c.y >= 0.0 && c.y <= 1.0) ? 1.0 : 0.0;
+}
 
 void main() {
 	// Get texture coordinate.
 	vec2 c = gl_TexCoord[0].xy;
- 
-	// Only get alpha value.
-	vec4 color = vec4(0.0, 0.0, 0.0, texture2D(tex0, c).a);
-
-	// Red flash effect.
-	vec2 from_middle = vec2(0.5, 0.5) - c;
-	color.r =  0.5 - ((length(from_middle)));
-	color.r += pow(1.0 - distance(normalize(from_middle) * sin(mod(float(time), 140.0) / -30.0), from_middle), 20.0);
-   
-	// Write fragment.
-	gl_FragColor = color;
-}
\ No newline at end of file
+
+	// Light like the Connection Machine. The layers are close enough to share it.
+	vec4 light = vec4(1.0);
+	if (do_light) {
+		vec3 L = normalize(gl_LightSource[0].position.xyz - V);
+		vec4 amb = gl_LightSource[0].ambient;
+		vec4 diff = clamp(gl_LightSource[0].diffuse * max(dot(normalize(N), L), 0.0), 0.0, 1.0);
+		light = amb + diff;
+	}
+
+	// Red flash effect, one layer below the lowest ground layer.
+	vec2 r = below(c, layers * layer_height);
+	vec2 from_middle = vec2(0.5, 0.5) - r;
+	float red = 0.5 - ((length(from_middle)));
+	red += pow(1.0 - distance(normalize(from_middle) * sin(mod(time, 140.0) / -30.0), from_middle), 20.0);
+
+	// Blend all layers from the bottom up, like drawing them one after another.
+	// color is premultiplied with alpha.
+	float alpha = texture2D(tex1, r).a * inside(r);
+	vec3 color = vec3(clamp(red, 0.0, 1.0), 0.0, 0.0) * alpha;
+
+	for (int i = 0; i < 64; i++) {
+		if (float(i) >= layers) {
+			break;
+		}
+
+		vec2 l = below(c, (layers - 1.0 - float(i)) * layer_height);
+		vec4 current = texture2D(tex0, l);
+		float a = current.a * inside(l);
+
+		color = clamp(current.rgb * light.rgb, 0.0, 1.0) * a + color * (1.0 - a);
+		alpha = a + alpha * (1.0 - a);
+	}
+
+	// Write fragment. Blending multiplies with alpha again.
+	gl_FragColor = vec4(color / max(alpha, 0.0001), alpha);
+}
@@ -2,11 +2,25 @@
 // Author:	Vincent Diener - diener@teco.edu
 
 #version 110
+
+varying vec3 N;
+varying vec3 V;
+
+// Vertex and camera position in object space, to find the layers below.
+varying vec3 P;
+varying vec3 E;
 	
 void main() {
     // Transform the vertex position.
     gl_Position = gl_ModelViewProjectionMatrix * gl_Vertex;
+
+    // Pass transformed vertex position and normal to fragment shader.
+    V = vec3(gl_ModelViewMatrix * gl_Vertex);
+    N = normalize(gl_NormalMatrix * gl_Normal);
+
+    P = gl_Vertex.xyz;
+    E = vec3(gl_ModelViewMatrixInverse * vec4(0.0, 0.0, 0.0, 1.0));
 	
     // Pass through the texture coordinate.
     gl_TexCoord[0] = gl_MultiTexCoord0;
-}
\ No newline at end of file
+}
@@ -3,25 +3,63 @@
 
 #version 110
 
+// Shape of one LED.
 uniform sampler2D tex0;
-uniform int time;
 
-// Red value.
-varying vec4 red;
+// LED values, one texel per LED. The first row is the top row of LEDs.
+uniform sampler2D data;
+
+// Number of LEDs (columns, rows).
+uniform vec2 size;
+
+// Gap between the two front cubes, in LEDs.
+uniform float gap;
+
+// Color mode: 0 red, 1 grayscale, 2 RGB.
+uniform int color_mode;
+
+// Position within the LEDs of one axis, given the position on the quad (in LEDs).
+// The second half of the LEDs comes after the gap. Returns -1.0 in the gap.
+float ledPosition(float p, float count) {
+	float first = floor(count / 2.0);
+
+	if (p < first) {
+		return p;
+	}
+
+	if (p < first + gap) {
+		return -1.0;
+	}
+
+	return p - gap;
+}
 
 void main() {
 
-	// Get texture coordinate.
-	vec2 c = gl_TexCoord[0].xy;
- 
-	// Get pixel.
-	vec4 color = texture2D(tex0, c).rgba;
-	
-	// Get red value.
-	color.r = red.r;
-	color.g = 0.0;
-	color.b = 0.0;
+	// Find the LED this fragment belongs to.
+	vec2 p = gl_TexCoord[0].xy * (size + gap);
+	vec2 led = vec2(ledPosition(p.x, size.x), ledPosition(p.y, size.y));
+
+	if (led.x < 0.0 || led.y < 0.0) {
+		discard;
+	}
+
+	vec2 cell = floor(led);
+
+	// Get pixel of the LED shape.
+	vec4 color = texture2D(tex0, led - cell).rgba;
+
+	// Get LED value. Rows are counted from the top.
+	vec3 value = texture2D(data, vec2((cell.x + 0.5) / size.x, 1.0 - (cell.y + 0.5) / size.y)).rgb;
+
+	if (color_mode == 2) {
+		color.rgb = value;
+	} else if (color_mode == 1) {
+		color.rgb = vec3(value.r);
+	} else {
+		color.rgb = vec3(value.r, 0.0, 0.0);
+	}
 
 	// Write fragment.
 	gl_FragColor = color;
-}
\ No newline at end of file
+}
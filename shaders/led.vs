@@ -3,16 +3,11 @@
 
 #version 110
 
-varying vec4 red;
-	
 void main() {
     // Transform the vertex position.
     gl_Position = gl_ModelViewProjectionMatrix * gl_Vertex;
 	
     // Pass through the texture coordinate.
+    // It goes from (0, 0) at the bottom left LED to (1, 1) at the top right one.
     gl_TexCoord[0] = gl_MultiTexCoord0;
-	gl_TexCoord[1] = gl_MultiTexCoord1;
-	
-	// Red value is passed in through gl_Color attribute.
-	red = gl_Color;
-}
\ No newline at end of file
+}
@@ -5,17 +5,17 @@
 
 uniform sampler2D tex0;
 
-// Time (passed frames).
-uniform int time;
+// Time (in frames at 60 frames per second, see modules/scene/scene.py).
+uniform float time;
 
 // Width and height of input texture.
-// In this case, it's the width and height of the color buffer.
+// In this case, it's the width and height of the framebuffer.
 uniform int tex_width;
 uniform int tex_height;
 
-// The size of the texture we get passed in might be rounded up th the
-// nearest power of two, so before sampling it we need to make sure we
-// transform the coordinates with the correct ratio. 
+// Part of the texture that holds the image. The framebuffer texture has
+// exactly the size of the image, so both are 1.0. A texture that is larger
+// than the image (e.g. rounded up to a power of two) needs smaller ratios.
 uniform float ratio_x;
 uniform float ratio_y;
 
@@ -31,20 +31,20 @@ void pp_funct_0(vec2 uv) {
 
 void pp_funct_1(vec2 uv) {
 	// Alter x coordinate using the y coordinate and time to create wave effect.
-	uv.x += sin(uv.y * 4.0*2.0*3.14159 + float(time) / 10.0) / 85.0;
-	uv.y += sin(uv.x * 4.0*2.0*3.14159 + float(time) / 10.0) / 85.0;
+	uv.x += sin(uv.y * 4.0*2.0*3.14159 + time / 10.0) / 85.0;
+	uv.y += sin(uv.x * 4.0*2.0*3.14159 + time / 10.0) / 85.0;
     vec4 color = texture2D(tex0, uv);
 	
 	// Uncomment for a really trippy color effect.
-	//color.r += sin((float(time + 12) + uv.x * 10.9 * uv.y * 91.9) / 40.0) / 4.0;	
-	//color.g += cos((float(time + 55) + uv.x * 24.9 * uv.y * 10.9) / 32.0) / 3.0;	
-	//color.b += cos((float(time + 23) + uv.x * 77.9 * uv.y * 13.9) / 88.0) / 2.0;	
+	//color.r += sin(((time + 12.0) + uv.x * 10.9 * uv.y * 91.9) / 40.0) / 4.0;	
+	//color.g += cos(((time + 55.0) + uv.x * 24.9 * uv.y * 10.9) / 32.0) / 3.0;	
+	//color.b += cos(((time + 23.0) + uv.x * 77.9 * uv.y * 13.9) / 88.0) / 2.0;	
     gl_FragColor = vec4(color.rgb, 1.0);
 } 
 
 // Chromatic aberration
 void pp_funct_2(vec2 uv) {	
-	float timeMult = (sin(float(time) / 30.0) + 1.0) / 2.0;
+	float timeMult = (sin(time / 30.0) + 1.0) / 2.0;
 
 	vec2 toMiddle = uv - vec2(0.5 * ratio_x, 0.5 * ratio_y);
 	float ml = pow(length(toMiddle), timeMult);
@@ -84,7 +84,7 @@ void pp_funct_2(vec2 uv) {
 void pp_funct_3(vec2 uv) {	
 	vec2 distToMiddle = (uv - vec2(0.5 * ratio_x, 0.5 * ratio_y));
 	
-	float timeMult = (sin(float(time) / 49.0) + 1.0) * 45.4;
+	float timeMult = (sin(time / 49.0) + 1.0) * 45.4;
 	distToMiddle *= timeMult;
 	//float a = (distToMiddle) * 10.6;
     vec4 rValue = texture2D(tex0, uv - rOffset + distToMiddle);  